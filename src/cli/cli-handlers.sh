@@ -5262,6 +5262,8 @@ _geo_check_if_feature_branch_merged() {
             doc_cmd_sub_cmd_desc 'Edit the service file.'
         doc_cmd_sub_cmd 'no-service'
             doc_cmd_sub_cmd_desc 'Runs the indicator directly (using python3).'
+        doc_cmd_sub_cmd 'headless <enable|disable|start|stop|status|log|no-service>'
+            doc_cmd_sub_cmd_desc 'Manages the background service that runs the auto-switch tasks and status checks without a display (for headless machines). Only one of it and the indicator runs at a time, so enabling one disables the other. User services only run while you are logged in; run "sudo loginctl enable-linger $USER" to start it at boot and keep it running after you log out.'
         doc_cmd_sub_cmd 'log'
             doc_cmd_sub_cmd_desc '# Show service logs.'
             doc_cmd_sub_option_title
@@ -5271,8 +5273,15 @@ _geo_check_if_feature_branch_merged() {
     doc_cmd_examples_title
     doc_cmd_example 'geo indicator enable'
     doc_cmd_example 'geo indicator disable'
+    doc_cmd_example 'geo indicator headless enable'
 }
 @geo_indicator() {
+    # The background service doesn't need a display, so it's handled before the headless check.
+    if [[ $1 == headless ]]; then
+        shift
+        _geo_indicator__headless "$@"
+        return
+    fi
     local running_in_headless_ubuntu=$(dpkg -l ubuntu-desktop | grep 'no packages found')
     if [[ -n $running_in_headless_ubuntu ]]; then
         log::Error 'Cannot use geo-cli indicator with headless versions of Ubuntu.'
@@ -5328,6 +5337,11 @@ _geo_check_if_feature_branch_merged() {
             # update-desktop-database $app_desktop_entry_dir
             # sudo chmod 777 $indicator_bin_path
 
+            # Only one of the indicator and the background service runs at a time.
+            if systemctl --user is-enabled --quiet geo-daemon.service 2>/dev/null; then
+                systemctl --user disable --now geo-daemon.service
+                log::detail 'Disabled the background service (geo-daemon.service)'
+            fi
             systemctl --user daemon-reload
             systemctl --user enable --now $geo_indicator_service_name
             systemctl --user restart $geo_indicator_service_name
@@ -5434,6 +5448,70 @@ _geo_install_apt_package_if_missing() {
         $sudo apt install -y "$pkg_name"
     fi
 }
+_geo_indicator__headless() {
+    local geo_daemon_service_name=geo-daemon.service
+    local daemon_service_path=~/.config/systemd/user/$geo_daemon_service_name
+    case "$1" in
+        enable)
+            log::status -b "Enabling background service"
+            mkdir -p ~/.config/systemd/user/
+            local src_dir=$(@geo_get GEO_CLI_SRC_DIR)
+            local geo_daemon_app_dir="$src_dir/py/core"
+            local init_script_path="$geo_daemon_app_dir/geo-daemon.sh"
+            local service_file_path="$geo_daemon_app_dir/$geo_daemon_service_name"
+            if [[ ! -f $init_script_path ]]; then
+                log::Error "Background service script not found at '$init_script_path'"
+                return 1
+            fi
+            if [[ ! -f $service_file_path ]]; then
+                log::Error "Background service file not found at:\n    $(log::make_path_relative_to_user_dir $service_file_path)"
+                return 1
+            fi
+            # Only GLib is needed (not GTK or libappindicator).
+            _geo_install_apt_package_if_missing 'python3-gi'
+            export geo_daemon_path="$init_script_path"
+            envsubst <$service_file_path >$daemon_service_path
+            # Only one of the indicator and the background service runs at a time. The indicator would otherwise be
+            # started again at the next login (or by 'geo indicator init').
+            if systemctl --user is-enabled --quiet geo-indicator.service 2>/dev/null; then
+                systemctl --user disable --now geo-indicator.service
+                log::detail 'Disabled the app indicator (geo-indicator.service)'
+            fi
+            @geo_set 'APP_INDICATOR_ENABLED' 'false'
+            systemctl --user daemon-reload
+            systemctl --user enable --now $geo_daemon_service_name
+            systemctl --user restart $geo_daemon_service_name
+            # User services are stopped when the user logs out (and aren't started at boot) unless lingering is enabled.
+            if [[ $(loginctl show-user "$USER" --property=Linger --value 2>/dev/null) != yes ]]; then
+                log::detail "The service only runs while you are logged in. To start it at boot and keep it running after you log out, run:"
+                log::detail "    sudo loginctl enable-linger $USER"
+            fi
+            ;;
+        disable)
+            systemctl --user stop --now $geo_daemon_service_name
+            systemctl --user disable --now $geo_daemon_service_name
+            log::success 'Background service disabled'
+            ;;
+        start | stop | restart | status)
+            systemctl --user $1 $geo_daemon_service_name
+            ;;
+        no-service)
+            (
+                cd "$GEO_CLI_SRC_DIR/py/core"
+                bash geo-daemon.sh
+            )
+            ;;
+        log | logs)
+            local option='-b'
+            [[ -n $2 ]] && option="$2"
+            journalctl --user -r -u $geo_daemon_service_name $option
+            ;;
+        *)
+            log::Error "Unknown argument: '$1'"
+            ;;
+    esac
+}
+
 _geo_indicator__check_dependencies() {
     ! type sudo &>/dev/null && sudo='' || sudo=sudo
     if ! type python3 &>/dev/null; then
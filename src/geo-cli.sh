@@ -322,8 +322,47 @@ function check_for_docker_group_membership() {
     fi
 }
 
+# Serves geo commands to the ui (src/py/common/api_server.py) so that cli-handlers.sh only has to be sourced once,
+# instead of every time that the ui runs a command.
+# Each request is a single line read from stdin, containing the arguments that would otherwise be passed to
+# 'geo-cli.sh --api ...'. The response is written to stdout as a header line of the form
+# '<exit code> <stdout byte count> <stderr byte count>', followed by the raw stdout and stderr of the command.
+# The server exits when stdin is closed.
+geo-cli::api_server() {
+    local request out err rc
+    local err_file="$(mktemp -t geo-cli-api-server.XXXXXXXX)"
+    trap 'rm -f "$err_file"' EXIT
+
+    while IFS= read -r request; do
+        [[ -z $request ]] && continue
+        # Run the command in a subshell so that it can't change the state of the server (e.g. by calling exit or cd).
+        # stdin is redirected so that commands can't read the requests that follow this one.
+        # The trailing 'x' preserves any new lines at the end of the output, which would otherwise be removed.
+        out="$(
+            eval "geo --api $request" </dev/null 2>"$err_file"
+            rc=$?
+            echo -n x
+            exit $rc
+        )"
+        rc=$?
+        out="${out%x}"
+        err=
+        IFS= read -r -d '' err <"$err_file"
+        : >"$err_file"
+        geo-cli::api_server_respond "$rc" "$out" "$err"
+    done
+}
+
+geo-cli::api_server_respond() {
+    # Byte counts are needed for the header (not character counts).
+    local LC_ALL=C
+    printf '%d %d %d\n%s%s' "$1" "${#2}" "${#3}" "$2" "$3"
+}
+
 # Run geo if this file was executed (instead of sourced) as a stand-alone script and arguments were passed in.
-if [[ -n $* ]]; then
+if [[ $1 == --api-server ]]; then
+    geo-cli::api_server
+elif [[ -n $* ]]; then
     geo "$@"
 fi
 
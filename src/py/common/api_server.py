@@ -0,0 +1,187 @@
+import glob
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from . import config
+
+
+def log(msg):
+    print(f'api_server.py: {msg}')
+
+
+GEO_CLI_PATH = config.GEO_CLI_PATH
+# The server is restarted if any of these files change (e.g. after 'geo update') so that it doesn't keep running stale
+# command handlers.
+WATCHED_FILES = [GEO_CLI_PATH, os.path.join(config.GEO_SRC_DIR, 'cli', 'cli-handlers.sh')]
+# geo-cli.sh also sources every file matching these, so they're globbed each time (to notice added or removed files).
+WATCHED_FILE_PATTERNS = [os.path.join(config.GEO_SRC_DIR, 'utils', '*.sh'),
+                         os.path.join(os.environ['HOME'], '.geo-cli', 'env', '*.sh')]
+WATCHED_FILES_CHECK_INTERVAL = 5
+# Stop trying to use the server for a while if it keeps failing to start.
+MAX_FAILED_STARTS = 3
+FAILED_START_BACKOFF = 60
+
+
+class ApiServer:
+    """
+    A long-lived 'geo-cli.sh --api-server' process that runs geo commands without having to re-source all of the
+    command handlers for every call.
+
+    Requests are the argument string that would otherwise be passed to 'geo-cli.sh --api'. Responses are framed as a
+    header line ('<exit code> <stdout byte count> <stderr byte count>') followed by the raw stdout and stderr.
+    """
+    def __init__(self, geo_cli_path=GEO_CLI_PATH):
+        self.geo_cli_path = geo_cli_path
+        self.process = None
+        # Only one request can be in flight at a time.
+        self.lock = threading.Lock()
+        self.watched_file_mtimes = None
+        self.last_watched_files_check = 0
+        self.failed_starts = 0
+        self.disabled_until = 0
+
+    def run(self, arg_str, timeout=None):
+        """
+        Runs 'geo <arg_str>' on the server.
+        Returns a (stdout, stderr, return_code) tuple, or None if the server couldn't handle the request, in which case
+        the caller should run the command directly. Raises subprocess.TimeoutExpired if the command takes longer than
+        timeout seconds (the server is killed and restarted on the next request).
+        """
+        if '\n' in arg_str:
+            return None
+        # Don't wait on a long-running command (e.g. 'init npm'); the caller can run this one directly instead.
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if not self.ensure_running():
+                return None
+            timer = None
+            timed_out = threading.Event()
+            if timeout is not None:
+                timer = threading.Timer(timeout, kill_on_timeout, [self.process, timed_out])
+                timer.daemon = True
+                timer.start()
+            try:
+                return self.request(arg_str)
+            except (OSError, ValueError) as err:
+                if timed_out.is_set():
+                    self.stop()
+                    raise subprocess.TimeoutExpired(arg_str, timeout)
+                log(f'Request "{arg_str}" failed, restarting server: {err}')
+                self.stop()
+                return None
+            finally:
+                if timer:
+                    timer.cancel()
+        finally:
+            self.lock.release()
+
+    def request(self, arg_str):
+        self.process.stdin.write(arg_str.encode() + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline()
+        if not header:
+            raise ValueError('server exited before responding')
+        (return_code, stdout_len, stderr_len) = [int(n) for n in header.split()]
+        stdout = self.read_exactly(stdout_len)
+        stderr = self.read_exactly(stderr_len)
+        self.failed_starts = 0
+        return (stdout.decode(errors='replace'), stderr.decode(errors='replace'), return_code)
+
+    def read_exactly(self, n):
+        data = self.process.stdout.read(n) if n else b''
+        if len(data) != n:
+            raise ValueError(f'expected {n} bytes, got {len(data)}')
+        return data
+
+    def ensure_running(self):
+        if self.process and (self.process.poll() is not None or self.watched_files_changed()):
+            self.stop()
+        if self.process:
+            return True
+        if time.time() < self.disabled_until:
+            return False
+        if self.failed_starts >= MAX_FAILED_STARTS:
+            log(f'Server failed to start {self.failed_starts} times, running commands directly for {FAILED_START_BACKOFF} seconds')
+            self.failed_starts = 0
+            self.disabled_until = time.time() + FAILED_START_BACKOFF
+            return False
+        return self.start()
+
+    def start(self):
+        try:
+            self.watched_file_mtimes = get_mtimes(get_watched_files())
+            self.last_watched_files_check = time.time()
+            self.process = subprocess.Popen(['/bin/bash', self.geo_cli_path, '--api-server'],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                            start_new_session=True)
+            log(f'Started server (pid {self.process.pid})')
+            # The counter is reset after the first successful request.
+            self.failed_starts += 1
+            return True
+        except OSError as err:
+            log(f'Error starting server: {err}')
+            self.process = None
+            self.failed_starts += 1
+            return False
+
+    def stop(self):
+        if not self.process:
+            return
+        process = self.process
+        self.process = None
+        try:
+            # The server exits once its stdin is closed.
+            process.stdin.close()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+        try:
+            process.stdout.close()
+        except OSError:
+            pass
+
+    def watched_files_changed(self):
+        now = time.time()
+        if now - self.last_watched_files_check < WATCHED_FILES_CHECK_INTERVAL:
+            return False
+        self.last_watched_files_check = now
+        changed = get_mtimes(get_watched_files()) != self.watched_file_mtimes
+        if changed:
+            log('geo-cli source files changed, restarting server')
+        return changed
+
+
+def kill_on_timeout(process, timed_out):
+    # Set before the kill, so that the request that fails because of it is reported as a timeout (and isn't retried).
+    timed_out.set()
+    kill_process_group(process)
+
+
+def kill_process_group(process):
+    # The server (and any command that it started) runs in its own session, so kill the whole group.
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def get_watched_files():
+    paths = list(WATCHED_FILES)
+    for pattern in WATCHED_FILE_PATTERNS:
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+
+def get_mtimes(paths):
+    """Returns a dict of paths to their modification times (0 if they don't exist)."""
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            mtimes[path] = 0
+    return mtimes
@@ -0,0 +1,68 @@
+import concurrent.futures
+import threading
+import traceback
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+
+def log(msg):
+    print(f'async_exec.py: {msg}')
+
+
+MAX_WORKERS = 4
+
+
+class AsyncRunner:
+    """
+    Runs blocking functions on a bounded thread pool, then calls their callbacks with the result on the GLib main loop,
+    so that slow commands never stall the ui.
+    """
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='geo-async')
+        self.lock = threading.Lock()
+        # Maps the key of each running call to the callbacks waiting on its result.
+        self.in_flight = {}
+
+    def run(self, func, callback=None, key=None):
+        """
+        Runs func() in the background and then calls callback(result) on the main loop.
+        If key is given and a call with the same key is already running, func isn't run again; callback is called with
+        the result of the running call instead. Returns True if func was started.
+        """
+        callbacks = [callback] if callback else []
+        if key is not None:
+            with self.lock:
+                if key in self.in_flight:
+                    self.in_flight[key].extend(callbacks)
+                    return False
+                self.in_flight[key] = callbacks
+        self.executor.submit(self.call, func, callbacks, key)
+        return True
+
+    def is_running(self, key):
+        with self.lock:
+            return key in self.in_flight
+
+    def call(self, func, callbacks, key):
+        result = None
+        try:
+            result = func()
+        except Exception as err:
+            log(f'Error running {getattr(func, "__qualname__", func)}: {err}')
+            traceback.print_exc()
+        if key is not None:
+            with self.lock:
+                callbacks = self.in_flight.pop(key, [])
+        for callback in callbacks:
+            GLib.idle_add(self.invoke, callback, result)
+
+    @staticmethod
+    def invoke(callback, result):
+        try:
+            callback(result)
+        except Exception as err:
+            log(f'Error running callback {getattr(callback, "__qualname__", callback)}: {err}')
+            traceback.print_exc()
+        return False
@@ -5,4 +5,6 @@ BASE_DIR = os.path.dirname(BASE_DIR)
 INDICATOR_DIR = os.path.join(BASE_DIR, 'indicator')
 GEO_SRC_DIR = os.path.dirname(BASE_DIR)
 # GEO_SRC_DIR = os.path.dirname(GEO_SRC_DIR)
-GEO_CMD_BASE = GEO_SRC_DIR + '/geo-cli.sh '
\ No newline at end of file
+# GEO_CLI_PATH can be set to run a different geo-cli.sh (e.g. the fake one that the indicator benchmarks use).
+GEO_CLI_PATH = os.environ.get('GEO_CLI_PATH') or os.path.join(GEO_SRC_DIR, 'geo-cli.sh')
+GEO_CMD_BASE = GEO_CLI_PATH + ' '
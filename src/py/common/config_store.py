@@ -0,0 +1,301 @@
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+
+def log(msg):
+    print(f'config_store.py: {msg}')
+
+
+GEO_CONFIG_FILE_PATH = os.path.join(os.environ['HOME'], '.geo-cli', '.geo.conf')
+GEO_CONFIG_JSON_FILE_PATH = GEO_CONFIG_FILE_PATH + '.json'
+# The same lock file that @geo_set and @geo_rm use (with flock) when writing to the config file.
+CONFIG_LOCK_FILE_PATH = '/tmp/.geo.conf.lock'
+LOCK_TIMEOUT = 5
+KEY_PREFIX = 'GEO_CLI_'
+# Newlines in values are escaped with this when they are written to the config file (see utils/config-file-utils.sh).
+ESCAPED_NEWLINE = '__n__'
+
+
+def to_geo_key(key):
+    """Returns the key as it's stored in the config file (e.g. DEV_REPO_DIR => GEO_CLI_DEV_REPO_DIR)."""
+    key = key.upper()
+    return key if key.startswith(KEY_PREFIX) else KEY_PREFIX + key
+
+
+def escape_value(value):
+    return str(value).replace('\n', ESCAPED_NEWLINE)
+
+
+def unescape_value(value):
+    return value.replace(ESCAPED_NEWLINE, '\n')
+
+
+def to_json_path(key):
+    """Returns the path that @geo_set uses for the key in the json config file (e.g. DEV_REPO_DIR => ['dev-repo-dir'])."""
+    return key.lower().replace('_', '-').split('.')
+
+
+def parse_config(text):
+    """Parses the contents of a geo-cli config file the same way that cfg_read does: if a key is repeated, the last
+    value wins."""
+    values = {}
+    for line in text.split('\n'):
+        (key, delimiter, value) = line.partition('=')
+        if not key or not delimiter:
+            continue
+        # Trailing newlines are lost when bash reads a value with $(cfg_read ...), so drop them here too.
+        values[key] = unescape_value(value).rstrip('\n')
+    return values
+
+
+@contextlib.contextmanager
+def lock_config_file(timeout=LOCK_TIMEOUT):
+    """Holds the config file lock that the shell tooling uses (flock on /tmp/.geo.conf.lock)."""
+    with open(CONFIG_LOCK_FILE_PATH, 'a') as lock_file:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.time() > deadline:
+                    raise TimeoutError(f'Failed to lock {CONFIG_LOCK_FILE_PATH} after {timeout} seconds')
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_file_atomically(path, text):
+    """Writes to a temporary file and renames it over path, so readers never see a partially written file."""
+    directory = os.path.dirname(path)
+    (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def read_file(path):
+    try:
+        with open(path, 'r', errors='replace') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ''
+
+
+def write_config_file(path, updates):
+    """
+    Applies updates (a dict of keys to values, or to REMOVED) to the config file in a single write. Each key is written
+    the same way as cfg_write: any existing lines for it are deleted and the new value is appended.
+    """
+    lines = [line for line in read_file(path).split('\n') if line]
+    lines = [line for line in lines if line.partition('=')[0] not in updates]
+    lines += [f'{key}={escape_value(value)}' for key, value in updates.items() if value is not REMOVED]
+    write_file_atomically(path, ''.join(line + '\n' for line in lines))
+
+
+def write_json_config_file(path, updates):
+    """Mirrors values into the json config file, like the _geo_jq_set call in @geo_set does."""
+    text = read_file(path)
+    try:
+        config = json.loads(text) if len(text.strip()) > 2 else {}
+    except ValueError as err:
+        log(f'Not updating invalid json config file {path}: {err}')
+        return
+    for json_path, value in updates.items():
+        node = config
+        for name in json_path[:-1]:
+            if not isinstance(node.get(name), dict):
+                node[name] = {}
+            node = node[name]
+        node[json_path[-1]] = value
+    write_file_atomically(path, json.dumps(config, indent=2, ensure_ascii=False) + '\n')
+
+
+# Marks a pending removal.
+REMOVED = object()
+
+
+class ConfigStore:
+    """
+    An in-memory copy of the geo-cli config file. The file is only re-parsed when a file monitor reports that it
+    changed, so reads never touch the disk or start a geo process. If the file can't be monitored, the file is checked
+    for changes on every read instead.
+
+    Writes are applied to the in-memory copy right away and then written to the file together at the end of the
+    current main loop iteration (or when flush() is called), holding the same lock as the shell tooling.
+    """
+    def __init__(self, path=GEO_CONFIG_FILE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = {}
+        # (inode, mtime, size) of the file when it was last parsed.
+        self.file_id = None
+        # Incremented every time the file's contents are reloaded.
+        self.version = 0
+        self.start_lock = threading.Lock()
+        self.started = False
+        self.monitor = None
+        self.listeners = []
+        # Keys (as stored in the file) to values that haven't been written yet.
+        self.pending = {}
+        self.pending_json = {}
+        self.flush_scheduled = False
+        self.flush_lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """callback() is called on the main loop whenever the config file is reloaded because it changed."""
+        self.listeners.append(callback)
+
+    def get(self, key, default=''):
+        (found, value) = self.lookup(key)
+        return value if found else default
+
+    def has(self, key):
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        self.ensure_loaded()
+        (values, pending) = (self.values, self.pending)
+        for k in (key.upper(), to_geo_key(key)):
+            if k in pending:
+                return (False, None) if pending[k] is REMOVED else (True, pending[k])
+            if k in values:
+                return (True, values[k])
+        return (False, None)
+
+    def get_version(self):
+        self.ensure_loaded()
+        return self.version
+
+    def set(self, key, value):
+        """Sets the value of key. Returns False if it already had that value."""
+        value = str(value)
+        (found, old_value) = self.lookup(key)
+        if found and old_value == value:
+            return False
+        with self.lock:
+            self.pending = {**self.pending, to_geo_key(key): value}
+            self.pending_json[tuple(to_json_path(key))] = value
+        self.schedule_flush()
+        return True
+
+    def remove(self, key):
+        """Removes key. Returns False if it didn't exist."""
+        if not self.has(key):
+            return False
+        with self.lock:
+            self.pending = {**self.pending, to_geo_key(key): REMOVED}
+        self.schedule_flush()
+        return True
+
+    def has_pending_writes(self):
+        return bool(self.pending)
+
+    def schedule_flush(self):
+        with self.lock:
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        GLib.idle_add(lambda: self.flush() and False)
+
+    def flush(self):
+        """Writes all pending changes to the config file. Returns True if there was nothing left to write."""
+        with self.flush_lock:
+            with self.lock:
+                self.flush_scheduled = False
+                (pending, pending_json) = (self.pending, self.pending_json)
+                self.pending_json = {}
+            if not pending:
+                return True
+            try:
+                with lock_config_file():
+                    write_config_file(self.path, pending)
+                    if pending_json:
+                        write_json_config_file(GEO_CONFIG_JSON_FILE_PATH, pending_json)
+            except (OSError, TimeoutError) as err:
+                log(f'Error writing config file: {err}')
+                with self.lock:
+                    self.pending_json = {**pending_json, **self.pending_json}
+                return False
+            # Reload before dropping the pending values, so that readers never see the old values in between.
+            self.reload()
+            with self.lock:
+                self.pending = {key: value for key, value in self.pending.items() if pending.get(key) is not value}
+            return True
+
+    def ensure_loaded(self):
+        if not self.started:
+            self.start()
+        if not self.monitor:
+            self.reload()
+
+    def start(self):
+        # The monitor reports changes on the thread-default main context of the thread that creates it, so this
+        # should be called from the main thread.
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+        self.reload()
+        try:
+            from gi.repository import Gio
+            monitor = Gio.File.new_for_path(self.path).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect('changed', self.on_changed)
+            self.monitor = monitor
+        except Exception as err:
+            log(f'Unable to monitor {self.path}, checking it for changes on every read instead: {err}')
+
+    def on_changed(self, monitor, file, other_file, event_type):
+        # Called on the main loop. The monitor reports several events for each write; reload() ignores the ones that
+        # didn't change the file.
+        if not self.reload():
+            return
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
+
+    def reload(self):
+        """Parses the config file if it changed since it was last parsed. Returns True if it was reloaded."""
+        try:
+            stat = os.stat(self.path)
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_id = None
+        if file_id == self.file_id:
+            return False
+        text = ''
+        if file_id:
+            try:
+                with open(self.path, 'r', errors='replace') as f:
+                    text = f.read()
+            except OSError as err:
+                log(f'Error reading {self.path}: {err}')
+                return False
+        values = parse_config(text)
+        with self.lock:
+            self.values = values
+            self.file_id = file_id
+            self.version += 1
+        return True
@@ -0,0 +1,227 @@
+import datetime
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from .docker_events import to_db_name
+
+
+def log(msg):
+    print(f'db_metadata.py: {msg}')
+
+
+# How long the container metadata and the volume sizes are cached for. Computing the volume sizes is much slower, so
+# they are cached for longer.
+CONTAINERS_TTL = 60
+VOLUME_SIZES_TTL = 300
+# New dbs need their sizes, but computing them is slow, so they're reloaded at most this often when dbs are added.
+MIN_VOLUME_SIZES_INTERVAL = 30
+SIZE_PATTERN = re.compile(r'^([\d.]+)\s*([kKMGTP]?i?B)$')
+# Docker reports sizes with decimal units (see go-units HumanSize).
+SIZE_UNITS = {'B': 1, 'kB': 1e3, 'KB': 1e3, 'MB': 1e6, 'GB': 1e9, 'TB': 1e12, 'PB': 1e15,
+              'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4, 'PiB': 1024 ** 5}
+DOCKER_TIME_PATTERN = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?$')
+
+
+@dataclass(frozen=True)
+class DbMetadata:
+    name: str
+    # Seconds since the epoch (0 if unknown).
+    created: float = 0
+    last_started: float = 0
+    # The size of the db's volume in bytes, or None if it isn't known.
+    size: int = None
+    # The name of the db's volume and where it is on the host.
+    volume: str = ''
+    volume_path: str = ''
+    # The image that the db's container was created from (e.g. geo_cli_db_postgres_12).
+    image: str = ''
+
+    @property
+    def last_used(self):
+        return self.last_started or self.created
+
+
+def parse_docker_time(value):
+    """Converts a docker timestamp (e.g. 2023-01-02T03:04:05.123456789Z) to seconds since the epoch (0 if unset)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DOCKER_TIME_PATTERN.match(value or '')
+    # Docker uses 0001-01-01T00:00:00Z for times that are unset (e.g. StartedAt of a container that never started).
+    if not match or value.startswith('0001-'):
+        return 0
+    (date_time, fraction, offset) = match.groups()
+    # Python can't parse nanoseconds, so the fraction is added separately.
+    parsed = datetime.datetime.fromisoformat(date_time + ('+00:00' if offset in (None, 'Z') else offset))
+    return parsed.timestamp() + (float('0.' + fraction) if fraction else 0)
+
+
+def parse_size(text):
+    """Converts a size reported by the docker cli (e.g. 1.234GB) to bytes, or None if it isn't a size (e.g. N/A)."""
+    match = SIZE_PATTERN.match((text or '').strip())
+    if not match or match.group(2) not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(size):
+    """e.g. 1234567890 => 1.2 GB"""
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1000:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1000
+    return f'{size:.1f} TB'
+
+
+def format_age(seconds):
+    """e.g. 90 => 1m, 100000 => 1d"""
+    for (unit, length) in (('y', 365 * 86400), ('w', 7 * 86400), ('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= length:
+            return f'{int(seconds // length)}{unit}'
+    return 'now'
+
+
+def parse_volume_sizes(output):
+    """
+    Parses the output of 'docker system df -v --format "{{json .}}"' into a dict of volume names to their sizes in bytes.
+    Volumes whose size docker couldn't compute (e.g. N/A) are left out.
+    """
+    volumes = json.loads(output or '{}').get('Volumes') or []
+    sizes = {volume.get('Name'): parse_size(volume.get('Size')) for volume in volumes}
+    return {name: size for name, size in sizes.items() if size is not None}
+
+
+def get_volume_mount(container):
+    for mount in container.get('Mounts') or []:
+        if mount.get('Type') == 'volume' and mount.get('Name'):
+            return mount
+    return {}
+
+
+def get_volume_name(container):
+    # geo-cli names each db's volume after its container.
+    return get_volume_mount(container).get('Name') or container.get('Name', '').lstrip('/')
+
+
+def get_stale_containers(listed, prev_containers):
+    """
+    Splits the containers in a container list (/containers/json) into the ones whose previous 'docker inspect' json is
+    still current and the names of the ones that need to be inspected again: new containers, containers whose state
+    changed and running containers (restarting one changes its StartedAt, but not its state). Returns
+    (current inspect json, names).
+    """
+    prev = {container.get('Id'): container for container in prev_containers}
+    current = []
+    stale = []
+    for container in listed:
+        inspected = prev.get(container.get('Id'))
+        state = container.get('State')
+        if inspected and state != 'running' and (inspected.get('State') or {}).get('Status') == state:
+            current.append(inspected)
+        else:
+            stale.append(container['Names'][0].lstrip('/'))
+    return (current, stale)
+
+
+def to_metadata(container, volume_sizes):
+    """Creates the metadata for a db from its container's 'docker inspect' json and a dict of volume names to sizes."""
+    container_name = container.get('Name', '').lstrip('/')
+    state = container.get('State') or {}
+    return DbMetadata(
+        name=to_db_name(container_name),
+        created=parse_docker_time(container.get('Created')),
+        last_started=parse_docker_time(state.get('StartedAt')),
+        size=volume_sizes.get(get_volume_name(container)),
+        volume=get_volume_name(container),
+        volume_path=get_volume_mount(container).get('Source', ''),
+        image=(container.get('Config') or {}).get('Image', ''))
+
+
+class DbMetadataTable:
+    """
+    A cache of the metadata (created time, last started time and volume size) of every geo db, keyed by db name. It is
+    loaded with one container list (only the containers that are new or changed are inspected) and one volume disk usage
+    request, and each part is only reloaded when its ttl expires (or the dbs change). The db menu's labels and sorting all read from it, so they never query docker
+    themselves.
+    """
+    def __init__(self, inspect_containers, get_volume_sizes, containers_ttl=CONTAINERS_TTL, volume_sizes_ttl=VOLUME_SIZES_TTL,
+                 min_volume_sizes_interval=MIN_VOLUME_SIZES_INTERVAL):
+        # Returns the 'docker inspect' json of every geo db container. It's passed the json from the last load, so that
+        # the containers that haven't changed don't need to be inspected again.
+        self.inspect_containers = inspect_containers
+        # Returns a dict of volume names to their sizes in bytes.
+        self.get_volume_sizes = get_volume_sizes
+        self.containers_ttl = containers_ttl
+        self.volume_sizes_ttl = volume_sizes_ttl
+        self.min_volume_sizes_interval = min_volume_sizes_interval
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.rows = {}
+        self.containers = []
+        self.volume_sizes = {}
+        # When each part was last loaded (time.monotonic()), 0 if it needs to be reloaded.
+        self.containers_loaded_at = 0
+        self.volume_sizes_loaded_at = 0
+        # Set when dbs were added since the volume sizes were last loaded.
+        self.volume_sizes_pending = False
+        # Incremented every time the contents of the table change.
+        self.version = 0
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() is called (from the thread that refreshed the table) whenever its contents change."""
+        self.listeners.append(callback)
+
+    def get(self, db):
+        return self.rows.get(db)
+
+    def get_all(self):
+        return self.rows
+
+    def get_version(self):
+        return self.version
+
+    def invalidate(self):
+        """Reloads the container metadata on the next refresh (e.g. because a container was started or removed)."""
+        self.containers_loaded_at = 0
+
+    def refresh(self, force=False):
+        """Reloads the parts of the table whose ttl expired. Returns the version of the table."""
+        with self.refresh_lock:
+            now = time.monotonic()
+            reload_containers = force or not self.containers_loaded_at or now - self.containers_loaded_at > self.containers_ttl
+            reload_volume_sizes = force or not self.volume_sizes_loaded_at or now - self.volume_sizes_loaded_at > self.volume_sizes_ttl
+            if reload_containers:
+                names = {container.get('Name') for container in self.containers}
+                self.containers = self.inspect_containers(self.containers)
+                self.containers_loaded_at = now
+                # New dbs need their sizes too.
+                if {container.get('Name') for container in self.containers} - names:
+                    self.volume_sizes_pending = True
+            # When dbs are being added one after the other, their sizes are loaded together (on a later refresh).
+            if self.volume_sizes_pending and now - self.volume_sizes_loaded_at >= self.min_volume_sizes_interval:
+                reload_volume_sizes = True
+            if reload_volume_sizes:
+                self.volume_sizes = self.get_volume_sizes()
+                self.volume_sizes_loaded_at = now
+                self.volume_sizes_pending = False
+            if reload_containers or reload_volume_sizes:
+                self.set_rows(to_metadata(container, self.volume_sizes) for container in self.containers)
+            return self.version
+
+    def set_rows(self, rows):
+        """Replaces the contents of the table with rows (an iterable of DbMetadata). Returns True if anything changed."""
+        rows = {row.name: row for row in rows}
+        with self.lock:
+            if rows == self.rows:
+                return False
+            self.rows = rows
+            self.version += 1
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
+        return True
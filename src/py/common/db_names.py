@@ -0,0 +1,47 @@
+import functools
+import re
+
+
+# A leading version number, e.g. 11_0, 10.0.1234, 9-1_test or 2104.
+VERSION_PATTERN = re.compile(r'^(\d+)(?:[._-](\d+))?(?:[._-](\d+))?(.*)$', re.DOTALL)
+SUFFIX_SEPARATORS = '._- '
+
+
+def is_release_number(n):
+    """
+    Whether a bare leading number (one without a minor version) looks like a MyGeotab release: 10 to 59 (e.g. 11) or
+    100 to 1899. Other numbers are more likely to be years, counters or dates than releases.
+    """
+    return 10 <= n < 60 or 100 <= n < 1900
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_db_version(name):
+    """
+    Returns the MyGeotab version that the db name starts with as (major, minor, patch, suffix), or None if it doesn't
+    start with one. e.g. '10_0_1234_test' => (10, 0, 1234, 'test'), '9.1' => (9, 1, 0, ''), 'dev' => None.
+
+    Names are only parsed once; the result is cached.
+    """
+    match = VERSION_PATTERN.match(name.lstrip('0'))
+    if not match:
+        return None
+    (major, minor, patch, suffix) = match.groups()
+    major = int(major)
+    if minor is None and not is_release_number(major):
+        return None
+    return (major, int(minor or 0), int(patch or 0), suffix.lstrip(SUFFIX_SEPARATORS))
+
+
+@functools.lru_cache(maxsize=4096)
+def get_version_sort_key(name):
+    """
+    Returns a key that orders db names by their MyGeotab version (so that 9.1 < 10.0 < 10.0.12). Names without a
+    version come before every versioned name and are ordered lexically. The name is included so that names with the
+    same version still have a consistent order.
+    """
+    version = parse_db_version(name)
+    if version is None:
+        return (0, (), '', name)
+    (major, minor, patch, suffix) = version
+    return (1, (major, minor, patch), suffix, name)
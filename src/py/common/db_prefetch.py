@@ -0,0 +1,192 @@
+import collections
+import json
+import os
+import subprocess
+import threading
+import time
+
+
+def log(msg):
+    print(f'db_prefetch.py: {msg}')
+
+
+HISTORY_FILE_PATH = os.path.join(os.environ['HOME'], '.geo-cli', 'data', 'myg-release-history.json')
+MAX_HISTORY = 200
+DEFAULT_MEMORY_BUDGET_MB = 1024
+# Never use more than this fraction of the memory that is currently available.
+MAX_AVAILABLE_MEMORY_FRACTION = 0.5
+WARM_TIMEOUT = 600
+# The same db isn't warmed again for this many seconds.
+REWARM_INTERVAL = 600
+# Reads the most recently modified files in /data until the budget ($1 bytes) is used up.
+WARM_SCRIPT = ("find /data -type f -printf '%T@ %s %p\\n' | sort -rn "
+               "| awk -v budget=\"$1\" '{ total += $2; if (total > budget) exit; print $3 }' | xargs -r cat > /dev/null")
+
+
+class ReleaseHistory:
+    """The MYG releases that were checked out, oldest first. Used to predict which release will be checked out next."""
+    def __init__(self, file_path=HISTORY_FILE_PATH, max_length=MAX_HISTORY):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.releases = None
+        self.max_length = max_length
+
+    def get_releases(self):
+        if self.releases is None:
+            try:
+                with open(self.file_path) as f:
+                    self.releases = list(json.load(f))[-self.max_length:]
+            except (OSError, ValueError, TypeError):
+                self.releases = []
+        return self.releases
+
+    def record(self, release):
+        with self.lock:
+            releases = self.get_releases()
+            if not release or (releases and releases[-1] == release):
+                return
+            releases.append(release)
+            del releases[:-self.max_length]
+            try:
+                os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+                tmp_path = self.file_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(releases, f)
+                os.replace(tmp_path, self.file_path)
+            except OSError as err:
+                log(f'Error saving release history: {err}')
+
+    def predict_next(self, current):
+        """
+        Returns the releases that are most likely to be checked out after current, most likely first: the ones that
+        were switched to from current most often (ties go to the most recent), then the other recent releases.
+        """
+        releases = self.get_releases()
+        counts = collections.Counter()
+        last_seen = {}
+        for (i, (release, next_release)) in enumerate(zip(releases, releases[1:])):
+            if release == current and next_release != current:
+                counts[next_release] += 1
+                last_seen[next_release] = i
+        predicted = sorted(counts, key=lambda r: (counts[r], last_seen[r]), reverse=True)
+        for release in reversed(releases):
+            if release != current and release not in predicted:
+                predicted.append(release)
+        return predicted
+
+
+def get_available_memory():
+    """Returns MemAvailable from /proc/meminfo in bytes (0 if it can't be read)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def get_memory_budget(budget_mb):
+    """Returns how many bytes can be read into the page cache: budget_mb, limited by the memory that is available."""
+    return int(min(budget_mb * 1024 * 1024, get_available_memory() * MAX_AVAILABLE_MEMORY_FRACTION))
+
+
+def warm_files(path, budget):
+    """
+    Asks the kernel to read the most recently modified files under path into the page cache (without copying them to
+    this process), until budget bytes have been requested. Returns the number of bytes requested.
+    """
+    files = []
+    for (dir_path, _, file_names) in os.walk(path):
+        for name in file_names:
+            file_path = os.path.join(dir_path, name)
+            try:
+                stat = os.stat(file_path, follow_symlinks=False)
+                files.append((stat.st_mtime, stat.st_size, file_path))
+            except OSError:
+                pass
+    files.sort(reverse=True)
+    total = 0
+    for (_, size, file_path) in files:
+        if total + size > budget:
+            break
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+            total += size
+        except OSError:
+            pass
+    return total
+
+
+def warm_volume_with_container(volume, image, budget):
+    """
+    Reads the volume's files from a throwaway container, for volumes that we can't read directly. image is the db's own
+    image (geo-cli builds one per postgres version), so that no other image has to be pulled.
+    """
+    cmd = ['docker', 'run', '--rm', '--network', 'none', '-v', f'{volume}:/data:ro', '--entrypoint', 'sh', image,
+           '-c', WARM_SCRIPT, 'warm', str(budget)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=WARM_TIMEOUT)
+        if result.returncode != 0:
+            log(f'Error warming volume {volume}: {result.stderr.strip()}')
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired) as err:
+        log(f'Error warming volume {volume}: {err}')
+        return False
+
+
+class DbPrefetcher:
+    """
+    Predicts which db will be needed next (from the release history and the DB_FOR_RELEASE_* mappings) and reads its
+    volume into the page cache ahead of time, so that starting it after the next branch switch doesn't have to wait on
+    the disk. Only one db is kept warm, and the amount that is read is limited by a memory budget.
+
+    geo-cli runs one db at a time (on the same port), so the predicted db is warmed rather than kept running.
+    """
+    def __init__(self, get_db_for_release, get_metadata, history=None):
+        # Returns the db that is configured for a release ('' if there isn't one).
+        self.get_db_for_release = get_db_for_release
+        # Returns the DbMetadata of a db.
+        self.get_metadata = get_metadata
+        self.history = history or ReleaseHistory()
+        self.lock = threading.Lock()
+        # The db that was warmed last, and when.
+        self.warm_db = ''
+        self.warmed_at = 0
+
+    def predict_db(self, current_release, running_db=''):
+        """Returns the db that is most likely to be started next, or '' if there isn't one."""
+        current_db = self.get_db_for_release(current_release)
+        for release in self.history.predict_next(current_release):
+            db = self.get_db_for_release(release)
+            if db and db not in (current_db, running_db):
+                return db
+        return ''
+
+    def prefetch(self, current_release, running_db, budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        """Warms the volume of the db that is predicted to be needed next. Returns the db ('' if nothing was warmed)."""
+        with self.lock:
+            db = self.predict_db(current_release, running_db)
+            if not db or (db == self.warm_db and time.time() - self.warmed_at < REWARM_INTERVAL):
+                return ''
+            metadata = self.get_metadata(db)
+            if not metadata or not metadata.volume:
+                return ''
+            budget = get_memory_budget(budget_mb)
+            if budget <= 0:
+                log(f'Not enough memory available to warm {db}')
+                return ''
+            start = time.time()
+            path = metadata.volume_path
+            if path and os.access(path, os.R_OK | os.X_OK):
+                warm_files(path, budget)
+            elif not metadata.image or not warm_volume_with_container(metadata.volume, metadata.image, budget):
+                return ''
+            log(f'Warmed db {db} (up to {budget // (1024 * 1024)} MB) in {time.time() - start:.1f} seconds')
+            (self.warm_db, self.warmed_at) = (db, time.time())
+            return db
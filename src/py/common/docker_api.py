@@ -0,0 +1,158 @@
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+
+from .metrics import command_metrics
+
+
+def log(msg):
+    print(f'docker_api.py: {msg}')
+
+
+DEFAULT_SOCKET_PATH = '/var/run/docker.sock'
+MAX_IDLE_CONNECTIONS = 4
+DEFAULT_TIMEOUT = 10
+
+
+def get_socket_path():
+    """Returns the path to the docker daemon's unix socket, or '' if docker is configured to use something else."""
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if not docker_host:
+        return DEFAULT_SOCKET_PATH
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return ''
+
+
+class DockerApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=DEFAULT_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerClient:
+    """
+    A minimal Docker Engine API client that talks to the daemon over its unix socket. Connections are kept alive and
+    reused, so each request only costs a socket round-trip instead of starting the docker cli.
+    """
+    def __init__(self, socket_path=None, timeout=DEFAULT_TIMEOUT):
+        self.socket_path = socket_path if socket_path is not None else get_socket_path()
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle_connections = []
+
+    def is_available(self):
+        return bool(self.socket_path) and os.access(self.socket_path, os.R_OK | os.W_OK)
+
+    def list_containers(self, all=True, name=None, status=None):
+        filters = {}
+        if name:
+            filters['name'] = [name]
+        if status:
+            filters['status'] = [status]
+        params = {'all': 'true' if all else 'false'}
+        if filters:
+            params['filters'] = json.dumps(filters)
+        return self.request('GET', '/containers/json', params)
+
+    def inspect_container(self, name):
+        return self.request('GET', '/containers/{name}/json', name=name)
+
+    def get_disk_usage(self, type=None):
+        """Returns the disk usage of docker's objects (like 'docker system df -v'). type limits it to e.g. 'volume'."""
+        return self.request('GET', '/system/df', {'type': type} if type else None)
+
+    def start_container(self, name):
+        # 304 means that the container was already started.
+        return self.request('POST', '/containers/{name}/start', ok_statuses={304}, name=name)
+
+    def stop_container(self, name, timeout=None):
+        params = {'t': str(timeout)} if timeout is not None else None
+        return self.request('POST', '/containers/{name}/stop', params, ok_statuses={304}, name=name)
+
+    def request(self, method, path, params=None, ok_statuses=None, name=None):
+        """
+        Sends a request to the docker daemon and returns the parsed JSON response (or None if it was empty). {name} in
+        path is replaced by name. Requests are recorded in the metrics by their path template, so that e.g. every
+        container inspect is counted together.
+        """
+        url = path.format(name=urllib.parse.quote(name)) if name is not None else path
+        url += '?' + urllib.parse.urlencode(params) if params else ''
+        metrics_key = f'{method} {path}'
+        start = time.monotonic()
+        try:
+            (status, body) = self.fetch(method, url)
+        except socket.timeout:
+            command_metrics.record_key('docker', metrics_key, time.monotonic() - start, timed_out=True)
+            raise
+        except Exception:
+            command_metrics.record_key('docker', metrics_key, time.monotonic() - start, error=True)
+            raise
+        command_metrics.record_key('docker', metrics_key, time.monotonic() - start, status)
+        if status >= 400 and status not in (ok_statuses or set()):
+            message = body.decode(errors='replace')
+            try:
+                message = json.loads(message).get('message', message)
+            except ValueError:
+                pass
+            raise DockerApiError(status, message)
+        return json.loads(body) if body else None
+
+    def fetch(self, method, url):
+        """Sends the request on an idle keep-alive connection (or a new one). Returns (status, body)."""
+        connection = self.get_connection()
+        try:
+            response = self.send(connection, method, url)
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            # The daemon may have closed an idle keep-alive connection, so retry once on a new one.
+            connection.close()
+            connection = self.new_connection()
+            response = self.send(connection, method, url)
+        except Exception:
+            connection.close()
+            raise
+        (status, body, will_close) = response
+        if will_close:
+            connection.close()
+        else:
+            self.release_connection(connection)
+        return (status, body)
+
+    @staticmethod
+    def send(connection, method, url):
+        connection.request(method, url)
+        response = connection.getresponse()
+        body = response.read()
+        return (response.status, body, response.will_close)
+
+    def new_connection(self):
+        return UnixHTTPConnection(self.socket_path, self.timeout)
+
+    def get_connection(self):
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+        return self.new_connection()
+
+    def release_connection(self, connection):
+        with self.lock:
+            if len(self.idle_connections) < MAX_IDLE_CONNECTIONS:
+                self.idle_connections.append(connection)
+                return
+        connection.close()
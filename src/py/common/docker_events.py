@@ -0,0 +1,138 @@
+import json
+import subprocess
+import threading
+import time
+
+
+def log(msg):
+    print(f'docker_events.py: {msg}')
+
+
+GEO_DB_CONTAINER_PREFIX = 'geo_cli_db_'
+GEO_DB_NAME_PREFIX = 'geo_cli_db_postgres_'
+MAX_RESTART_DELAY = 30
+
+# Maps docker container events to the resulting container state. Events that aren't listed don't change the state.
+EVENT_STATES = {
+    'create': 'created',
+    'start': 'running',
+    'restart': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'stop': 'exited',
+}
+WATCHED_EVENTS = list(EVENT_STATES) + ['destroy', 'rename']
+
+
+def to_db_name(container_name):
+    return container_name.replace(GEO_DB_NAME_PREFIX, '')
+
+
+class DbContainerWatcher:
+    """
+    Keeps an in-memory table of the state of every geo db container up to date by consuming a 'docker events' stream.
+    A full poll (poll_db_states) is only done when the stream is (re)started.
+    """
+    def __init__(self, poll_db_states):
+        # Returns a dict of db names to their container states.
+        self.poll_db_states = poll_db_states
+        self.lock = threading.Lock()
+        self.db_states = {}
+        self.db_names = []
+        self.running_db = ''
+        self.live = False
+        self.thread = None
+        self.process = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() is called (from the watcher thread) whenever the state of a geo db container changes."""
+        self.listeners.append(callback)
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, name='DbContainerWatcher', daemon=True)
+        self.thread.start()
+
+    def is_live(self):
+        return self.live
+
+    def get_db_states(self):
+        with self.lock:
+            return dict(self.db_states)
+
+    def get_db_names(self):
+        return self.db_names
+
+    def get_running_db_name(self):
+        return self.running_db
+
+    def run(self):
+        delay = 1
+        while True:
+            started = time.time()
+            try:
+                self.watch()
+            except Exception as err:
+                log(f'Error watching docker events: {err}')
+            self.live = False
+            # Only back off if the stream keeps dying right away (e.g. docker isn't running).
+            delay = 1 if time.time() - started > MAX_RESTART_DELAY else min(delay * 2, MAX_RESTART_DELAY)
+            time.sleep(delay)
+
+    def watch(self):
+        cmd = ['docker', 'events', '--format', '{{json .}}', '--filter', 'type=container', '--since', str(int(time.time()) - 1)]
+        for event in WATCHED_EVENTS:
+            cmd += ['--filter', f'event={event}']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        # Events that happen while polling are buffered in the pipe and applied afterwards. Applying an event that the
+        # poll already reflects doesn't change anything, so no events are lost between the poll and the stream.
+        db_states = self.poll_db_states()
+        if self.process.poll() is not None:
+            return
+        self.set_db_states(db_states)
+        self.live = True
+        for line in self.process.stdout:
+            self.handle_event(line)
+        self.process.wait()
+        log(f'docker events stream ended (exit code {self.process.returncode})')
+
+    def handle_event(self, line):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        action = event.get('Action') or event.get('status') or ''
+        attributes = event.get('Actor', {}).get('Attributes', {})
+        name = attributes.get('name', '')
+        if not name.startswith(GEO_DB_CONTAINER_PREFIX):
+            return
+        db = to_db_name(name)
+        db_states = self.get_db_states()
+        if action == 'destroy':
+            db_states.pop(db, None)
+        elif action == 'rename':
+            old_db = to_db_name(attributes.get('oldName', '').lstrip('/'))
+            db_states[db] = db_states.pop(old_db, 'created')
+        elif action in EVENT_STATES:
+            db_states[db] = EVENT_STATES[action]
+        else:
+            return
+        self.set_db_states(db_states)
+
+    def set_db_states(self, db_states):
+        with self.lock:
+            if db_states == self.db_states:
+                return
+            self.db_states = db_states
+            # Cache the values derived from the table so that they can be served without doing any work.
+            self.db_names = sorted(db_states, reverse=True)
+            running_dbs = [db for db in self.db_names if db_states[db] == 'running']
+            self.running_db = running_dbs[0] if running_dbs else ''
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
@@ -1,9 +1,24 @@
+import json
 import os
+import signal
 import subprocess
+import threading
 import time
 
 from . import util
 from . import config
+from .api_server import ApiServer
+from .async_exec import AsyncRunner
+from .config_store import ConfigStore, to_geo_key
+from .db_metadata import DbMetadataTable, get_stale_containers, parse_volume_sizes
+from .db_prefetch import DbPrefetcher
+from .docker_api import DockerClient, DockerApiError
+from .docker_events import DbContainerWatcher, GEO_DB_CONTAINER_PREFIX, GEO_DB_NAME_PREFIX, to_db_name
+from .metrics import command_metrics
+from .process_probe import ProcessProbe
+from .release_tracker import ReleaseTracker
+from .trash import TrashCollector
+from .tunnel_registry import TunnelRegistry
 
 def log(msg):
     print(f'geo.py: {msg}')
@@ -13,10 +28,30 @@ BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 GEO_SRC_DIR = os.path.dirname(BASE_DIR)
 GEO_CMD_BASE = GEO_SRC_DIR + '/geo-cli.sh '
 
-geo_config_file_modified_time = 0
-prev_config_file_str = ''
-GEO_CONFIG_FILE_PATH = os.environ['HOME'] + '/.geo-cli/.geo.conf'
-geo_config_cache = {}
+# Commands are killed if they run for longer than this many seconds.
+DEFAULT_TIMEOUT = 60
+# Timeouts for commands that are expected to take longer, matched against the leading words of the command. None means
+# no timeout.
+COMMAND_TIMEOUTS = {
+    'init': None,
+    'update': None,
+    'analyze': None,
+    'indicator': None,
+    'db init': None,
+    'db create': None,
+    'db start': 600,
+    'db rm': 300,
+    'dev auto-switch': 300,
+    'dev update-available': 120,
+}
+# The return code used for commands that timed out (same as coreutils' timeout).
+TIMEOUT_RETURN_CODE = 124
+api_server = ApiServer()
+docker_client = DockerClient()
+async_runner = AsyncRunner()
+config_store = ConfigStore()
+process_probe = ProcessProbe()
+trash_collector = TrashCollector()
 
 def make_cached_property(get_value_func, delay=1, default=None):
     value = default
@@ -60,31 +95,145 @@ def geo(arg_str, return_error=False, return_all=False, terminal=False, return_su
     if terminal:
         run_in_terminal(arg_str)
         return
-    geo_path = config.GEO_SRC_DIR + '/geo-cli.sh '
-    cmd = geo_path + ' --api ' + arg_str
-    # cmd = geo_path + ' --raw-output --no-update-check ' + arg_str
     result = ['', '']
     return_code = ''
+    timeout = get_timeout(arg_str)
+    # The command may read the config file, so make sure that it has all of our writes.
+    if config_store.has_pending_writes():
+        config_store.flush()
 
+    start = time.monotonic()
     try:
-        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, executable='/bin/bash', text=True)
-        # process = subprocess.Popen("bash %s" % (cmd), shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, executable='/bin/bash', text=True)
-        return_code = process.wait()
-        result = process.communicate()
+        # Use the long-lived api server if it's available, otherwise start a new geo-cli process for this command.
+        # Commands without a timeout can take minutes, so they get their own process instead of tying up the server.
+        response = api_server.run(arg_str, timeout) if timeout is not None else None
+        if response is None:
+            response = run_one_shot(arg_str, timeout)
+        (result[0], result[1], return_code) = response
+        command_metrics.record('geo', arg_str, time.monotonic() - start, return_code)
+    except subprocess.TimeoutExpired:
+        log(f'geo("{arg_str}") timed out after {timeout} seconds')
+        (result[1], return_code) = (f'Timed out after {timeout} seconds', TIMEOUT_RETURN_CODE)
+        command_metrics.record('geo', arg_str, time.monotonic() - start, return_code, timed_out=True)
         # if result[1]:
         #     print(f'geo: Error running command {arg_str}: {result}')
     except Exception as err:
         log(f'Error running geo("{arg_str}", {return_error}, {return_all}). result = {result}: err = {err}')
+        command_metrics.record('geo', arg_str, time.monotonic() - start, error=True)
 
     if return_value_retcode_tuple: return (result[0], return_code)
     if return_error: return result[1]
-    if return_success_status: return False if result[1] or process.returncode != 0 or 'false' in result[0] else True
+    if return_success_status: return False if result[1] or return_code != 0 or 'false' in result[0] else True
     if return_all: return result
     return result[0]
 
 
+def geo_async(arg_str, callback=None, **kwargs):
+    """
+    Runs geo(arg_str, **kwargs) in the background and then calls callback(result) on the main loop. A command that is
+    already running isn't started again; callback gets the result of the running command instead.
+    """
+    key = ('geo', arg_str, tuple(sorted(kwargs.items())))
+    return async_runner.run(lambda: geo(arg_str, **kwargs), callback, key)
+
+
+def run_async(func, callback=None, key=None):
+    """Runs func() in the background and then calls callback(result) on the main loop. See AsyncRunner.run."""
+    return async_runner.run(func, callback, key)
+
+
+def get_timeout(arg_str):
+    """Returns the timeout (in seconds) for 'geo <arg_str>', or None if it shouldn't time out."""
+    words = arg_str.split()
+    for n in (2, 1):
+        cmd = ' '.join(words[:n])
+        if cmd in COMMAND_TIMEOUTS:
+            return COMMAND_TIMEOUTS[cmd]
+    return DEFAULT_TIMEOUT
+
+
+def start_process(arg_str, stderr=subprocess.PIPE):
+    geo_path = config.GEO_CMD_BASE
+    cmd = geo_path + ' --api ' + arg_str
+    # cmd = geo_path + ' --raw-output --no-update-check ' + arg_str
+    # Start a new session so that the command and all of its children can be killed together.
+    return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=stderr, executable='/bin/bash', text=True,
+                            start_new_session=True)
+
+
+def kill_process(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def run_one_shot(arg_str, timeout=None):
+    process = start_process(arg_str)
+    # communicate() reads stdout and stderr concurrently, so the command can't block on a full pipe.
+    try:
+        (stdout, stderr) = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process(process)
+        process.communicate()
+        raise
+    return (stdout, stderr, process.returncode)
+
+
+def stream(arg_str, merge_stderr=False):
+    """
+    Runs 'geo <arg_str>' and returns a CommandStream that yields its output line by line as it is written, e.g.:
+        for line in geo.stream('init npm'):
+            print(line)
+    """
+    return CommandStream(arg_str, merge_stderr)
+
+
+class CommandStream:
+    """
+    Iterates over the stdout lines (without line endings) of a running geo command. stderr is collected in the
+    background (or merged into stdout) so the command can't block on it. return_code and stderr are set once the
+    iteration is finished. Stopping early (or calling close()) kills the command.
+    """
+    def __init__(self, arg_str, merge_stderr=False):
+        self.arg_str = arg_str
+        self.process = start_process(arg_str, stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE)
+        self.return_code = None
+        self.stderr = ''
+        self.stderr_lines = []
+        self.stderr_thread = None
+        if not merge_stderr:
+            self.stderr_thread = threading.Thread(target=self.read_stderr, daemon=True)
+            self.stderr_thread.start()
+
+    def read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_lines.append(line)
+
+    def __iter__(self):
+        finished = False
+        try:
+            for line in self.process.stdout:
+                yield line.rstrip('\n')
+            finished = True
+        finally:
+            self.close(kill=not finished)
+
+    def close(self, kill=True):
+        if self.return_code is not None:
+            return
+        # The command is only still running here if the caller stopped reading before it finished.
+        if kill and self.process.poll() is None:
+            kill_process(self.process)
+        self.return_code = self.process.wait()
+        if self.stderr_thread:
+            self.stderr_thread.join()
+        self.stderr = ''.join(self.stderr_lines)
+        self.process.stdout.close()
+
+
 def get_myg_release():
-    release = geo('dev release')
+    release = release_tracker.get_release()
     if len(release) > 0: release = release.replace('\n', '')
     if len(release) > 32 or ' ' in release or '\n' in release or 'MyGeotab' in release or 'repo' in release or 'geo-cli' in release or 'cli-handlers' in release:
     # if len(release) > 32 or ' ' in release or '\n\n' in release or 'MyGeotab' in release or 'repo' in release or 'geo-cli' in release or 'cli-handlers' in release:
@@ -102,8 +251,21 @@ def try_start_last_db():
     start_db(last_db)
 
 def get_running_geo_container():
-    cmd = 'docker ps - -filter name = "geo_cli_db" - -filter status = running - a - -format = "{{ .Names }}"'
-    # .replace('geo_cli_db_postgres_', '')
+    """Returns the full container name of the running geo db (e.g. geo_cli_db_postgres_10_0)."""
+    if docker_client.is_available():
+        try:
+            names = [get_container_name(c) for c in docker_client.list_containers(name=GEO_DB_CONTAINER_PREFIX, status='running')]
+            names = [name for name in names if name.startswith(GEO_DB_CONTAINER_PREFIX)]
+            return names[0] if names else ''
+        except (OSError, DockerApiError, ValueError) as err:
+            print(f'Error running get_running_geo_container(): {err}')
+    cmd = 'docker ps --filter name="geo_cli_db" --filter status=running -a --format="{{ .Names }}"'
+    return util.run_shell_cmd(cmd).split('\n')[0]
+
+
+def get_container_name(container):
+    # The docker api prefixes container names with '/'.
+    return container['Names'][0].lstrip('/') if container.get('Names') else ''
 
 
 def get_geo_cmd(geo_cmd):
@@ -128,37 +290,47 @@ def try_get_db_name_for_current_myg_release():
     return shortest_name
 
 
+def get_db_for_release(release):
+    """Returns the db that is configured for the release with 'Set DB for MYG Release' ('' if there isn't one)."""
+    if not release:
+        return ''
+    return get_config('DB_FOR_RELEASE_' + release.replace('.', '_').replace('/', '_').replace(' ', '_'))
+
+
 def get_config(key):
-    load_geo_config_if_required()
-    key = key.upper()
-    if key in geo_config_cache:
-        return geo_config_cache[key]
-    (value, retcode) = geo(f"get '{key}'", return_value_retcode_tuple=True)
-    if retcode == 0:
-        geo_config_cache[key] = value
+    value = config_store.get(key)
+    # Same fallback as @geo_get: never report the geo-cli repo dir as ''.
+    if not value and to_geo_key(key) == 'GEO_CLI_DIR':
+        value = os.environ.get('GEO_CLI_DIR', os.path.dirname(config.GEO_SRC_DIR))
     return value
 
 def get_bool_config(key: str) -> bool: return util.str2bool(get_config(key))
 
 def set_config(key: str, value):
     key = key.upper()
-    if not key or geo_config_cache.get(key) == value:
+    if not key:
         return
-    # The config file will be reloaded after setting it, which will update geo_config_cache.
-    # This seems better than updating the cache now, since we won't try to write again if we already have the value in
-    # the cache. This allows us to keep trying to set the value until we know for sure that the file has been updated.
-    # geo("set '%s' '%s'" % (key, value))
-    (_, retcode) = geo(f"set '{key}' '{value}'", return_value_retcode_tuple=True)
-    if retcode == 0:
-        geo_config_cache[key] = value
+    # Writes are batched and written to the config file at the end of the current main loop iteration.
+    config_store.set(key, value)
     return value
 
 
 def rm_config(key: str):
     key = key.upper()
-    if not key or key not in geo_config_cache:
+    if not key:
         return
-    geo("rm '%s'" % key)
+    config_store.remove(key)
+
+
+release_tracker = ReleaseTracker(get_config, set_config)
+
+
+def get_tunnel_dir():
+    config_dir = get_config('CONFIG_DIR') or os.path.join(os.environ['HOME'], '.geo-cli')
+    return os.path.join(config_dir, 'tmp', 'ar')
+
+
+tunnel_registry = TunnelRegistry(get_tunnel_dir)
 
 
 def notifications_are_allowed():
@@ -184,7 +356,18 @@ def get_running_db_none_label_text():
     return 'Running DB [None]'
 
 
+# Starts watching docker events for geo db containers (if it isn't already). Returns True if the watcher's container
+# table is up-to-date and can be used instead of querying docker.
+def watch_db_containers():
+    db_container_watcher.start()
+    return db_container_watcher.is_live()
+
+
 def get_geo_db_names():
+    if watch_db_containers():
+        return db_container_watcher.get_db_names()
+    if docker_client.is_available():
+        return sorted(poll_geo_db_states(), reverse=True)
     cmd = 'docker container ls --filter name="geo_cli_db_"  -a --format="{{ .Names }}"'
     names_a = []
     try:
@@ -199,7 +382,109 @@ def get_geo_db_names():
     return names_a
 
 
+def get_geo_db_states():
+    """Returns a dict of geo db names to their container state (e.g. running, exited)."""
+    if watch_db_containers():
+        return db_container_watcher.get_db_states()
+    return poll_geo_db_states()
+
+
+def poll_geo_db_states():
+    """Gets the state of every geo db container using a single docker api request (or docker call)."""
+    if docker_client.is_available():
+        try:
+            containers = docker_client.list_containers(name=GEO_DB_CONTAINER_PREFIX)
+            return {to_db_name(get_container_name(c)): c['State'] for c in containers
+                    if get_container_name(c).startswith(GEO_DB_CONTAINER_PREFIX)}
+        except (OSError, DockerApiError, ValueError, KeyError) as err:
+            print(f'Error getting geo db containers from the docker api: {err}')
+    cmd = 'docker container ls --filter name="geo_cli_db_" -a --format="{{ .Names }} {{ .State }}"'
+    db_states = {}
+    try:
+        output = subprocess.run(cmd, shell=True, text=True, capture_output=True).stdout
+        for line in output.splitlines():
+            if not line:
+                continue
+            (full_name, _, state) = line.partition(' ')
+            db_states[full_name.replace('geo_cli_db_postgres_', '')] = state
+    except Exception as err:
+        print(f'Error running poll_geo_db_states(): {err}')
+    return db_states
+
+
+db_container_watcher = DbContainerWatcher(poll_geo_db_states)
+
+
+def refresh_db_metadata():
+    """Refreshes the parts of db_metadata that are out of date. Returns its version."""
+    return db_metadata.refresh()
+
+
+def inspect_geo_db_containers(prev_containers=()):
+    """
+    Returns the 'docker inspect' json of the db containers. prev_containers is the json returned by the last call; the
+    containers in it that haven't changed since aren't inspected again.
+    """
+    if docker_client.is_available():
+        try:
+            # One list request finds the containers that are new or changed, only those are inspected. Each request
+            # reuses the same keep-alive connection, so this doesn't start any processes.
+            listed = [c for c in docker_client.list_containers(name=GEO_DB_CONTAINER_PREFIX)
+                      if get_container_name(c).startswith(GEO_DB_NAME_PREFIX)]
+            (containers, stale_names) = get_stale_containers(listed, prev_containers)
+            for name in stale_names:
+                try:
+                    containers.append(docker_client.inspect_container(name))
+                except DockerApiError as err:
+                    # The container was removed after it was listed.
+                    if err.status != 404:
+                        raise
+            return containers
+        except (OSError, DockerApiError, ValueError, KeyError) as err:
+            print(f'Error inspecting geo db containers with the docker api: {err}')
+    names = [GEO_DB_NAME_PREFIX + db for db in get_geo_db_states()]
+    if not names:
+        return []
+    try:
+        result = subprocess.run(['docker', 'container', 'inspect'] + names, text=True, capture_output=True, timeout=DEFAULT_TIMEOUT)
+        # Containers that were removed in the meantime are reported on stderr; the rest are still in stdout.
+        return json.loads(result.stdout or '[]')
+    except (OSError, ValueError, subprocess.TimeoutExpired) as err:
+        print(f'Error running inspect_geo_db_containers(): {err}')
+        return []
+
+
+def get_volume_sizes():
+    """Returns a dict of docker volume names to their sizes in bytes (only the sizes that docker has computed)."""
+    if docker_client.is_available():
+        try:
+            volumes = docker_client.get_disk_usage('volume').get('Volumes') or []
+            sizes = {}
+            for volume in volumes:
+                size = (volume.get('UsageData') or {}).get('Size', -1)
+                # -1 means that docker couldn't compute the size.
+                if size >= 0:
+                    sizes[volume.get('Name')] = size
+            return sizes
+        except (OSError, DockerApiError, ValueError, AttributeError) as err:
+            print(f'Error getting docker volume sizes from the docker api: {err}')
+    try:
+        result = subprocess.run(['docker', 'system', 'df', '-v', '--format', '{{json .}}'], text=True, capture_output=True, timeout=DEFAULT_TIMEOUT)
+        return parse_volume_sizes(result.stdout)
+    except (OSError, ValueError, AttributeError, subprocess.TimeoutExpired) as err:
+        print(f'Error running get_volume_sizes(): {err}')
+        return {}
+
+
+db_metadata = DbMetadataTable(inspect_geo_db_containers, get_volume_sizes)
+db_prefetcher = DbPrefetcher(get_db_for_release, db_metadata.get)
+
+
 def get_running_db_name():
+    if watch_db_containers():
+        return db_container_watcher.get_running_db_name()
+    if docker_client.is_available():
+        return to_db_name(get_running_geo_container())
     cmd = 'docker container ls --filter name="geo_cli_db_" --filter status=running  -a --format="{{ .Names }}"'
     name = ''
     # get_name = make_cached_property(lambda: subprocess.run(cmd, shell=True, text=True, capture_output=True))
@@ -228,54 +513,11 @@ def db(args, terminal=False):
         geo(cmd)
 
 
-def get_geo_config_modified_time():
-    try:
-        if not os.path.exists(GEO_CONFIG_FILE_PATH):
-            return 0
-        return os.path.getmtime(GEO_CONFIG_FILE_PATH)
-    except Exception as err:
-        print(f'Error running get_geo_config_modified_time(): {err}')
+# Returns a value that changes whenever the config file is reloaded.
+def get_config_version():
+    return config_store.get_version()
 
 
-def load_geo_config_if_required():
-    global geo_config_file_modified_time
-    global geo_config_cache
-    global prev_config_file_str
-
-    try:
-        if not os.path.exists(GEO_CONFIG_FILE_PATH):
-            return
-        last_modified_time = get_geo_config_modified_time()
-        if last_modified_time <= geo_config_file_modified_time:
-            return
-
-        loading = 'Loading' if geo_config_file_modified_time == 0 else 'Reloading'
-        seconds_since_last_load = last_modified_time - geo_config_file_modified_time
-        time_since = f'{seconds_since_last_load:.3f} seconds since last load' if geo_config_file_modified_time > 0 else ''
-        print(f'load_geo_config_if_required: {loading} config. {time_since}')
-        geo_config_file_modified_time = last_modified_time
-
-        with open(GEO_CONFIG_FILE_PATH, 'r') as f:
-            lines = f.readlines()
-        if not lines:
-            print(f'load_geo_config_if_required: Config file was empty.')
-            return
-        if prev_config_file_str == lines:
-            print(f'load_geo_config_if_required: No change config file contents')
-        prev_config_file_str = lines
-
-        for line in lines:
-            line = line.replace('\n', '')
-            index_of_delimiter = line.index('=')
-            key = line[0:index_of_delimiter]
-            value = line[index_of_delimiter + 1:]
-            if key in geo_config_cache and geo_config_cache[key] != value:
-                print(f'load_geo_config_if_required: {key} updated: {geo_config_cache[key]} => {value}')
-            geo_config_cache[key] = value
-            geo_config_cache[key.replace('GEO_CLI_', '')] = value
-    except Exception as err:
-        print(f'Error running load_geo_config(): {err}')
-
 # def get_config(key):
 #     return geo_config_cache.get(key)
 
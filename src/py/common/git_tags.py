@@ -0,0 +1,418 @@
+import binascii
+import bisect
+import collections
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+
+
+def log(msg):
+    print(f'git_tags.py: {msg}')
+
+
+TAG_PREFIX = 'MYG'
+# Give up (and let the caller fall back to git describe) if the nearest tag is further away than this.
+MAX_WALK_COMMITS = 200000
+# The number of tags git describe considers before picking the closest one (its --candidates default).
+MAX_CANDIDATES = 10
+CACHE_FILE_PATH = os.path.join(os.environ['HOME'], '.geo-cli', 'data', 'myg-release-tags.json')
+MAX_CACHE_ENTRIES = 500
+
+# commit-graph file format constants (see Documentation/gitformat-commit-graph.txt in git).
+GRAPH_SIGNATURE = b'CGPH'
+GRAPH_NO_PARENT = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+HASH_LEN = 20
+
+
+class WalkError(Exception):
+    """The nearest tag couldn't be found natively (e.g. an object is packed and not in the commit-graph)."""
+
+
+def read_file(path, mode='r'):
+    try:
+        with open(path, mode) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def get_tags_fingerprint(common_dir):
+    """A value that changes whenever a tag is added or removed (packed or loose)."""
+    paths = [os.path.join(common_dir, 'packed-refs'), os.path.join(common_dir, 'refs', 'tags'),
+             os.path.join(common_dir, 'refs', 'tags', TAG_PREFIX)]
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            mtimes.append('0')
+    return ':'.join(mtimes)
+
+
+def read_packed_refs(common_dir):
+    """Returns (refs, fully_peeled), where refs is a list of (ref name, sha, peeled sha or None)."""
+    text = read_file(os.path.join(common_dir, 'packed-refs')) or ''
+    refs = []
+    fully_peeled = False
+    for line in text.splitlines():
+        if line.startswith('#'):
+            fully_peeled = 'fully-peeled' in line
+        elif line.startswith('^'):
+            if refs:
+                (name, sha, _) = refs[-1]
+                refs[-1] = (name, sha, line[1:].strip())
+        elif line:
+            (sha, _, name) = line.partition(' ')
+            refs.append((name.strip(), sha, None))
+    return (refs, fully_peeled)
+
+
+def read_loose_refs(common_dir, prefix):
+    refs = []
+    base = os.path.join(common_dir, prefix)
+    for (dir_path, _, file_names) in os.walk(base):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            sha = (read_file(path) or '').strip()
+            if len(sha) == 2 * HASH_LEN:
+                refs.append((os.path.relpath(path, common_dir).replace(os.sep, '/'), sha))
+    return refs
+
+
+def resolve_ref(git_dir, common_dir, ref, depth=0):
+    """Returns the sha that ref (e.g. HEAD or refs/heads/main) points to, or '' if it can't be found."""
+    if depth > 5:
+        return ''
+    for base in (git_dir, common_dir):
+        content = read_file(os.path.join(base, ref))
+        if content is None:
+            continue
+        content = content.strip()
+        if content.startswith('ref:'):
+            return resolve_ref(git_dir, common_dir, content[len('ref:'):].strip(), depth + 1)
+        return content
+    for (name, sha, _) in read_packed_refs(common_dir)[0]:
+        if name == ref:
+            return sha
+    return ''
+
+
+def read_loose_object(common_dir, sha):
+    """Returns (type, body) for a loose object, or None if it isn't stored loose."""
+    data = read_file(os.path.join(common_dir, 'objects', sha[:2], sha[2:]), 'rb')
+    if data is None:
+        return None
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        return None
+    (header, _, body) = data.partition(b'\0')
+    return (header.split(b' ')[0].decode(), body)
+
+
+def get_tag_sort_key(tag):
+    """Orders tags by the numbers in them, so that MYG/9.0 < MYG/10.0 < MYG/10.0.12."""
+    return (tuple(int(n) for n in re.findall(r'\d+', tag)), tag)
+
+
+def parse_commit(body):
+    """Returns (committer date, parent shas) from the body of a commit object."""
+    parents = []
+    date = 0
+    for line in body.split(b'\n'):
+        if not line:
+            # The end of the headers.
+            break
+        if line.startswith(b'parent '):
+            parents.append(line[len(b'parent '):].decode())
+        elif line.startswith(b'committer '):
+            # committer Name <email> 1700000000 +0000
+            date = int(line.rsplit(b' ', 2)[1])
+    return (date, parents)
+
+
+class CommitGraphLayer:
+    def __init__(self, path, base_count):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        if data[0:4] != GRAPH_SIGNATURE or data[5] != 1:
+            data.close()
+            raise ValueError(f'{path} is not a sha1 commit-graph')
+        chunk_count = data[6]
+        chunks = {}
+        for i in range(chunk_count + 1):
+            (chunk_id, offset) = struct.unpack_from('>4sQ', data, 8 + 12 * i)
+            chunks[chunk_id] = offset
+        self.fanout = chunks[b'OIDF']
+        self.oids = chunks[b'OIDL']
+        self.commit_data = chunks[b'CDAT']
+        self.extra_edges = chunks.get(b'EDGE')
+        self.count = struct.unpack_from('>I', data, self.fanout + 255 * 4)[0]
+        # Positions in this layer start after the commits in the base layers.
+        self.base_count = base_count
+
+    def find(self, oid):
+        """Returns the local position of the (binary) oid, or -1."""
+        first_byte = oid[0]
+        start = struct.unpack_from('>I', self.data, self.fanout + 4 * (first_byte - 1))[0] if first_byte else 0
+        end = struct.unpack_from('>I', self.data, self.fanout + 4 * first_byte)[0]
+        oids = self.data
+        base = self.oids
+        while start < end:
+            mid = (start + end) // 2
+            mid_oid = oids[base + mid * HASH_LEN:base + (mid + 1) * HASH_LEN]
+            if mid_oid < oid:
+                start = mid + 1
+            elif mid_oid > oid:
+                end = mid
+            else:
+                return mid
+        return -1
+
+    def close(self):
+        self.data.close()
+
+    def get_oid(self, position):
+        return self.data[self.oids + position * HASH_LEN:self.oids + (position + 1) * HASH_LEN]
+
+    def get_date(self, position):
+        """Returns the commit date of the commit at the local position."""
+        offset = self.commit_data + position * (HASH_LEN + 16) + HASH_LEN + 8
+        (generation_and_date_high, date_low) = struct.unpack_from('>II', self.data, offset)
+        # The top 30 bits are the generation number; the low 2 bits are the top bits of the 34 bit date.
+        return ((generation_and_date_high & 0x3) << 32) | date_low
+
+    def get_parents(self, position):
+        """Returns the (global) positions of the parents of the commit at the local position."""
+        offset = self.commit_data + position * (HASH_LEN + 16) + HASH_LEN
+        (parent1, parent2) = struct.unpack_from('>II', self.data, offset)
+        parents = []
+        if parent1 != GRAPH_NO_PARENT:
+            parents.append(parent1)
+        if parent2 == GRAPH_NO_PARENT:
+            return parents
+        if not parent2 & GRAPH_EXTRA_EDGES:
+            parents.append(parent2)
+            return parents
+        # Octopus merge: the rest of the parents are in the extra edges chunk.
+        edge = parent2 & ~GRAPH_EXTRA_EDGES
+        while True:
+            value = struct.unpack_from('>I', self.data, self.extra_edges + 4 * edge)[0]
+            parents.append(value & ~GRAPH_LAST_EDGE)
+            if value & GRAPH_LAST_EDGE:
+                return parents
+            edge += 1
+
+
+class CommitGraph:
+    """Reads commit parents from git's commit-graph file (or split commit-graph chain) without running git."""
+    def __init__(self, common_dir):
+        info_dir = os.path.join(common_dir, 'objects', 'info')
+        paths = []
+        chain = read_file(os.path.join(info_dir, 'commit-graphs', 'commit-graph-chain'))
+        if chain:
+            paths = [os.path.join(info_dir, 'commit-graphs', f'graph-{h}.graph') for h in chain.split()]
+        elif os.path.exists(os.path.join(info_dir, 'commit-graph')):
+            paths = [os.path.join(info_dir, 'commit-graph')]
+        self.layers = []
+        # The global position of the first commit in each layer.
+        self.layer_starts = []
+        count = 0
+        try:
+            for path in paths:
+                layer = CommitGraphLayer(path, count)
+                self.layers.append(layer)
+                self.layer_starts.append(count)
+                count += layer.count
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        for layer in self.layers:
+            layer.close()
+        self.layers = []
+        self.layer_starts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, sha):
+        """Returns the global position of the commit, or -1 if it isn't in the graph."""
+        oid = binascii.unhexlify(sha)
+        for layer in reversed(self.layers):
+            position = layer.find(oid)
+            if position >= 0:
+                return layer.base_count + position
+        return -1
+
+    def get_layer(self, position):
+        i = bisect.bisect_right(self.layer_starts, position) - 1
+        return (self.layers[i], position - self.layer_starts[i])
+
+    def get_sha(self, position):
+        (layer, local_position) = self.get_layer(position)
+        return binascii.hexlify(layer.get_oid(local_position)).decode()
+
+    def get_parents(self, position):
+        (layer, local_position) = self.get_layer(position)
+        return layer.get_parents(local_position)
+
+    def get_date(self, position):
+        (layer, local_position) = self.get_layer(position)
+        return layer.get_date(local_position)
+
+
+class TagResolver:
+    """
+    Finds the nearest MYG tag reachable from HEAD the same way git describe does, reading commits from the commit-graph
+    (or from loose objects for commits that are newer than the graph). Results are persisted per commit, so switching
+    back to a branch never walks the history again.
+    """
+    def __init__(self, cache_file_path=CACHE_FILE_PATH):
+        self.cache_file_path = cache_file_path
+        self.cache = None
+
+    def find_tag(self, git_dir, common_dir):
+        """Returns the nearest tag (e.g. MYG/11.0.123), or '' if there isn't one. Raises WalkError if it can't be
+        found without git."""
+        head = resolve_ref(git_dir, common_dir, 'HEAD')
+        if not head:
+            raise WalkError('unable to resolve HEAD')
+        fingerprint = get_tags_fingerprint(common_dir)
+        cached = self.get_cache().get(head)
+        if cached and cached.get('fingerprint') == fingerprint:
+            return cached['tag']
+        # The graph's files are mapped into memory, so they're closed as soon as the walk is done.
+        with CommitGraph(common_dir) as graph:
+            tags = self.build_tag_index(common_dir, graph)
+            tag = self.walk(head, tags, graph, common_dir)
+        self.cache.pop(head, None)
+        self.cache[head] = {'tag': tag, 'fingerprint': fingerprint}
+        self.save_cache()
+        return tag
+
+    def build_tag_index(self, common_dir, graph):
+        """Returns a dict of commit shas to the MYG tags that point at them."""
+        (packed_refs, fully_peeled) = read_packed_refs(common_dir)
+        refs = {}
+        for (name, sha, peeled) in packed_refs:
+            refs[name] = (sha, peeled, fully_peeled)
+        # Loose refs take precedence over packed ones.
+        for (name, sha) in read_loose_refs(common_dir, 'refs/tags'):
+            refs[name] = (sha, None, False)
+        tags = collections.defaultdict(list)
+        for (name, (sha, peeled, known_peeled)) in refs.items():
+            if not name.startswith('refs/tags/' + TAG_PREFIX):
+                continue
+            commit = peeled or (sha if known_peeled else self.peel(sha, common_dir, graph))
+            tags[commit].append(name[len('refs/tags/'):])
+        return tags
+
+    @staticmethod
+    def peel(sha, common_dir, graph):
+        """Returns the commit that an (annotated or lightweight) tag points to."""
+        for _ in range(5):
+            if graph.find(sha) >= 0:
+                return sha
+            obj = read_loose_object(common_dir, sha)
+            if obj is None:
+                raise WalkError(f'unable to peel packed tag object {sha}')
+            (obj_type, body) = obj
+            if obj_type != 'tag':
+                return sha
+            sha = body.split(b'\n', 1)[0][len(b'object '):].decode()
+        return sha
+
+    @staticmethod
+    def read_commit(sha, position, graph, common_dir):
+        """Returns (commit date, parents), where parents are (sha, graph position or -1)."""
+        if position >= 0:
+            return (graph.get_date(position), [(graph.get_sha(p), p) for p in graph.get_parents(position)])
+        obj = read_loose_object(common_dir, sha)
+        if obj is None:
+            raise WalkError(f'commit {sha} is packed and not in the commit-graph')
+        (date, parents) = parse_commit(obj[1])
+        return (date, [(p, graph.find(p)) for p in parents])
+
+    @staticmethod
+    def walk(head, tags, graph, common_dir):
+        """
+        Mirrors git describe: commits are walked newest first, and each of the first MAX_CANDIDATES tags found is scored
+        by how many of the walked commits it can't reach. The tag with the lowest score wins (the first one found on a
+        tie). The nearest tag by hops isn't always the same, e.g. when an old release branch is merged into main.
+        """
+        # Queue entries are (-commit date, insertion order, sha, parents), so that commits with the same date are
+        # walked in the order they were found, like in git.
+        queue = []
+        order = 0
+        # The bit flags of the candidates that can reach each commit that was found.
+        reached_by = {head: 0}
+        (date, parents) = TagResolver.read_commit(head, graph.find(head), graph, common_dir)
+        heapq.heappush(queue, (-date, order, head, parents))
+        # Candidates are [tag, depth, flag].
+        candidates = []
+        walked = 0
+        while queue:
+            (_, _, sha, parents) = heapq.heappop(queue)
+            walked += 1
+            if walked > MAX_WALK_COMMITS:
+                raise WalkError(f'no tag within {MAX_WALK_COMMITS} commits')
+            if sha in tags:
+                if len(candidates) == MAX_CANDIDATES:
+                    break
+                flag = 1 << len(candidates)
+                # git prefers the newest of several tags on the same commit, which is usually the highest version.
+                candidates.append([max(tags[sha], key=get_tag_sort_key), walked - 1, flag])
+                reached_by[sha] |= flag
+            for candidate in candidates:
+                if not reached_by[sha] & candidate[2]:
+                    candidate[1] += 1
+            if candidates and not queue:
+                # The only path left is already reachable from the best candidates, so their scores can't change.
+                best_depth = min(candidate[1] for candidate in candidates)
+                best = sum(candidate[2] for candidate in candidates if candidate[1] == best_depth)
+                if reached_by[sha] & best == best:
+                    break
+            for (parent, position) in parents:
+                if parent not in reached_by:
+                    reached_by[parent] = 0
+                    order += 1
+                    (date, grandparents) = TagResolver.read_commit(parent, position, graph, common_dir)
+                    heapq.heappush(queue, (-date, order, parent, grandparents))
+                reached_by[parent] |= reached_by[sha]
+        if not candidates:
+            return ''
+        # min returns the first of several candidates with the same depth, i.e. the one found first.
+        return min(candidates, key=lambda candidate: candidate[1])[0]
+
+    def get_cache(self):
+        if self.cache is None:
+            try:
+                self.cache = json.loads(read_file(self.cache_file_path) or '{}')
+            except ValueError:
+                self.cache = {}
+        return self.cache
+
+    def save_cache(self):
+        # Dicts keep insertion order, so the oldest entries are dropped first.
+        while len(self.cache) > MAX_CACHE_ENTRIES:
+            del self.cache[next(iter(self.cache))]
+        try:
+            os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+            tmp_path = self.cache_file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_path, self.cache_file_path)
+        except OSError as err:
+            log(f'Error saving tag cache: {err}')
@@ -0,0 +1,153 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+
+def log(msg):
+    print(f'metrics.py: {msg}')
+
+
+METRICS_FILE_PATH = os.path.join(os.environ['HOME'], '.geo-cli', 'data', 'indicator-metrics.json')
+# At most this many distinct commands are tracked; the least recently run ones are dropped first.
+MAX_COMMANDS = 200
+# Percentiles are calculated from this many of each command's most recent durations.
+MAX_SAMPLES = 500
+# The upper bounds (in ms) of the latency histogram's buckets. The last bucket holds everything slower.
+HISTOGRAM_BUCKETS_MS = [10, 50, 100, 250, 500, 1000, 5000, 30000]
+# Only the second word of a command that looks like a subcommand (e.g. 'db start', but not 'get DB_FOR_RELEASE_X')
+# is included in its key, so that commands aren't split up by their arguments.
+SUBCOMMAND_REGEX = re.compile(r'^[a-z][a-z-]*$')
+
+
+def get_command_key(arg_str):
+    """Returns the name that a command's metrics are recorded under, e.g. 'db start 10_0 -y' => 'db start'."""
+    words = arg_str.split()
+    if not words:
+        return ''
+    if len(words) > 1 and SUBCOMMAND_REGEX.match(words[1]):
+        return ' '.join(words[:2])
+    return words[0]
+
+
+def percentile(sorted_values, fraction):
+    """Returns the nearest-rank percentile of a sorted list (None if it's empty)."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_run = 0
+        self.exit_codes = collections.Counter()
+        self.samples = collections.deque(maxlen=MAX_SAMPLES)
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def record(self, duration, return_code, timed_out, error):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last_run = time.time()
+        self.samples.append(duration)
+        self.timeouts += timed_out
+        self.errors += error
+        if return_code is not None:
+            self.exit_codes[str(return_code)] += 1
+        duration_ms = duration * 1000
+        bucket = next((i for (i, bound) in enumerate(HISTOGRAM_BUCKETS_MS) if duration_ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+        self.histogram[bucket] += 1
+
+    def get_histogram(self):
+        """Returns the bucket labels (e.g. '<=100') mapped to the number of runs that took that long (in ms)."""
+        histogram = {f'<={bound}': n for (bound, n) in zip(HISTOGRAM_BUCKETS_MS, self.histogram)}
+        histogram[f'>{HISTOGRAM_BUCKETS_MS[-1]}'] = self.histogram[-1]
+        return histogram
+
+    def to_dict(self):
+        samples = sorted(self.samples)
+        to_ms = lambda seconds: None if seconds is None else round(seconds * 1000, 1)
+        return {
+            'count': self.count,
+            'total_ms': to_ms(self.total),
+            'p50_ms': to_ms(percentile(samples, 0.5)),
+            'p95_ms': to_ms(percentile(samples, 0.95)),
+            'max_ms': to_ms(self.max),
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'exit_codes': dict(self.exit_codes),
+            'histogram_ms': self.get_histogram(),
+            'last_run': self.last_run,
+        }
+
+
+class CommandMetrics:
+    """
+    Counts the commands that the indicator runs (geo subcommands, shell commands and docker api requests) and records how long they took,
+    their exit codes, and how many timed out. Everything is kept in memory and bounded (MAX_COMMANDS commands with
+    MAX_SAMPLES durations each). Thread safe, since commands are run from the background threads.
+    """
+    def __init__(self, max_commands=MAX_COMMANDS):
+        self.max_commands = max_commands
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # Maps (source, command key) to its CommandStats, least recently run first.
+        self.stats = collections.OrderedDict()
+
+    def record(self, source, arg_str, duration, return_code=None, timed_out=False, error=False):
+        self.record_key(source, get_command_key(arg_str), duration, return_code, timed_out, error)
+
+    def record_key(self, source, command_key, duration, return_code=None, timed_out=False, error=False):
+        """Like record, for callers that already have a key (e.g. the docker client's 'GET /containers/{name}/json')."""
+        key = (source, command_key)
+        with self.lock:
+            stats = self.stats.pop(key, None) or CommandStats()
+            self.stats[key] = stats
+            stats.record(duration, return_code, timed_out, error)
+            while len(self.stats) > self.max_commands:
+                self.stats.popitem(last=False)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.started = time.time()
+
+    def get_summary(self):
+        """Returns the metrics as a dict (that can be dumped as JSON), the commands with the most total time first."""
+        with self.lock:
+            commands = [{'source': source, 'command': command, **stats.to_dict()}
+                        for ((source, command), stats) in self.stats.items()]
+            started = self.started
+        commands.sort(key=lambda c: c['total_ms'], reverse=True)
+        elapsed = max(1.0, time.time() - started)
+        return {
+            'started': started,
+            'elapsed_seconds': round(elapsed),
+            'runs_per_minute': round(sum(c['count'] for c in commands) * 60 / elapsed, 2),
+            'commands': commands,
+        }
+
+    def dump(self, file_path=METRICS_FILE_PATH, extra=None):
+        """Writes the summary (and any extra sections) to file_path as JSON. Returns the path, or '' if it failed."""
+        summary = self.get_summary()
+        if extra:
+            summary.update(extra)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            return file_path
+        except OSError as err:
+            log(f'Error saving metrics to {file_path}: {err}')
+            return ''
+
+
+command_metrics = CommandMetrics()
@@ -0,0 +1,137 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import subprocess
+import threading
+
+
+def log(msg):
+    print(f'npm_install.py: {msg}')
+
+
+MANIFEST_FILE_PATH = os.path.join(os.environ['HOME'], '.geo-cli', 'data', 'npm-install-manifest.json')
+# The projects (relative to the MyGeotab repo) that 'geo init npm' installs the npm packages for.
+NPM_PROJECTS = [
+    'Checkmate/CheckmateServer/src/wwwroot',
+    'Checkmate/CheckmateServer/src/wwwroot/drive',
+]
+# The files that determine what 'npm install' installs.
+DEPENDENCY_FILES = ['package.json', 'package-lock.json']
+MAX_WORKERS = 2
+NPM_INSTALL_TIMEOUT = 1200
+
+
+def hash_dependency_files(project_dir):
+    """Returns a hash of the project's package.json and package-lock.json, or None if it doesn't have a package.json."""
+    sha = hashlib.sha256()
+    for name in DEPENDENCY_FILES:
+        try:
+            with open(os.path.join(project_dir, name), 'rb') as f:
+                sha.update(name.encode() + b'\0' + f.read() + b'\0')
+        except FileNotFoundError:
+            if name == 'package.json':
+                return None
+    return sha.hexdigest()
+
+
+def has_nested_projects(projects):
+    """Returns True if any of the projects is inside another one (e.g. wwwroot/drive is inside wwwroot)."""
+    return any(a != b and b.startswith(a.rstrip('/') + '/') for a in projects for b in projects)
+
+
+def run_npm_install(project_dir):
+    """Runs 'npm install' in the project. Returns (succeeded, output)."""
+    try:
+        result = subprocess.run(['npm', 'install'], cwd=project_dir, text=True, capture_output=True, timeout=NPM_INSTALL_TIMEOUT)
+        return (result.returncode == 0, result.stdout + result.stderr)
+    except (OSError, subprocess.TimeoutExpired) as err:
+        return (False, str(err))
+
+
+class NpmInstaller:
+    """
+    Installs the npm packages of the MyGeotab projects, skipping the projects whose package.json and package-lock.json
+    haven't changed since their packages were last installed. The hash of what is installed in each project is kept in a
+    manifest file, so switching back to a release with the same dependencies skips the install. The projects that
+    changed are installed at the same time on a bounded thread pool, unless one of them is inside another: npm installs
+    in a directory and its parent can clash, so they're installed one after the other (parent first) like
+    'geo init npm' does.
+    """
+    def __init__(self, manifest_file_path=MANIFEST_FILE_PATH, projects=NPM_PROJECTS, install=run_npm_install, max_workers=MAX_WORKERS):
+        self.manifest_file_path = manifest_file_path
+        self.projects = projects
+        self.install_project = install
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.manifest = None
+
+    def get_project_hashes(self, repo_dir):
+        """Returns a dict of the npm projects in the repo to the hash of their dependency files."""
+        hashes = {}
+        for project in self.projects:
+            files_hash = hash_dependency_files(os.path.join(repo_dir, project))
+            if files_hash is not None:
+                hashes[project] = files_hash
+        return hashes
+
+    def get_outdated_projects(self, repo_dir, hashes):
+        """Returns the projects whose packages have to be installed."""
+        installed = self.get_manifest().get('installed', {})
+        # node_modules may have been deleted since the last install.
+        return [project for project, files_hash in hashes.items()
+                if installed.get(project) != files_hash or not os.path.isdir(os.path.join(repo_dir, project, 'node_modules'))]
+
+    def install(self, repo_dir, release, on_progress=None):
+        """
+        Installs the npm packages of the projects that changed. on_progress(project) is called (from a worker thread)
+        when a project starts installing. Returns a dict of the projects that were installed to whether they succeeded.
+        """
+        with self.lock:
+            hashes = self.get_project_hashes(repo_dir)
+            outdated = self.get_outdated_projects(repo_dir, hashes)
+            if not outdated:
+                log(f'npm packages are up-to-date for {release}, skipping npm install')
+                return {}
+
+            def install(project):
+                if on_progress:
+                    on_progress(project)
+                (succeeded, output) = self.install_project(os.path.join(repo_dir, project))
+                if not succeeded:
+                    log(f'npm install failed for {project}:\n{output[-2000:]}')
+                return succeeded
+
+            if has_nested_projects(outdated):
+                # Parents sort before the projects inside them.
+                results = {project: install(project) for project in sorted(outdated)}
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='npm-install') as executor:
+                    results = dict(zip(outdated, executor.map(install, outdated)))
+            self.update_manifest({project: hashes[project] for project, succeeded in results.items() if succeeded})
+            return results
+
+    def update_manifest(self, installed):
+        """Records the hashes of the projects that are now installed."""
+        manifest = self.get_manifest()
+        manifest.setdefault('installed', {}).update(installed)
+        self.save_manifest()
+
+    def get_manifest(self):
+        if self.manifest is None:
+            try:
+                with open(self.manifest_file_path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+        return self.manifest
+
+    def save_manifest(self):
+        try:
+            os.makedirs(os.path.dirname(self.manifest_file_path), exist_ok=True)
+            tmp_path = self.manifest_file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_file_path)
+        except OSError as err:
+            log(f'Error saving npm install manifest: {err}')
@@ -0,0 +1,105 @@
+import fcntl
+import os
+
+
+def log(msg):
+    print(f'process_probe.py: {msg}')
+
+
+TMP_DIR = os.path.join(os.environ['HOME'], '.geo-cli', 'tmp')
+# The lock files that 'geo myg start', 'geo gw start' and 'geo myg gw' hold while they are running.
+MYG_RUNNING_LOCK_FILE = os.path.join(TMP_DIR, 'myg', 'myg-running.lock')
+GW_RUNNING_LOCK_FILE = os.path.join(TMP_DIR, 'gw', 'gw-running.lock')
+MYG_GW_RUNNING_LOCK_FILE = os.path.join(TMP_DIR, 'myg', 'myg-gw-running.lock')
+
+# Process classifications.
+OTHER = 0
+MYG = 1
+GW = 2
+# The same patterns that _get_myg_pid and _get_gw_pid use.
+GW_CMDLINE_PATTERN = 'CheckmateServer StoreForwardDebug'
+# 'pgrep Checkmate' is used to detect MyGeotab when it wasn't started by geo-cli.
+MYG_PROCESS_NAME_PATTERN = 'Checkmate'
+# New processes are classified again on this many scans, in case they were seen between fork and exec.
+RECLASSIFY_SCANS = 2
+
+
+def is_file_locked(path):
+    """Same as is_file_locked in cli-handlers.sh: the file is locked if we can't get an exclusive flock on it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def read_proc_file(proc_dir, pid, name):
+    try:
+        with open(f'{proc_dir}/{pid}/{name}', 'rb') as f:
+            return f.read().decode(errors='replace')
+    except OSError:
+        return None
+
+
+def classify(proc_dir, pid):
+    """Returns the classification of the process, or None if it exited."""
+    name = read_proc_file(proc_dir, pid, 'comm')
+    if name is None:
+        return None
+    if MYG_PROCESS_NAME_PATTERN not in name:
+        return OTHER
+    cmdline = (read_proc_file(proc_dir, pid, 'cmdline') or '').replace('\0', ' ')
+    return GW if GW_CMDLINE_PATTERN in cmdline else MYG
+
+
+class ProcessProbe:
+    """
+    Works out whether MyGeotab, Gateway and MyGeotab with Gateway are running from a single scan of /proc and the
+    lock files that geo-cli holds while running them, without starting any processes.
+
+    Processes are only classified when their pid is new, so each scan is mostly just listing /proc.
+    """
+    def __init__(self, proc_dir='/proc'):
+        self.proc_dir = proc_dir
+        # Maps pids to (classification, number of scans it was classified on).
+        self.pids = {}
+
+    def probe(self):
+        """Returns a dict with the myg_running, gw_running and myg_gw_running states."""
+        counts = {OTHER: 0, MYG: 0, GW: 0}
+        pids = {}
+        try:
+            entries = os.listdir(self.proc_dir)
+        except OSError as err:
+            log(f'Error listing {self.proc_dir}: {err}')
+            entries = []
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            (kind, scans) = self.pids.get(pid, (None, 0))
+            if scans < RECLASSIFY_SCANS:
+                kind = classify(self.proc_dir, pid)
+                if kind is None:
+                    continue
+                scans += 1
+            pids[pid] = (kind, scans)
+            counts[kind] += 1
+        # Dropping the pids that exited means a reused pid is classified again.
+        self.pids = pids
+        myg_process_running = counts[MYG] > 0
+        gw_process_running = counts[GW] > 0
+        return {
+            'myg_running': is_file_locked(MYG_RUNNING_LOCK_FILE) or myg_process_running,
+            'gw_running': is_file_locked(GW_RUNNING_LOCK_FILE) or gw_process_running,
+            'myg_gw_running': is_file_locked(MYG_GW_RUNNING_LOCK_FILE) or (myg_process_running and gw_process_running),
+        }
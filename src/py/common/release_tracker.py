@@ -0,0 +1,169 @@
+import os
+import subprocess
+import threading
+
+from .git_tags import TagResolver, WalkError, get_tags_fingerprint
+
+
+def log(msg):
+    print(f'release_tracker.py: {msg}')
+
+
+DESCRIBE_TIMEOUT = 60
+
+
+def resolve_git_dirs(repo_dir):
+    """
+    Returns (git_dir, common_dir) for the repo, or (None, None) if it isn't a git repo. They are different for
+    worktrees, where .git is a file pointing to the worktree's git dir, which holds its own HEAD, while the tags are in
+    the main repo's git dir.
+    """
+    dot_git = os.path.join(repo_dir, '.git')
+    if os.path.isdir(dot_git):
+        return (dot_git, dot_git)
+    try:
+        with open(dot_git) as f:
+            content = f.read().strip()
+    except OSError:
+        return (None, None)
+    if not content.startswith('gitdir:'):
+        return (None, None)
+    git_dir = os.path.normpath(os.path.join(repo_dir, content[len('gitdir:'):].strip()))
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        pass
+    return (git_dir, common_dir)
+
+
+def read_head(git_dir):
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def get_branch(head):
+    """Returns the branch name from the contents of HEAD, or '' if HEAD is detached (like git branch --show-current)."""
+    prefix = 'ref: refs/heads/'
+    return head[len(prefix):] if head.startswith(prefix) else ''
+
+
+def to_release(tag):
+    """Converts a MYG tag to a release the same way as 'geo dev release' (e.g. MYG/11.0.123 => 11.0.123)."""
+    # Remove MYG/ prefix (present from 6.0 onwards).
+    if tag.startswith('MYG/'):
+        tag = tag.rsplit('/', 1)[-1]
+    # Remove 5.7. prefix (present from 2104 and earlier).
+    if tag.startswith('5.7.'):
+        tag = tag.rsplit('.', 1)[-1]
+    return tag
+
+
+tag_resolver = TagResolver()
+
+
+def describe(repo_dir):
+    """Returns the most recent MYG tag reachable from HEAD."""
+    (git_dir, common_dir) = resolve_git_dirs(repo_dir)
+    if git_dir:
+        try:
+            return tag_resolver.find_tag(git_dir, common_dir)
+        except (WalkError, OSError, ValueError, KeyError, IndexError) as err:
+            log(f'Unable to find the MYG tag natively, running git describe instead: {err}')
+    return git_describe(repo_dir)
+
+
+def git_describe(repo_dir):
+    try:
+        result = subprocess.run(['git', 'describe', '--tags', '--abbrev=0', '--match', 'MYG*'], cwd=repo_dir,
+                                capture_output=True, text=True, timeout=DESCRIBE_TIMEOUT)
+        return result.stdout.strip()
+    except (OSError, subprocess.TimeoutExpired) as err:
+        log(f'Error running git describe: {err}')
+        return ''
+
+
+class ReleaseTracker:
+    """
+    Tracks the MYG release of the checked-out MyGeotab branch. HEAD is read directly from the repo and the nearest MYG
+    tag is only looked up when HEAD or the tags change. File monitors on HEAD and the tags notify listeners as soon
+    as the release may have changed.
+
+    Like 'geo dev release', the release is cached in the MYG_BRANCH and MYG_RELEASE config keys, so it isn't
+    recomputed after a restart if the branch is the same.
+    """
+    def __init__(self, get_config, set_config, describe=describe):
+        self.get_config = get_config
+        self.set_config = set_config
+        self.describe = describe
+        self.lock = threading.Lock()
+        # What the cached release was computed from.
+        self.key = None
+        self.release = ''
+        self.watched_dirs = None
+        self.monitors = []
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() is called on the main loop when HEAD or the tags change."""
+        self.listeners.append(callback)
+
+    def get_release(self):
+        repo_dir = self.get_config('DEV_REPO_DIR')
+        (git_dir, common_dir) = resolve_git_dirs(repo_dir) if repo_dir else (None, None)
+        if not git_dir:
+            return ''
+        head = read_head(git_dir)
+        key = (git_dir, head, get_tags_fingerprint(common_dir))
+        with self.lock:
+            if key != self.key:
+                self.release = self.compute_release(repo_dir, get_branch(head), first=self.key is None)
+                self.key = key
+            self.watch(git_dir, common_dir)
+            return self.release
+
+    def compute_release(self, repo_dir, branch, first):
+        prev_branch = self.get_config('MYG_BRANCH')
+        prev_release = self.get_config('MYG_RELEASE')
+        # Reuse the release that was stored by us (or the cli) if this is the same branch.
+        if first and prev_branch and prev_release and prev_branch == branch:
+            return prev_release
+        release = to_release(self.describe(repo_dir))
+        log(f'Release for branch "{branch}": {release}')
+        if release != prev_release:
+            self.set_config('MYG_RELEASE', release)
+        if branch != prev_branch:
+            self.set_config('MYG_BRANCH', branch)
+        return release
+
+    def watch(self, git_dir, common_dir):
+        if self.watched_dirs == (git_dir, common_dir):
+            return
+        self.watched_dirs = (git_dir, common_dir)
+        for monitor in self.monitors:
+            monitor.cancel()
+        self.monitors = []
+        try:
+            from gi.repository import Gio
+            paths = [os.path.join(git_dir, 'HEAD'), os.path.join(common_dir, 'packed-refs')]
+            for path in paths:
+                monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+                monitor.connect('changed', self.on_changed)
+                self.monitors.append(monitor)
+            for path in [os.path.join(common_dir, 'refs', 'tags'), os.path.join(common_dir, 'refs', 'tags', 'MYG')]:
+                monitor = Gio.File.new_for_path(path).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+                monitor.connect('changed', self.on_changed)
+                self.monitors.append(monitor)
+        except Exception as err:
+            log(f'Unable to monitor {git_dir}, changes will be picked up on the next poll: {err}')
+
+    def on_changed(self, *args):
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
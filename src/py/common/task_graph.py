@@ -0,0 +1,83 @@
+import concurrent.futures
+import time
+
+
+def log(msg):
+    print(f'task_graph.py: {msg}')
+
+
+MAX_WORKERS = 4
+
+
+def order_tasks(tasks, get_dependencies):
+    """
+    Returns the tasks in an order where each one comes after the tasks it depends on (dependencies that aren't in
+    tasks are ignored). Raises ValueError if the dependencies have a cycle.
+    """
+    remaining = {task: {dep for dep in get_dependencies(task) if dep in tasks and dep != task} for task in tasks}
+    ordered = []
+    while remaining:
+        ready = [task for task in tasks if task in remaining and not remaining[task]]
+        if not ready:
+            raise ValueError(f'Task dependencies have a cycle: {list(remaining)}')
+        for task in ready:
+            del remaining[task]
+            ordered.append(task)
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return ordered
+
+
+class TaskResult:
+    def __init__(self, result=None, error=None, duration=0):
+        self.result = result
+        self.error = error
+        # In seconds.
+        self.duration = duration
+
+
+class TaskGraph:
+    """
+    Runs a set of tasks on a thread pool, starting each one as soon as all of the tasks it depends on have finished, so
+    independent tasks run at the same time. A task still runs if one of its dependencies failed; the dependencies only
+    order the tasks.
+    """
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+
+    def run(self, tasks, get_dependencies, run_task, on_task_done=None):
+        """
+        Runs run_task(task) for every task and blocks until they are all done. on_task_done(task, task_result) is called
+        (from this thread) as each one finishes. Returns a dict of tasks to their TaskResult.
+        """
+        tasks = list(tasks)
+        # Validates the dependencies before anything is run.
+        order_tasks(tasks, get_dependencies)
+        waiting_on = {task: {dep for dep in get_dependencies(task) if dep in tasks and dep != task} for task in tasks}
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='task-graph') as executor:
+            running = {}
+            while waiting_on or running:
+                for task in [task for task, deps in waiting_on.items() if not deps]:
+                    del waiting_on[task]
+                    running[executor.submit(self.run_timed, run_task, task)] = task
+                (done, _) = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    results[task] = future.result()
+                    for deps in waiting_on.values():
+                        deps.discard(task)
+                    if on_task_done:
+                        try:
+                            on_task_done(task, results[task])
+                        except Exception as err:
+                            log(f'Error running on_task_done: {err}')
+        return results
+
+    @staticmethod
+    def run_timed(run_task, task):
+        start = time.monotonic()
+        try:
+            return TaskResult(result=run_task(task), duration=time.monotonic() - start)
+        except Exception as err:
+            return TaskResult(error=err, duration=time.monotonic() - start)
@@ -0,0 +1,173 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+
+def log(msg):
+    print(f'trash.py: {msg}')
+
+
+MAX_WORKERS = 4
+# The nice value of the threads that delete the trash.
+LOW_PRIORITY = 19
+# Listeners are notified at most this often (in seconds) while files are being deleted.
+PROGRESS_INTERVAL = 0.5
+
+
+def lower_thread_priority():
+    """Lowers the cpu priority of the calling thread (on Linux, setpriority with a thread id only affects that thread)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), LOW_PRIORITY)
+    except (OSError, AttributeError) as err:
+        log(f'Unable to lower thread priority: {err}')
+
+
+def delete_tree(path, on_deleted=None):
+    """Deletes a directory tree using os.scandir. on_deleted(count) is called after each directory's files are deleted."""
+    count = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        delete_tree(entry.path, on_deleted)
+                    else:
+                        os.unlink(entry.path)
+                        count += 1
+                except OSError as err:
+                    log(f'Error deleting {entry.path}: {err}')
+        os.rmdir(path)
+    except FileNotFoundError:
+        pass
+    except OSError as err:
+        log(f'Error deleting {path}: {err}')
+    if on_deleted and count:
+        on_deleted(count)
+
+
+class TrashCollector:
+    """
+    Removes directories by renaming them into a trash directory (which is instant), then deletes the trash on a
+    background thread with a low priority. The top-level subdirectories of the trash are deleted in parallel.
+    """
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.thread = None
+        # The trash directories that need to be emptied.
+        self.pending = []
+        # Progress of the current deletion.
+        self.deleting = False
+        self.files_deleted = 0
+        self.dirs_deleted = 0
+        self.dirs_total = 0
+        self.last_notified = 0
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() is called (from a background thread) as the trash is deleted, and when it's done."""
+        self.listeners.append(callback)
+
+    def get_progress(self):
+        """Returns (whether trash is being deleted, files deleted, top-level dirs deleted, total top-level dirs)."""
+        with self.lock:
+            return (self.deleting, self.files_deleted, self.dirs_deleted, self.dirs_total)
+
+    def trash(self, path, trash_dir):
+        """
+        Moves path into trash_dir and starts deleting it in the background. trash_dir has to be on the same file system
+        as path, so that the move is an atomic rename. Returns True if path was moved.
+        """
+        try:
+            os.makedirs(trash_dir, exist_ok=True)
+            os.rename(path, os.path.join(trash_dir, f'{os.path.basename(path)}-{time.time_ns()}'))
+        except FileNotFoundError:
+            return False
+        self.empty(trash_dir)
+        return True
+
+    def empty(self, trash_dir):
+        """Deletes everything in trash_dir in the background (e.g. trash that was left over by a previous run)."""
+        with self.lock:
+            if trash_dir not in self.pending:
+                self.pending.append(trash_dir)
+            if self.thread:
+                return
+            self.thread = threading.Thread(target=self.run, name='TrashCollector', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        lower_thread_priority()
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    break
+                trash_dir = self.pending.pop(0)
+            self.delete_contents(trash_dir)
+
+    def delete_contents(self, trash_dir):
+        start = time.time()
+        # The trashed directories, and their contents, which are deleted in parallel.
+        trashed = []
+        parts = []
+        try:
+            with os.scandir(trash_dir) as entries:
+                for entry in entries:
+                    trashed.append(entry.path)
+                    # An entry that can't be listed is deleted as a whole, without holding up the others.
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            with os.scandir(entry.path) as sub_entries:
+                                parts += [sub_entry.path for sub_entry in sub_entries]
+                    except OSError as err:
+                        log(f'Error listing {entry.path}: {err}')
+        except OSError as err:
+            log(f'Error listing {trash_dir}: {err}')
+        if not trashed:
+            return
+        with self.lock:
+            (self.deleting, self.files_deleted, self.dirs_deleted, self.dirs_total) = (True, 0, 0, len(parts))
+        self.notify(force=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='trash', initializer=lower_thread_priority) as executor:
+            list(executor.map(self.delete, parts))
+        # They are empty now.
+        for path in trashed:
+            self.delete(path, count=False)
+        with self.lock:
+            self.deleting = False
+        self.notify(force=True)
+        log(f'Deleted {self.files_deleted} files from {trash_dir} in {time.time() - start:.1f} seconds')
+
+    def delete(self, path, count=True):
+        if os.path.isdir(path) and not os.path.islink(path):
+            delete_tree(path, self.on_deleted)
+        else:
+            try:
+                os.unlink(path)
+                self.on_deleted(1)
+            except OSError as err:
+                log(f'Error deleting {path}: {err}')
+        if count:
+            with self.lock:
+                self.dirs_deleted += 1
+            self.notify()
+
+    def on_deleted(self, count):
+        with self.lock:
+            self.files_deleted += count
+        self.notify()
+
+    def notify(self, force=False):
+        now = time.monotonic()
+        # Called from every deleting thread, so only one of them notifies per interval.
+        with self.lock:
+            if not force and now - self.last_notified < PROGRESS_INTERVAL:
+                return
+            self.last_notified = now
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
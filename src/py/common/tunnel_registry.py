@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+from .process_probe import is_file_locked
+
+
+def log(msg):
+    print(f'tunnel_registry.py: {msg}')
+
+
+# Lock files are named <access request name>__<port>.
+LOCK_FILE_DELIMITER = '__'
+# Don't remove an unlocked lock file that was just created; its tunnel may not have locked it yet.
+MIN_UNUSED_LOCK_FILE_AGE = 5
+PROC_LOCKS_PATH = '/proc/locks'
+
+
+def parse_lock_file_name(file_name):
+    """Returns (ar name, port), or None if it isn't a tunnel lock file (same as the (.+)__(.+) regex in the cli)."""
+    (ar_name, delimiter, port) = file_name.rpartition(LOCK_FILE_DELIMITER)
+    if not delimiter or not ar_name or not port:
+        return None
+    return (ar_name, port)
+
+
+def read_locked_files():
+    """Returns the set of (major, minor, inode) of every file with a lock on it, or None if /proc/locks can't be read."""
+    try:
+        with open(PROC_LOCKS_PATH) as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    locked = set()
+    for line in lines:
+        # e.g. '1: FLOCK  ADVISORY  WRITE 1234 08:02:1234567 0 EOF'. Blocked waiters ('-> ...') have an extra field.
+        for field in line.split():
+            if field.count(':') == 2:
+                try:
+                    (major, minor, inode) = field.split(':')
+                    locked.add((int(major, 16), int(minor, 16), int(inode)))
+                except ValueError:
+                    pass
+                break
+    return locked
+
+
+class TunnelRegistry:
+    """
+    Keeps track of the open IAP tunnels. 'geo ar tunnel' holds a lock on a <ar name>__<port> file in the tmp/ar
+    config dir for as long as the tunnel is open, so a tunnel is open if its file is locked. Lock files that are no
+    longer locked are removed, like 'geo dev open-iap-tunnels' does.
+
+    A file monitor on the directory tells the listeners to scan right away when a tunnel is opened; tunnels that close
+    are picked up by the next scan (closing a tunnel only releases its lock, which the monitor can't see). Scanning is
+    left to the listeners so that it's done off the main loop.
+    """
+    def __init__(self, get_dir):
+        self.get_dir = get_dir
+        self.lock = threading.Lock()
+        # (ar name, port) tuples, newest first.
+        self.tunnels = ()
+        self.watched_dir = None
+        self.monitor = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback() is called on the main loop when a file in the tunnel dir changes (e.g. a tunnel was opened)."""
+        self.listeners.append(callback)
+
+    def get_tunnels(self):
+        return self.tunnels
+
+    def scan(self):
+        """Checks which tunnels are open. Returns them as (ar name, port) tuples, newest first."""
+        tunnel_dir = self.get_dir()
+        with self.lock:
+            self.watch(tunnel_dir)
+            self.tunnels = self.find_open_tunnels(tunnel_dir) if tunnel_dir and os.path.isdir(tunnel_dir) else ()
+            return self.tunnels
+
+    @staticmethod
+    def find_open_tunnels(tunnel_dir):
+        locked_files = read_locked_files()
+        now = time.time()
+        tunnels = []
+        with os.scandir(tunnel_dir) as entries:
+            for entry in entries:
+                tunnel = parse_lock_file_name(entry.name)
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                # /proc/locks lists every held lock, so the files don't need to be opened. Files that aren't listed are
+                # double-checked with flock before being treated as closed (e.g. in case the device ids don't match).
+                locked = locked_files is not None and (os.major(stat.st_dev), os.minor(stat.st_dev), stat.st_ino) in locked_files
+                if not locked:
+                    locked = is_file_locked(entry.path)
+                if not locked:
+                    if now - stat.st_mtime > MIN_UNUSED_LOCK_FILE_AGE:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+                    continue
+                if tunnel:
+                    tunnels.append((stat.st_mtime, tunnel))
+        tunnels.sort(key=lambda t: t[0], reverse=True)
+        return tuple(tunnel for (_, tunnel) in tunnels)
+
+    def watch(self, tunnel_dir):
+        if tunnel_dir == self.watched_dir:
+            return
+        self.watched_dir = tunnel_dir
+        if self.monitor:
+            self.monitor.cancel()
+            self.monitor = None
+        try:
+            from gi.repository import Gio
+            self.monitor = Gio.File.new_for_path(tunnel_dir).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            self.monitor.connect('changed', self.on_changed)
+        except Exception as err:
+            log(f'Unable to monitor {tunnel_dir}, tunnels will be picked up on the next scan: {err}')
+
+    def on_changed(self, *args):
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
@@ -1,9 +1,8 @@
 import os
 import subprocess
 import time
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
+
+from .metrics import command_metrics
 
 
 def mklog(stub):
@@ -37,9 +36,16 @@ def run_in_terminal(cmd_to_run, title=''):
 
 
 def run_shell_cmd(cmd):
+    start = time.monotonic()
     try:
-        return subprocess.run(cmd, shell=True, text=True, capture_output=True, executable="/bin/bash", timeout=10).stdout[0:-1]
+        result = subprocess.run(cmd, shell=True, text=True, capture_output=True, executable="/bin/bash", timeout=10)
+        command_metrics.record('shell', cmd, time.monotonic() - start, result.returncode)
+        return result.stdout[0:-1]
+    except subprocess.TimeoutExpired as err:
+        command_metrics.record('shell', cmd, time.monotonic() - start, timed_out=True)
+        print(f'Error running run_shell_cmd("{cmd}"): {err}')
     except Exception as err:
+        command_metrics.record('shell', cmd, time.monotonic() - start, error=True)
         print(f'Error running run_shell_cmd("{cmd}"): {err}')
     return 'error'
 
@@ -58,17 +64,6 @@ def run_cmd_and_wait(cmd):
 
 def current_time_ms():
     return round(time.time() * 1000)
-# UI Utils
-def get_item_with_submenu(self, menu, label='EMPTY'):
-        item = Gtk.MenuItem(label=label)
-        item.set_submenu(menu)
-        item.show_all()
-        return item
-
-def add_menu_item(self, menu, label='EMPTY', on_activate=lambda _: print('add_menu_item: on_activate empty')):
-    item = Gtk.MenuItem(label=label)
-    item.connect('activate', on_activate)
-    menu.append(item)
 
 def str2bool(str):
     if not str or str.lower() in ['false', 'no', 'n', '0']:
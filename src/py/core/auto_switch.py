@@ -0,0 +1,222 @@
+import collections
+import os
+import threading
+import time
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+from common import geo
+from common.npm_install import NpmInstaller
+from common.task_graph import TaskGraph
+
+
+def log(msg):
+    print(f'auto_switch.py: {msg}')
+
+
+def to_key(key_str):
+    return key_str.replace('.', '_').replace('/', '_').replace(' ', '_')
+
+
+def get_release_config_key(release):
+    """Returns the config key of the db that is configured for the release."""
+    return 'DB_FOR_RELEASE_' + to_key(release)
+
+
+def is_config_enabled(config_id, default_state):
+    """Returns the state of an on/off config value (e.g. AUTO_SWITCH_DB), or default_state if it isn't set."""
+    state = geo.get_config(config_id)
+    if not state:
+        return default_state
+    return state.lower() == 'true'
+
+
+GEOTAB_DEMO_DATA_DIR = os.path.join(os.environ['HOME'], 'GEOTAB', 'Checkmate', 'geotabdemo_data')
+# Next to the data, so that moving the data into it is a rename on the same file system.
+GEOTAB_DEMO_DATA_TRASH_DIR = os.path.join(os.environ['HOME'], 'GEOTAB', 'Checkmate', '.geotabdemo_data_trash')
+
+PROGRESS_TITLE = 'Auto-Switch Tasks'
+COMPLETE_TITLE = 'Auto-Switch Tasks Complete'
+
+
+class AutoSwitchTask:
+    # The number of durations to keep for each task.
+    MAX_DURATIONS = 20
+
+    def __init__(self, name: str, task, is_enabled_func, depends_on=()):
+        self.is_enabled_func = is_enabled_func
+        self.name = name
+        self.task = task
+        self.depends_on = tuple(depends_on)
+        # How long the most recent runs took, in seconds.
+        self.durations = collections.deque(maxlen=self.MAX_DURATIONS)
+
+    def __call__(self, *args, **kwargs):
+        print(f'Running auto-switch task: {self.name}')
+        return self.task(*args, **kwargs)
+
+    def record(self, task_result):
+        """Records how long the task took. Returns its result as text."""
+        self.durations.append(task_result.duration)
+        if task_result.error:
+            print('%r generated an exception: %s' % (self.name, task_result.error))
+            return 'Fail'
+        print(f'AutoSwitchEngine: Done running auto-switch task: {self.name} ({task_result.duration:.1f}s)')
+        return task_result.result or 'Fail'
+
+    @property
+    def is_enabled(self):
+        if self.is_enabled_func and callable(self.is_enabled_func):
+            return self.is_enabled_func()
+        return True
+
+
+class AutoSwitchEngine:
+    """
+    Runs the enabled auto-switch tasks (installing npm packages, switching server.config, cleaning up the GeotabDemo
+    data and starting the db configured for the release) when the checked out MyGeotab release changes. Each task is
+    enabled by its config value, which the indicator's check items toggle.
+    """
+    def __init__(self, core):
+        self.core = core
+        # Task names to tasks, in the order that they were registered.
+        self.tasks = {}
+        self.task_graph = TaskGraph()
+        self.running = False
+        # The (cur, prev) releases to run the tasks for once the current run finishes.
+        self.next_run = None
+        # The db that the DB task started, so that the indicator can tell it apart from dbs that the user started.
+        self.started_db = ''
+        # Called with (title, lines, done) on the main loop as the tasks progress.
+        self.listeners = []
+        self.npm_installer = NpmInstaller()
+        self.register_task('npm install', self.npm_install, lambda: is_config_enabled('AUTO_NPM_INSTALL', True))
+        self.register_task('server.config', self.switch_server_config, lambda: is_config_enabled('AUTO_SERVER_CONFIG', False))
+        self.register_task('GeotabDemo Data', self.clean_geotab_demo_data, lambda: is_config_enabled('AUTO_CLEAN_GEOTAB_DEMO_DATA', True))
+        # The db is started once server.config points at it and the old GeotabDemo data is gone.
+        self.register_task('DB', self.start_db_for_release, lambda: is_config_enabled('AUTO_SWITCH_DB', True),
+                           depends_on=['server.config', 'GeotabDemo Data'])
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        # Finish deleting any data that was left over when geo-cli last exited.
+        if os.path.isdir(GEOTAB_DEMO_DATA_TRASH_DIR):
+            geo.trash_collector.empty(GEOTAB_DEMO_DATA_TRASH_DIR)
+
+    def add_task(self, task):
+        self.tasks[task.name] = task
+
+    def register_task(self, task_name: str, task, is_enabled_func, depends_on=()):
+        """depends_on is a list of the names of the tasks that have to finish before this one starts."""
+        self.add_task(AutoSwitchTask(task_name, task, is_enabled_func, depends_on))
+
+    def remove_task(self, task):
+        self.tasks.pop(task.name, None)
+
+    def run(self, cur_myg_release, prev_myg_release):
+        """
+        Runs the enabled tasks in the background. Each task starts as soon as the tasks that it depends on are done, and
+        the listeners are called as each one finishes. If the tasks are already running (e.g. the branch was switched
+        again), they are run again for the latest release once the current run is done.
+        """
+        # Check which tasks are enabled on the main loop, since that reads the config.
+        tasks = [task for task in self.tasks.values() if task.is_enabled]
+        if not tasks:
+            return
+        if self.running:
+            self.next_run = (cur_myg_release, self.next_run[1] if self.next_run else prev_myg_release)
+            return
+        self.running = True
+        log('Running auto-switch tasks')
+        start = time.time()
+        lines = [f'{task.name}...' for task in tasks]
+        self.notify(PROGRESS_TITLE, lines, False)
+
+        def on_task_done(task, task_result):
+            # Called from the task graph's thread.
+            result = task.record(task_result)
+            GLib.idle_add(update_progress, tasks.index(task), f'{task.name}: {result} ({task_result.duration:.1f}s)')
+
+        def update_progress(i, line):
+            lines[i] = line
+            self.notify(PROGRESS_TITLE, lines, False)
+            return False
+
+        def run():
+            try:
+                self.task_graph.run(tasks,
+                                    lambda task: [self.tasks[name] for name in task.depends_on if name in self.tasks],
+                                    lambda task: task(cur_myg_release, prev_myg_release),
+                                    on_task_done)
+            except Exception as err:
+                log(f'Error running auto-switch tasks: {err}')
+            GLib.idle_add(on_complete)
+
+        def on_complete():
+            print(f'Auto-Switch Tasks Completed in {time.time() - start} seconds')
+            self.running = False
+            self.notify(COMPLETE_TITLE, lines, True)
+            if self.next_run:
+                (cur, prev) = self.next_run
+                self.next_run = None
+                self.run(cur, prev)
+            return False
+
+        # The graph waits on its tasks for the whole run, so it gets its own thread instead of tying up one of the shared
+        # async workers (which the status poller needs).
+        threading.Thread(target=run, name='AutoSwitchTasks', daemon=True).start()
+
+    def notify(self, title, lines, done):
+        for listener in self.listeners:
+            try:
+                listener(title, lines, done)
+            except Exception as err:
+                log(f'Error notifying listener: {err}')
+
+    def npm_install(self, cur_myg_release=None, prev_myg_release=None):
+        repo_dir = geo.get_config('DEV_REPO_DIR')
+        if not repo_dir:
+            return 'Fail'
+
+        def on_progress(project):
+            GLib.idle_add(self.core.notify, project.replace('Checkmate/', '', 1), 'Installing npm packages')
+
+        # Only the projects whose package.json or package-lock.json changed since they were last installed are installed.
+        results = self.npm_installer.install(repo_dir, cur_myg_release, on_progress)
+        if not all(results.values()):
+            self.core.run_in_terminal('init npm')
+            return 'Fail'
+        return 'Done' if results else 'Up-to-date'
+
+    def switch_server_config(self, cur_myg_release=None, prev_myg_release=None):
+        try:
+            output = geo.geo(f'dev auto-switch {cur_myg_release} {prev_myg_release}', return_all=True)
+            if 'Error' in output:
+                print(f'Failed to switch server.config: {output}')
+                return 'Fail'
+        except Exception as err:
+            print(f'Error running switch_server_config(): {err}')
+
+        return 'Done'
+
+    def clean_geotab_demo_data(self, cur_myg_release=None, prev_myg_release=None):
+        try:
+            # Move the geotabdemo_data directory out of the way (instantly) if it exists. It's deleted in the background.
+            geo.trash_collector.trash(GEOTAB_DEMO_DATA_DIR, GEOTAB_DEMO_DATA_TRASH_DIR)
+        except Exception as err:
+            print(f'Error running clean_geotab_demo_data(): {err}')
+            return 'Fail'
+
+        return 'Done'
+
+    def start_db_for_release(self, cur_myg_release=None, prev_myg_release=None):
+        db = self.core.db_for_myg_release
+        if db:
+            log(f'Starting db: {db}')
+            self.started_db = db
+            geo.start_db(db)
+        return 'Done'
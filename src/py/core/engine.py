@@ -0,0 +1,122 @@
+from common import geo
+from common.db_prefetch import DEFAULT_MEMORY_BUDGET_MB
+from core import status
+from core.auto_switch import AutoSwitchEngine, get_release_config_key, is_config_enabled
+
+
+def log(msg):
+    print(f'engine.py: {msg}')
+
+
+class GeoCore:
+    """
+    The display-independent part of the indicator: the system state (collected by the status poller), the state derived
+    from it (the checked out MyGeotab release and the db configured for it), and the auto-switch engine. The indicator
+    only renders it as menus. geo_daemon.py runs it on its own, for machines without a display.
+    """
+    def __init__(self, headless=False):
+        # Without a display, commands that would be run in a terminal are logged instead.
+        self.headless = headless
+        # The last (non-empty) release of the checked out MyGeotab repo.
+        self.myg_release = ''
+        # The db configured for myg_release ('' if there isn't one).
+        self.db_for_myg_release = ''
+        # Called with (body, title) on the main loop for messages that the user should see.
+        self.notification_listeners = []
+        self.status = status.make_status_poller()
+        self.auto_switch = AutoSwitchEngine(self)
+        # Set when a prefetch was held back because the auto-switch tasks were running.
+        self.prefetch_pending = False
+        self.auto_switch.add_listener(self.on_auto_switch_progress)
+        # Subscribed before the menu items, so that the derived state is up to date by the time they're notified.
+        self.status.subscribe(self.release_monitor, 'myg_release', 'dbs', 'config_version')
+        self.status.subscribe(self.prefetch_monitor, 'myg_release', 'running_db')
+
+    @property
+    def db(self):
+        """The running db ('' if there isn't one)."""
+        return self.status.snapshot.running_db
+
+    def start(self):
+        self.auto_switch.start()
+        self.status.start()
+
+    def start_last_db(self):
+        # Starting the db can take a while, so it's done in the background to not hold up the main loop.
+        geo.run_async(geo.try_start_last_db, key='try_start_last_db')
+
+    def add_notification_listener(self, listener):
+        self.notification_listeners.append(listener)
+
+    def notify(self, body, title='geo-cli'):
+        if not self.notification_listeners:
+            log(f'{title}: {body}')
+        for listener in self.notification_listeners:
+            listener(body, title)
+
+    def run_in_terminal(self, arg_str):
+        """Runs the geo command in a terminal. Without a display, the user is asked to run it instead."""
+        if self.headless:
+            log(f"Run 'geo {arg_str}' to finish")
+            return
+        geo.run_in_terminal(arg_str)
+
+    def release_monitor(self, snapshot):
+        prev_myg_release = self.myg_release
+        if snapshot.myg_release and snapshot.myg_release != self.myg_release:
+            log(f'MYG release changed from [{self.myg_release}] to [{snapshot.myg_release}]')
+            self.myg_release = snapshot.myg_release
+        self.db_for_myg_release = self.get_db_for_release(snapshot.dbs)
+        if prev_myg_release and self.myg_release != prev_myg_release:
+            self.auto_switch.run(self.myg_release, prev_myg_release)
+
+    def get_db_for_release(self, dbs):
+        if not self.myg_release:
+            return ''
+        db = geo.get_db_for_release(self.myg_release)
+        if db and db not in dbs:
+            release_key = get_release_config_key(self.myg_release)
+            log('Removing db "%s" from auto-switch db config "%s" because it no longer exists' % (db, release_key))
+            geo.rm_config(release_key)
+            db = ''
+        return db
+
+    def set_db_for_myg_release(self, db):
+        """Configures db to be started when myg_release is checked out."""
+        if not db or not self.myg_release:
+            return
+        geo.set_config(get_release_config_key(self.myg_release), db)
+        self.db_for_myg_release = db
+
+    def prefetch_monitor(self, snapshot):
+        if not snapshot.myg_release:
+            return
+        # The history is always recorded (it's only written when the release changes), so that predictions can be made
+        # as soon as prefetching is enabled.
+        geo.db_prefetcher.history.record(snapshot.myg_release)
+        if is_config_enabled('AUTO_PREFETCH_DB', False):
+            self.prefetch_db()
+
+    def on_auto_switch_progress(self, title, lines, done):
+        # Prefetch once the tasks are done (and no other run is queued), so that it doesn't compete with the db start.
+        if done and self.prefetch_pending and not self.auto_switch.next_run:
+            self.prefetch_pending = False
+            self.prefetch_db()
+
+    def prefetch_db(self):
+        """Warms up the db that is predicted to be needed after the next branch switch, in the background."""
+        if self.auto_switch.running:
+            self.prefetch_pending = True
+            return
+        release = self.status.snapshot.myg_release
+        running_db = self.status.snapshot.running_db
+        if release:
+            geo.run_async(lambda: self.prefetch(release, running_db), key='prefetch_db')
+
+    @staticmethod
+    def prefetch(release, running_db):
+        try:
+            budget_mb = int(geo.get_config('PREFETCH_DB_MEMORY_BUDGET_MB') or DEFAULT_MEMORY_BUDGET_MB)
+        except ValueError:
+            budget_mb = DEFAULT_MEMORY_BUDGET_MB
+        geo.db_prefetcher.prefetch(release, running_db, budget_mb)
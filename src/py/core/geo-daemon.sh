@@ -0,0 +1,5 @@
+#!/bin/bash
+dir=$(dirname "${BASH_SOURCE[0]}")
+geo_daemon_path="$dir/geo_daemon.py"
+echo "geo_daemon_path: $geo_daemon_path"
+python3 "$geo_daemon_path" "$@"
\ No newline at end of file
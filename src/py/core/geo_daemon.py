@@ -0,0 +1,50 @@
+#!/bin/python3
+import os
+import signal
+
+import sys
+# Add local packages to python search path.
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+try:
+    import setproctitle
+    setproctitle.setproctitle('geo-cli-daemon')
+except ImportError as e:
+    pass
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+from core.engine import GeoCore
+
+# Runs the core (status collection and the auto-switch tasks) without the indicator, for dev machines that don't have a
+# display (e.g. headless VMs). Only one of this and the indicator should run per session, since they both run the
+# auto-switch tasks; geo-daemon.service conflicts with geo-indicator.service for that reason.
+
+
+def log(msg):
+    print(f'geo_daemon.py: {msg}')
+
+
+def log_auto_switch_progress(title, lines, done):
+    if done:
+        log(f'{title}:\n    ' + '\n    '.join(lines))
+
+
+def main():
+    core = GeoCore(headless=True)
+    core.auto_switch.add_listener(log_auto_switch_progress)
+    core.start()
+    core.start_last_db()
+    loop = GLib.MainLoop()
+    # Exit cleanly when the service is stopped.
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, sig, loop.quit)
+    log('Running')
+    loop.run()
+    log('Stopped')
+
+
+if __name__ == "__main__":
+    main()
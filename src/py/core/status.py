@@ -0,0 +1,177 @@
+import traceback
+from dataclasses import dataclass, fields, replace
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+from common import geo
+
+# How often the system state is collected.
+POLL_INTERVAL = 2000
+
+
+@dataclass(frozen=True)
+class StatusSnapshot:
+    """The state of the system (as far as geo-cli is concerned) at the time of the last poll."""
+    running_db: str = ''
+    dbs: frozenset = frozenset()
+    myg_running: bool = False
+    gw_running: bool = False
+    myg_gw_running: bool = False
+    myg_release: str = ''
+    # (access request name, port) tuples, newest first.
+    open_iap_tunnels: tuple = ()
+    # Changes whenever the metadata (e.g. sizes) of the geo dbs changes.
+    db_metadata_version: int = 0
+    # Changes whenever the geo-cli config file is (re)loaded.
+    config_version: int = 0
+
+
+SNAPSHOT_FIELDS = {f.name for f in fields(StatusSnapshot)}
+
+
+class Collector:
+    def __init__(self, collect, every=1):
+        # Returns a dict of StatusSnapshot field names to their current values.
+        self.collect = collect
+        # Only collect every n ticks.
+        self.every = every
+
+
+class Subscriber:
+    def __init__(self, callback, fields):
+        self.callback = callback
+        self.fields = fields
+
+
+class StatusPoller:
+    """
+    Collects each piece of system state once per tick and publishes the result as a StatusSnapshot. The core and the menu
+    items subscribe to the fields that they care about and are only called when one of those fields changes.
+    """
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.snapshot = StatusSnapshot()
+        self.collectors = []
+        self.subscribers = []
+        self.tick_count = 0
+        self.published = False
+
+    def log(self, msg): print(f'[{type(self).__name__}]: {msg}')
+
+    def add_collector(self, collect, every=1):
+        self.collectors.append(Collector(collect, every))
+
+    def subscribe(self, callback, *field_names):
+        """
+        Calls callback(snapshot) whenever any of the given fields change. Subscribers are called in the order that they
+        subscribed in. Subscribers added after the first tick are called immediately with the current snapshot.
+        """
+        unknown = set(field_names) - SNAPSHOT_FIELDS
+        if unknown:
+            raise ValueError(f'StatusPoller.subscribe: unknown fields: {unknown}')
+        self.subscribers.append(Subscriber(callback, set(field_names)))
+        if self.published:
+            self.notify(callback)
+
+    def start(self):
+        GLib.idle_add(lambda: self.tick() and False)
+        GLib.timeout_add(self.interval, self.tick)
+
+    def tick(self):
+        collectors = [collector.collect for collector in self.collectors if self.tick_count % collector.every == 0]
+        self.tick_count += 1
+        # Collect in the background so that a slow command can't stall the main loop. The tick is skipped if the previous
+        # collection is still running.
+        if not geo.async_runner.is_running(self):
+            geo.run_async(lambda: self.collect(collectors), self.publish, key=self)
+        return True
+
+    def refresh(self, collect):
+        """Collects and publishes a single piece of state right away, instead of waiting for the next tick."""
+        geo.run_async(lambda: self.collect([collect]), self.publish, key=(self, collect))
+
+    def collect(self, collectors):
+        values = {}
+        for collect in collectors:
+            try:
+                values.update(collect())
+            except Exception as err:
+                self.log(f'Error running collector {collect.__name__}: {err}')
+        return values
+
+    def publish(self, values):
+        # Called on the main loop.
+        changed = {name for name, value in values.items() if getattr(self.snapshot, name) != value}
+        if self.published and not changed:
+            return
+        self.snapshot = replace(self.snapshot, **values)
+        first_publish = not self.published
+        self.published = True
+        for subscriber in self.subscribers:
+            if first_publish or subscriber.fields & changed:
+                self.notify(subscriber.callback)
+
+    def notify(self, callback):
+        try:
+            callback(self.snapshot)
+        except Exception as err:
+            self.log(f'Error notifying subscriber {callback.__qualname__}: {err}')
+            traceback.print_exc()
+
+
+def collect_dbs():
+    db_states = geo.get_geo_db_states()
+    running_dbs = [db for db, state in db_states.items() if state == 'running']
+    return {
+        'dbs': frozenset(db_states),
+        'running_db': running_dbs[0] if running_dbs else ''
+    }
+
+
+def collect_db_metadata():
+    return {'db_metadata_version': geo.refresh_db_metadata()}
+
+
+def collect_running_processes():
+    # Returns myg_running, gw_running and myg_gw_running from a single scan.
+    return geo.process_probe.probe()
+
+
+def collect_myg_release():
+    return {'myg_release': geo.get_myg_release()}
+
+
+def collect_open_iap_tunnels():
+    return {'open_iap_tunnels': geo.tunnel_registry.scan()}
+
+
+def collect_config_version():
+    return {'config_version': geo.get_config_version()}
+
+
+def make_status_poller():
+    poller = StatusPoller()
+    poller.add_collector(collect_config_version)
+    poller.add_collector(collect_dbs)
+    # The metadata is cached, this only reloads the parts whose ttl expired.
+    poller.add_collector(collect_db_metadata, every=5)
+    poller.add_collector(collect_running_processes)
+    poller.add_collector(collect_myg_release)
+    poller.add_collector(collect_open_iap_tunnels)
+    # Show db containers starting/stopping as soon as docker reports it.
+    def on_db_containers_changed():
+        poller.refresh(collect_dbs)
+        # Started/created/removed containers change the metadata too.
+        geo.db_metadata.invalidate()
+        poller.refresh(collect_db_metadata)
+    geo.db_container_watcher.add_listener(on_db_containers_changed)
+    # Publish config changes as soon as the config file is reloaded.
+    geo.config_store.start()
+    geo.config_store.add_listener(lambda: poller.refresh(collect_config_version))
+    # Check the release right away when the MyGeotab repo's HEAD or tags change.
+    geo.release_tracker.add_listener(lambda: poller.refresh(collect_myg_release))
+    # New tunnels are reported by a file monitor, so show them right away.
+    geo.tunnel_registry.add_listener(lambda: poller.refresh(collect_open_iap_tunnels))
+    return poller
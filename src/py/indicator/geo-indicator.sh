@@ -2,4 +2,4 @@
 dir=$(dirname "${BASH_SOURCE[0]}")
 geo_indicator_path="$dir/geo_indicator.py"
 echo "geo_indicator_path: $geo_indicator_path"
-python3 "$geo_indicator_path"
\ No newline at end of file
+python3 "$geo_indicator_path" "$@"
\ No newline at end of file
@@ -17,29 +17,33 @@ except ImportError as e:
 
 from indicator import *
 from indicator import icons, menus
+from indicator.profiler import profiler
 from common import geo
+from core.engine import GeoCore
 
 APPINDICATOR_ID = 'geo.indicator'
 
 # Check for updates every 10 minutes.
 UPDATE_INTERVAL = 10*60*1000
+# With --profile-startup, the startup profile is printed this long (in ms) after the first status is published, so that
+# it includes the lazy menus that are built in the background.
+PROFILE_REPORT_DELAY = 3000
 
 log = util.mklog(APPINDICATOR_ID)
 
 class IndicatorApp(object):
     notification = None
     notifications_allowed = False
-    myg_release = None
-    db_for_myg_release = None
-    db = None
     state = {}
     last_notification_time = 0
     edit_items = {}
     def __init__(self, show_startup_notification=True):
-        Notify.init(APPINDICATOR_ID)
-        self.indicator = appindicator.Indicator.new(APPINDICATOR_ID, icons.GREEN_PATH, appindicator.IndicatorCategory.SYSTEM_SERVICES)
-        self.indicator.set_status(appindicator.IndicatorStatus.ACTIVE)
-        self.indicator.set_title('geo-cli')
+        with profiler.phase('Notify.init'):
+            Notify.init(APPINDICATOR_ID)
+        with profiler.phase('create indicator'):
+            self.indicator = appindicator.Indicator.new(APPINDICATOR_ID, icons.GREEN_PATH, appindicator.IndicatorCategory.SYSTEM_SERVICES)
+            self.indicator.set_status(appindicator.IndicatorStatus.ACTIVE)
+            self.indicator.set_title('geo-cli')
         # self.indicator.set_label('geo-cli', 'geo-cli')
         self.db_submenu = None
         self.item_databases = None
@@ -47,15 +51,45 @@ class IndicatorApp(object):
         self.item_auto_switch_db_toggle = None
         self.icon_manager = icons.IconManager(self.indicator)
         if show_startup_notification:
-            self.show_quick_notification('Starting up...')
-        self.menu = MainMenu(self)
-        self.build_menu(self.menu)
-        self.indicator.set_menu(self.menu)
+            with profiler.phase('startup notification'):
+                self.show_quick_notification('Starting up...')
+        # Menu items subscribe to the parts of the system state that they display, so the core (which owns the status
+        # poller) must exist before the menu is built.
+        with profiler.phase('create core'):
+            self.core = GeoCore()
+            self.status = self.core.status
+            self.core.add_notification_listener(self.show_notification)
+        with profiler.phase('build menu'):
+            self.menu = MainMenu(self)
+            self.build_menu(self.menu)
+        with profiler.phase('set menu'):
+            self.indicator.set_menu(self.menu)
         print("=============== IndicatorApp: Starting up... ===============")
-        GLib.timeout_add(5000, self.monitor)
+        self.status.subscribe(self.monitor, 'config_version')
+        # Subscribers without fields are only called for the first status.
+        self.status.subscribe(self.on_first_status)
+        self.core.start()
+
+    def on_first_status(self, snapshot=None):
+        profiler.mark('first status published')
+        if profiler.enabled:
+            GLib.timeout_add(PROFILE_REPORT_DELAY, lambda: profiler.report() or False)
 
     def log(self, msg): print(f'[{type(self).__name__}]: {msg}')
 
+    # The state that the menus display comes from the core.
+    @property
+    def db(self):
+        return self.core.db
+
+    @property
+    def myg_release(self):
+        return self.core.myg_release
+
+    @property
+    def db_for_myg_release(self):
+        return self.core.db_for_myg_release
+
     def get_state(self, key, default=None):
         return self.state[key] if key in self.state else default
 
@@ -148,16 +182,21 @@ class IndicatorApp(object):
         sep = Gtk.SeparatorMenuItem()
         menu.append(sep)
 
-        item_running_db = menus.RunningDbMenuItem(self)
-        self.item_running_db = item_running_db
+        with profiler.phase('build running db item'):
+            item_running_db = menus.RunningDbMenuItem(self)
+            self.item_running_db = item_running_db
 
-        item_databases = self.get_database_item()
-        self.item_databases = item_databases
+        with profiler.phase('build databases menu'):
+            item_databases = self.get_database_item()
+            self.item_databases = item_databases
         item_create_db = self.get_create_db_item()
-        item_auto_switch_db_toggle = menus.AutoSwitchDbMenuItem(self)
-        self.item_auto_switch_db_toggle = item_auto_switch_db_toggle
-        item_mygeotab = menus.MyGeotabMenuItem(self)
-        item_gateway = menus.GatewayMenuItem(self)
+        with profiler.phase('build auto-switch menu'):
+            item_auto_switch_db_toggle = menus.AutoSwitchDbMenuItem(self)
+            self.item_auto_switch_db_toggle = item_auto_switch_db_toggle
+        with profiler.phase('build MyGeotab menu'):
+            item_mygeotab = menus.MyGeotabMenuItem(self)
+        with profiler.phase('build Gateway menu'):
+            item_gateway = menus.GatewayMenuItem(self)
 
         # Configure the id item to be activated when the app indicator is middle clicked on.
         # self.indicator.set_secondary_activate_target(item_id_clipboard)
@@ -175,7 +214,8 @@ class IndicatorApp(object):
         menu.append(Gtk.SeparatorMenuItem())
 
 
-        menu.append(menus.AccessRequestMenuItem(self))
+        with profiler.phase('build access requests menu'):
+            menu.append(menus.AccessRequestMenuItem(self))
 
         menu.append(self.build_editor_menu())
 
@@ -262,11 +302,17 @@ class IndicatorApp(object):
         geo.run_in_terminal('id -i', stay_open_after=True)
 
     def build_myg_utils_menu(self):
-        menu = Gtk.Menu()
-        self.add_menu_item(menu, 'npm install', lambda _: geo.run_in_terminal('init npm -c', stay_open_after=True))
-        # Run 'geo id -i' in terminal. This causes geo id to run interactively (-i), first trying to convert the contents
-        # of the clipboard.
-        self.add_menu_item(menu, 'Convert API Id (Long/Guid)', lambda _: geo.run_in_terminal('id -i', stay_open_after=True))
+        def build(menu):
+            item_npm = self.add_menu_item(menu, 'npm install', lambda _: geo.run_in_terminal('init npm -c', stay_open_after=True))
+            # Run 'geo id -i' in terminal. This causes geo id to run interactively (-i), first trying to convert the contents
+            # of the clipboard.
+            item_convert = self.add_menu_item(menu, 'Convert API Id (Long/Guid)', lambda _: geo.run_in_terminal('id -i', stay_open_after=True))
+            # Put them before the clipboard item, which was added when the menu was created.
+            menu.reorder_child(item_npm, 0)
+            menu.reorder_child(item_convert, 1)
+
+        menu = menus.LazyMenu(build, 'MYG Utils menu')
+        # This one is added right away since it's the action for middle clicking the app icon.
         self.add_menu_item(menu, 'Convert API Id From Clipboard', lambda _: geo.run_in_terminal('id -c', stay_open_after=False),
            set_as_app_icon_middle_click_action=True)
 
@@ -277,11 +323,11 @@ class IndicatorApp(object):
         return item
 
     def build_tests_menu(self):
-        menu = Gtk.Menu()
-        self.add_menu_item(menu, 'Run Tests', lambda _: geo.run_in_terminal('test -i', stay_open_after=True))
-        self.add_menu_item(menu, 'Quarantine Test', lambda _: geo.run_in_terminal('quarantine -i', stay_open_after=True))
+        def build(menu):
+            self.add_menu_item(menu, 'Run Tests', lambda _: geo.run_in_terminal('test -i', stay_open_after=True))
+            self.add_menu_item(menu, 'Quarantine Test', lambda _: geo.run_in_terminal('quarantine -i', stay_open_after=True))
 
-        menu_item = self.get_item_with_submenu(menu, label='🧪 Tests')
+        menu_item = self.get_item_with_submenu(menus.LazyMenu(build, 'Tests menu'), label='🧪 Tests')
         return menu_item
 
     def get_item_with_submenu(self, menu, label='EMPTY'):
@@ -302,33 +348,37 @@ class IndicatorApp(object):
         item = Gtk.MenuItem(label='✏️ Edit Files')
         # item = Gtk.MenuItem(label='✏ Edit Files')
         # item = Gtk.MenuItem(label='✏ Edit Files')
-        menu = Gtk.Menu()
-        server_config = Gtk.MenuItem(label='server.config')
-        gitlab_ci = Gtk.MenuItem(label='.gitlab-ci.yml')
-        bashrc = Gtk.MenuItem(label='.bashrc')
-
-        server_config.connect('activate', lambda _: geo.run('edit server.config'))
-        gitlab_ci.connect('activate', lambda _: geo.run('edit gitlab-ci'))
-        bashrc.connect('activate', lambda _: geo.run('edit bashrc'))
-
-        menu.append(server_config)
-        menu.append(gitlab_ci)
-        menu.append(bashrc)
-
-
-        geo_config = self.add_menu_item(menu, 'geo config', lambda _: geo.run('edit config'))
-        geo_config_json = self.add_menu_item(menu, 'geo config json', lambda _: geo.run('edit config.json'))
-        self.edit_items["edit-config"] = geo_config
-        self.edit_items["edit-config-json"] = geo_config_json
-        item.set_submenu(menu)
+        def build(menu):
+            server_config = Gtk.MenuItem(label='server.config')
+            gitlab_ci = Gtk.MenuItem(label='.gitlab-ci.yml')
+            bashrc = Gtk.MenuItem(label='.bashrc')
+
+            server_config.connect('activate', lambda _: geo.geo_async('edit server.config'))
+            gitlab_ci.connect('activate', lambda _: geo.geo_async('edit gitlab-ci'))
+            bashrc.connect('activate', lambda _: geo.geo_async('edit bashrc'))
+
+            menu.append(server_config)
+            menu.append(gitlab_ci)
+            menu.append(bashrc)
+
+            geo_config = self.add_menu_item(menu, 'geo config', lambda _: geo.geo_async('edit config'))
+            geo_config_json = self.add_menu_item(menu, 'geo config json', lambda _: geo.geo_async('edit config.json'))
+            # Shown/hidden by monitor, based on dev_mode.
+            geo_config.set_no_show_all(True)
+            geo_config_json.set_no_show_all(True)
+            self.edit_items["edit-config"] = geo_config
+            self.edit_items["edit-config-json"] = geo_config_json
+            self.monitor()
+
+        item.set_submenu(menus.LazyMenu(build, 'Edit Files menu'))
         item.show_all()
-        if not geo.get_config('dev_mode'):
-            geo_config.hide()
-            geo_config_json.hide()
         return item
 
-    def monitor(self):
+    def monitor(self, snapshot=None):
         # TODO: FIx this.
+        if not self.edit_items:
+            # The editor menu hasn't been built yet.
+            return True
         if geo.get_bool_config('dev_mode'):
             self.edit_items["edit-config"].show()
             self.edit_items["edit-config-json"].show()
@@ -349,19 +399,19 @@ class IndicatorApp(object):
 
     @staticmethod
     def get_analyzer_item():
-        menu = Gtk.Menu()
+        def build(menu):
+            item_run_all = Gtk.MenuItem(label='All')
+            item_choose = Gtk.MenuItem(label='Choose')
+            item_previous = Gtk.MenuItem(label='Repeat Last Run')
+            item_run_all.connect('activate', lambda _: geo.run_in_terminal('analyze -b -a'))
+            item_choose.connect('activate', lambda _: geo.run_in_terminal('analyze -b'))
+            item_previous.connect('activate', lambda _: geo.run_in_terminal('analyze -b -'))
+            menu.append(item_run_all)
+            menu.append(item_choose)
+            menu.append(item_previous)
+
         item = Gtk.MenuItem(label='🔎 Analyzers')
-        item_run_all = Gtk.MenuItem(label='All')
-        item_choose = Gtk.MenuItem(label='Choose')
-        item_previous = Gtk.MenuItem(label='Repeat Last Run')
-        item_run_all.connect('activate', lambda _: geo.run_in_terminal('analyze -b -a'))
-        item_choose.connect('activate', lambda _: geo.run_in_terminal('analyze -b'))
-        item_previous.connect('activate', lambda _: geo.run_in_terminal('analyze -b -'))
-        menu.append(item_run_all)
-        menu.append(item_choose)
-        menu.append(item_previous)
-        item.set_submenu(menu)
-        menu.show_all()
+        item.set_submenu(menus.LazyMenu(build, 'Analyzers menu'))
         return item
 
 
@@ -415,14 +465,18 @@ def main():
     delay = 5
     # Gtk.init()
     if not os.environ.get('DISPLAY'):
-        log('Shutting down since the "DISPLAY" environment variable isn\'t set (no display server available)')
+        log('Shutting down since the "DISPLAY" environment variable isn\'t set (no display server available). '
+            'Run "geo indicator headless enable" to run the background tasks without a display')
         quit()
     show_startup_notification=True
+    profiler.mark('modules imported')
+    profiler.enabled = '--profile-startup' in sys.argv[1:]
     while retry and retry_count < 20:
         try:
             indicator = IndicatorApp(show_startup_notification)
             if retry_count == 0:
-                geo.try_start_last_db()
+                indicator.core.start_last_db()
+            GLib.idle_add(lambda: profiler.mark('main loop running') or False)
             Gtk.main()
             retry = False
         except Exception as e:
@@ -1,3 +1,4 @@
+from .components import LazyMenu
 from .db import RunningDbMenuItem, DbMenu, DbMenuItem
 from .auto_switch import AutoSwitchDbMenuItem
 from .update import UpdateMenuItem
@@ -1,4 +1,5 @@
 from indicator import *
+from indicator.menus.components import MenuReconciler
 
 
 class AccessRequestMenuItem(Gtk.MenuItem):
@@ -9,7 +10,7 @@ class AccessRequestMenuItem(Gtk.MenuItem):
         submenu = Gtk.Menu()
 
         item_create = Gtk.MenuItem(label='↗ Create Access Request')
-        item_create.connect('activate', lambda _: geo.run('ar create'))
+        item_create.connect('activate', lambda _: geo.geo_async('ar create'))
 
         item_iap = Gtk.MenuItem(label='➕ Start IAP Tunnel')
         iap_menu = Gtk.Menu()
@@ -20,6 +21,7 @@ class AccessRequestMenuItem(Gtk.MenuItem):
         item_iap_start_prev = Gtk.MenuItem(label='Start Previous')
         self.item_iap_start_prev = item_iap_start_prev
         item_iap_start_prev.set_submenu(Gtk.Menu())
+        self.iap_cmd_items = MenuReconciler(item_iap_start_prev.get_submenu(), lambda cmd: IapCommandMenuItem(cmd.split(' ')[3], cmd))
 
         iap_menu.append(item_iap_start_new)
         iap_menu.append(item_iap_start_new_bind)
@@ -27,7 +29,7 @@ class AccessRequestMenuItem(Gtk.MenuItem):
         iap_menu.show_all()
         item_iap.set_submenu(iap_menu)
 
-        item_open_tunnels = OpenIapTunnelMenu()
+        item_open_tunnels = OpenIapTunnelMenu(app)
 
         submenu.append(item_iap)
         submenu.append(item_open_tunnels)
@@ -35,53 +37,20 @@ class AccessRequestMenuItem(Gtk.MenuItem):
         self.set_submenu(submenu)
         submenu.show_all()
 
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'config_version')
 
-    def monitor(self):
-        menu = self.item_iap_start_prev.get_submenu()
+    def monitor(self, snapshot=None):
         prev_cmds_str = geo.get_config('AR_IAP_CMDS')
         if not prev_cmds_str:
             prev_cmds_str = geo.get_config('AR_IAP_CMD')
-        items = [item for item in menu.get_children()]
-        items_dict = {item.cmd: item for item in menu.get_children()}
-        cur_cmds = [item.cmd for item in items]
-        cur_cmds_set = set(cur_cmds)
-        if not prev_cmds_str:
-            if not items:
-                return True
-            for item in items:
-                menu.remove(item)
-                item.destroy()
-
-        cmds = prev_cmds_str.split('@')
-        cmds_set = set(cmds)
-
-        to_remove = cur_cmds_set - cmds_set
-        to_add = cmds_set - cur_cmds_set
-        if not to_remove and not to_add:
-            return True
-
-        for cmd in to_remove:
-            item = items_dict[cmd]
-            menu.remove(item)
-            item.destroy()
-            cur_cmds.remove(cmd)
-
-        try:
-            for i in range(len(cmds)):
-                cmd = cmds[i]
-                if cmd not in cur_cmds:
-                    tag = cmd.split(' ')[3]
-                    item = IapCommandMenuItem(tag, cmd)
-                    menu.insert(item, i)
-                    cur_cmds.insert(i, cmd)
-                if cmd in cur_cmds and i != cur_cmds.index(cmd):
-                    item = items_dict[cmd]
-                    menu.remove(item)
-                    menu.insert(item, i)
-        except:
-            print('Error while parsing geo ar commands')
-        menu.show_all()
+        cmds = []
+        for cmd in prev_cmds_str.split('@') if prev_cmds_str else []:
+            # The tag is the 4th word of the command.
+            if len(cmd.split(' ')) < 4:
+                print(f'Error while parsing geo ar command: {cmd}')
+                continue
+            cmds.append(cmd)
+        self.iap_cmd_items.reconcile(cmds)
         return True
 
 
@@ -118,101 +87,49 @@ class OpenIapTunnelMenuItem(Gtk.MenuItem):
 
 
 class OpenIapTunnelMenu(Gtk.MenuItem):
-    items = set()
-    init_rebuild = False
-    def __init__(self):
+    def __init__(self, app):
         super().__init__(label='★ Open IAP Tunnels')
-        self.open_tunnels = {}
-        self.prev_tunnel_str = ''
-        self.prev_tunnels = set()
+        self.app = app
+        self.rebuilt = False
         self.empty_item = Gtk.MenuItem(label='There are no open IAP tunnels')
         self.empty_item.set_sensitive(False)
         self.menu = Gtk.Menu()
         self.menu.append(self.empty_item)
+        # Keyed by (ar name, port). The tunnel items go after the (hidden) empty item.
+        self.items = MenuReconciler(self.menu, lambda tunnel: OpenIapTunnelMenuItem(*tunnel), offset=1)
         self.menu.show_all()
-        # self.items.add(self.empty_item)
         self.set_submenu(self.menu)
         self.show_all()
 
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'open_iap_tunnels')
 
     def log(self, msg):
         print(f'OpenIapTunnelMenu: {msg}')
 
-    def monitor(self):
-        try:
-            open_tunnels_str=geo.run('dev open-iap-tunnels')
-            if open_tunnels_str:
-                self.show()
-            else:
-                self.hide()
-                return True
-                
-            # This is needed so that multiple instances of this class render correctly; the menu needs to be built twice (for some reason).
-            if self.prev_tunnel_str and not self.init_rebuild or (self.empty_item in self.items and not self.init_rebuild):
-                self.prev_tunnel_str = ''
-                self.prev_tunnels = set()
-                self.init_rebuild = True
-            cur_tunnels = set(open_tunnels_str.split('|'))
-            if not cur_tunnels or cur_tunnels == self.prev_tunnels:
-                # self.hide()
-                return True
-            # print(f'{open_tunnels_str} == {self.prev_tunnel_str} = {open_tunnels_str == self.prev_tunnel_str}')
-            self.prev_tunnels = cur_tunnels
-            self.prev_tunnel_str = open_tunnels_str
-            self.remove_all()
-            # tunnels = open_tunnels_str.split('|')
-            for tunnel_str in cur_tunnels:
-                if not tunnel_str or '=' not in tunnel_str:
-                    continue
-                ar_name, iap_port = tunnel_str.split('=')
-                # print(ar_name, iap_port)
-                if len(ar_name) < 3:
-                    print(f'ar_name is too short: {ar_name}')
-                    continue
-                item = OpenIapTunnelMenuItem(ar_name, iap_port)
-                # item = OpenIapTunnelMenuItem(ar_name, iap_port, self.geo_command)
-                # print(f'{ar_name} ({iap_port})')
-                item.show()
-                self.items.add(item)
-                self.menu.append(item)
-            if not self.items:
-                # self.log('adding empty item')
-                # self.menu.append(self.empty_item)
-                self.empty_item.show()
-                # self.menu.show_all()
-                # self.menu.remove(self.empty_item)
-                # Don't know why I need to do this for it to actually get rendered...
-                def delayed():
-                    # self.menu.append(self.empty_item)
-                    self.empty_item.show()
-                    self.menu.show_all()
-                    self.set_submenu(self.menu)
-                GLib.timeout_add(1000, delayed)
-            else:
-                self.empty_item.hide()
-            # for child in self.menu.get_children():
-            #     if child == self.empty_item:
-            #         self.menu.remove(child)
-            # self.menu.show_all()
-            # self.show_all()
-
-        except Exception as err:
-            print('SshOverOpenTunnelMenuItem: ERROR: ' + err)
+    def monitor(self, snapshot=None):
+        tunnels = []
+        for (ar_name, iap_port) in (snapshot or self.app.status.snapshot).open_iap_tunnels:
+            if len(ar_name) < 3:
+                print(f'ar_name is too short: {ar_name}')
+                continue
+            tunnels.append((ar_name, iap_port))
+        if not tunnels:
+            self.hide()
+        # Only the items for the tunnels that were opened/closed are added/removed.
+        self.items.reconcile(tunnels)
+        self.empty_item.set_visible(not tunnels)
+        if not tunnels:
+            return True
+        self.show()
+        if not self.rebuilt:
+            # The menu needs to be built twice the first time that tunnels are shown for it to render correctly.
+            self.rebuilt = True
+            GLib.timeout_add(2000, lambda: self.rebuild() and False)
         return True
 
-    def remove_all(self):
-        if not self.items:
-            self.empty_item.show()
-            # self.menu.remove(self.empty_item)
-            # self.menu.show_all()
-            # self.show_all()
-            # self.items.add(self.empty_item)
-            return
-        for item in self.items:
-            self.menu.remove(item)
-        self.show_all()
-        self.items = set()
+    def rebuild(self):
+        self.items.clear()
+        self.monitor()
 
 
 class SshOverOpenTunnelMenu(OpenIapTunnelMenu):
@@ -1,27 +1,21 @@
-import concurrent.futures
-import os
-import shutil
-
 from indicator import *
+from indicator import icons
 from indicator.geo_indicator import IndicatorApp
 from indicator.menus.components import PersistentCheckMenuItem
 
 
-def to_key(key_str):
-    return key_str.replace('.', '_').replace('/', '_').replace(' ', '_')
-
-
 class AutoSwitchDbMenuItem(Gtk.MenuItem):
-    cur_myg_release = ''
-    prev_myg_release = ''
-    auto_switch_tasks = set()
-
+    """
+    The auto-switch settings and state. The tasks are run by the core's auto-switch engine when the release changes;
+    this only toggles them and shows their progress.
+    """
     def __init__(self, app: IndicatorApp):
         super().__init__(label='⚡ Auto-Switch')
         self.app = app
+        self.notification = None
         self.build_submenu(app)
         self.show_all()
-        GLib.timeout_add(2000, self.myg_release_monitor)
+        app.core.auto_switch.add_listener(self.show_progress)
 
     def build_submenu(self, app):
         submenu = Gtk.Menu()
@@ -30,7 +24,9 @@ class AutoSwitchDbMenuItem(Gtk.MenuItem):
         item_npm_task_toggle = AutoNpmInstallTaskCheckMenuItem(app, self)
         item_server_config_task_toggle = AutoServerConfigTaskCheckMenuItem(app, self)
         item_geotab_demo_data_task_toggle = AutoGeotabDemoCleanUpTaskCheckMenuItem(app, self)
+        item_geotab_demo_data_progress = GeotabDemoCleanUpProgressMenuItem(app)
         item_db_task_toggle = AutoSwitchDbTaskCheckMenuItem(app, self)
+        item_prefetch_db_toggle = AutoPrefetchDbCheckMenuItem(app, self)
         item_db_password_toggle = AutoSwitchDbPasswordTaskCheckMenuItem(app, self)
         item_cur_myg_release_display = CheckedOutMygReleaseMenuItem(app, self)
         item_db_for_myg_release_display = DbForMygReleaseMenuItem(app, self)
@@ -39,9 +35,11 @@ class AutoSwitchDbMenuItem(Gtk.MenuItem):
         submenu.append(item_npm_task_toggle)
         submenu.append(item_server_config_task_toggle)
         submenu.append(item_geotab_demo_data_task_toggle)
+        submenu.append(item_geotab_demo_data_progress)
         submenu.append(item_db_password_toggle)
         submenu.append(Gtk.SeparatorMenuItem())
         submenu.append(item_db_task_toggle)
+        submenu.append(item_prefetch_db_toggle)
         submenu.append(item_cur_myg_release_display)
         submenu.append(item_db_for_myg_release_display)
         submenu.append(item_start_db_for_myg_release)
@@ -51,80 +49,23 @@ class AutoSwitchDbMenuItem(Gtk.MenuItem):
         self.set_submenu(submenu)
         submenu.show_all()
 
-    def myg_release_monitor(self):
-        self.cur_myg_release = self.app.get_state('myg_release')
-        if self.cur_myg_release and self.prev_myg_release and self.cur_myg_release != self.prev_myg_release:
-            self.app.set_state('myg_release', self.cur_myg_release)
-            print(f'AutoSwitchDbMenuItem: MYG version changed from {self.prev_myg_release} to {self.cur_myg_release}')
-            self.run_auto_switch_tasks()
-        self.prev_myg_release = self.cur_myg_release
-        return True
-
-    def run_auto_switch_tasks(self):
-        if not self.auto_switch_tasks:
+    def show_progress(self, title, lines, done):
+        """Shows the progress of the tasks in a single notification that is updated in place."""
+        if not geo.notifications_are_allowed():
             return
-        start = time.time()
-        # print("Time elapsed on working...")
-        print('AutoSwitchDbMenuItem: Running auto-switch tasks')
-
-        output = ""
-        # output = "Auto switch tasks:\n"
-
-        # 9.7, 9.4, 16.5, 15.6
-        # for task in self.auto_switch_tasks:
-        #     if not task.is_enabled:
-        #         continue
-        #     result = task(self.cur_myg_release, self.prev_myg_release)
-        #     result = 'Fail' if not result else result
-        #     output += f'{task.name}[{result}], \n'
-
-        # Running with ThreadPoolExecutor seems to be slower, so comment out for now.
-        #16.8, 14, 15.9, 14, 11
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_task = {executor.submit(task, self.cur_myg_release, self.prev_myg_release): task for task in self.auto_switch_tasks if task.is_enabled}
-            # TODO Make sure that the npm job is positioned last since it takes the longest. That was we can report progress about the completion of the first 2 jobs.
-            for future in concurrent.futures.as_completed(future_to_task):
-                task = future_to_task[future]
-                try:
-                    result = future.result()
-                    result = 'Fail' if not result else result
-                    output += f'{task.name}, \n'
-                    # output += f'{task.name}[{result}], \n'
-                except Exception as exc:
-                    print('%r generated an exception: %s' % (task.name, exc))
-                else:
-                    print(f'AutoSwitchDbMenuItem: Done running auto-switch task: {task.name}')
-
-        # TODO Show some kind of progress every time a job finishes instead of waiting until now. There is too long of a delay (mainly caused by running npm twice for CheckmateServer)
-        self.app.show_notification(output, 'Auto-Switch Tasks Complete', 4000)
-        end = time.time()
-        print(f'Auto-Switch Tasks Completed in {end - start} seconds')
-
-    def add_auto_switch_task(self, task):
-        self.auto_switch_tasks.add(task)
-
-    def register_auto_switch_task(self, task_name: str, task, is_enabled_func):
-        self.add_auto_switch_task(AutoSwitchTask(task_name, task, is_enabled_func))
-
-    def remove_auto_switch_task(self, task):
-        self.auto_switch_tasks.remove(task)
-
-
-class AutoSwitchTask:
-    def __init__(self, name: str, task, is_enabled_func):
-        self.is_enabled_func = is_enabled_func
-        self.name = name
-        self.task = task
-
-    def __call__(self, *args, **kwargs):
-        print(f'Running auto-switch task: {self.name}')
-        return self.task(*args, **kwargs)
-
-    @property
-    def is_enabled(self):
-        if self.is_enabled_func and callable(self.is_enabled_func):
-            return self.is_enabled_func()
-        return True
+        body = '\n'.join(lines)
+        try:
+            if self.notification:
+                self.notification.update(title, body, icons.GEO_CLI)
+            else:
+                self.notification = Notify.Notification.new(title, body, icons.GEO_CLI)
+                self.notification.set_urgency(Notify.Urgency.LOW)
+            if done:
+                self.notification.set_timeout(4000)
+            self.notification.show()
+        except Exception as err:
+            print(f'AutoSwitchDbMenuItem: Error showing progress notification: {err}')
+
 
 class SetDbForMygReleaseMenuItem(Gtk.MenuItem):
     def __init__(self, app: IndicatorApp, parent: AutoSwitchDbMenuItem):
@@ -132,9 +73,9 @@ class SetDbForMygReleaseMenuItem(Gtk.MenuItem):
         self.app = app
         super().__init__(label='Set DB for MYG Release')
         self.connect('activate', lambda _: self.set_db_for_release())
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'running_db', 'myg_release', 'dbs', 'config_version')
 
-    def monitor(self):
+    def monitor(self, snapshot=None):
         if self.app.db and self.app.db != self.app.db_for_myg_release:
             self.set_sensitive(True)
             self.set_label('Set DB for MYG Release')
@@ -146,11 +87,8 @@ class SetDbForMygReleaseMenuItem(Gtk.MenuItem):
         return True
 
     def set_db_for_release(self):
-        if not self.app.db or not self.app.myg_release:
-            return
-        release_key = 'DB_FOR_RELEASE_' + to_key(self.app.myg_release)
-        geo.set_config(release_key, self.app.db)
-        self.app.db_for_myg_release = self.app.db
+        self.app.core.set_db_for_myg_release(self.app.db)
+        self.monitor()
 
 
 class CheckedOutMygReleaseMenuItem(Gtk.MenuItem):
@@ -162,28 +100,20 @@ class CheckedOutMygReleaseMenuItem(Gtk.MenuItem):
         super().__init__(label='MYG Release: Unknown')
         self.set_sensitive(False)
         self.update_label(self.cur_myg_release)
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'myg_release')
 
     def update_label(self, label):
         self.set_label('MYG Release: %s' % label)
         self.show()
 
-    def monitor(self):
-        cur_release = geo.get_myg_release()
+    def monitor(self, snapshot):
+        # The core keeps the last known release when the current one can't be read.
+        cur_release = self.app.myg_release
         if cur_release and self.cur_myg_release != cur_release:
-            print(f'CheckedOutMygReleaseMenuItem.monitor: Updating MYG release [{self.cur_myg_release}] => [{cur_release}]')
             self.cur_myg_release = cur_release
-            self.app.state['myg_release'] = self.cur_myg_release
-            self.app.myg_release = self.cur_myg_release
             self.update_label(self.cur_myg_release)
         return True
 
-    def get_db_for_release(self):
-        if self.cur_myg_release is None:
-            return
-        release_key = 'DB_FOR_RELEASE_' + self.cur_myg_release.replace('.', '_').replace('/', '_').replace(' ', '_')
-        return geo.get_config(release_key)
-
 
 class DbForMygReleaseMenuItem(Gtk.MenuItem):
     db_for_release = ''
@@ -193,7 +123,7 @@ class DbForMygReleaseMenuItem(Gtk.MenuItem):
         self.app = app
         super().__init__(label='Configured DB: None')
         self.set_sensitive(False)
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'myg_release', 'dbs', 'config_version')
 
     def update_label(self):
         if not self.db_for_release:
@@ -205,32 +135,13 @@ class DbForMygReleaseMenuItem(Gtk.MenuItem):
         self.set_label('Configured DB: %s' % label)
         self.show()
 
-    def monitor(self):
-        db_for_release = self.get_db_for_release()
-
+    def monitor(self, snapshot=None):
+        db_for_release = self.app.db_for_myg_release
         if self.db_for_release != db_for_release:
             self.db_for_release = db_for_release
-            self.app.db_for_myg_release = db_for_release
             self.update_label()
-            self.app.set_state('configured_db_for_myg_release', db_for_release)
         return True
 
-    def has_db_for_release(self):
-        return self.get_db_for_release() is not None
-
-    def get_db_for_release(self):
-        if not self.app.myg_release:
-            return ''
-        release_key = 'DB_FOR_RELEASE_' + to_key(self.app.myg_release)
-        configured_db_for_myg_release = geo.get_config(release_key)
-
-        dbs = self.app.get_state('dbs') or []
-        if configured_db_for_myg_release and configured_db_for_myg_release not in dbs:
-            print('DbForMygReleaseMenuItem: removing db "%s" from auto-switch db config "%s" because the it no longer exists' % (configured_db_for_myg_release, release_key))
-            geo.rm_config(release_key)
-            configured_db_for_myg_release = ''
-        return configured_db_for_myg_release
-
 
 class StartDbForMygReleaseMenuItem(Gtk.MenuItem):
     db_for_release = ''
@@ -242,16 +153,15 @@ class StartDbForMygReleaseMenuItem(Gtk.MenuItem):
         self.connect('activate', lambda _: self.start_configured_db())
         self.set_sensitive(False)
         self.hide()
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'running_db', 'myg_release', 'dbs', 'config_version')
 
     def start_configured_db(self):
-        configured_db_for_myg_release = self.app.get_state('configured_db_for_myg_release')
+        configured_db_for_myg_release = self.app.db_for_myg_release
         if configured_db_for_myg_release:
-            geo.start_db(configured_db_for_myg_release)
+            geo.run_async(lambda: geo.start_db(configured_db_for_myg_release), key=('start_db', configured_db_for_myg_release))
 
-    def monitor(self):
-        configured_db_for_myg_release = self.app.get_state('configured_db_for_myg_release')
-        dbs = self.app.get_state('dbs')
+    def monitor(self, snapshot=None):
+        configured_db_for_myg_release = self.app.db_for_myg_release
         if configured_db_for_myg_release and self.app.db != configured_db_for_myg_release:
             if self.is_hidden:
                 self.set_sensitive(True)
@@ -274,15 +184,25 @@ class AutoSwitchDbTaskCheckMenuItem(PersistentCheckMenuItem):
                          default_state=True)
         self.parent = parent
         self.app = app
-        parent.register_auto_switch_task('DB', self.change_db_when_myg_release_changed, self.is_enabled)
 
-    def change_db_when_myg_release_changed(self, cur_myg_release=None, prev_myg_release=None):
-        auto_switch_db_enabled = self.app.get_state('auto-db')
-        if auto_switch_db_enabled and self.app.db_for_myg_release:
-            print(f'AutoSwitchDbTaskCheckMenuItem: Starting db: {self.app.db_for_myg_release}')
-            self.app.item_running_db.skip_next_notification = True
-            geo.start_db(self.app.db_for_myg_release)
-        return 'Done'
+
+class AutoPrefetchDbCheckMenuItem(PersistentCheckMenuItem):
+    """
+    When enabled, the db that is predicted to be needed after the next branch switch is read into memory ahead of time,
+    so that it starts quickly. The memory used is limited by the PREFETCH_DB_MEMORY_BUDGET_MB config value.
+    """
+    def __init__(self, app: IndicatorApp, parent: AutoSwitchDbMenuItem):
+        super().__init__(app,
+                         label='Warm Up Predicted DB',
+                         config_id='AUTO_PREFETCH_DB',
+                         app_state_id='auto-prefetch-db',
+                         default_state=False)
+        self.parent = parent
+        self.app = app
+
+    def on_state_changed(self, new_state):
+        if new_state:
+            self.app.core.prefetch_db()
 
 
 class AutoNpmInstallTaskCheckMenuItem(PersistentCheckMenuItem):
@@ -294,16 +214,6 @@ class AutoNpmInstallTaskCheckMenuItem(PersistentCheckMenuItem):
                          default_state=True)
         self.parent = parent
         self.app = app
-        parent.register_auto_switch_task('npm install', self.npm_install, self.is_enabled)
-
-    def npm_install(self, cur_myg_release=None, prev_myg_release=None):
-        if not self.enabled:
-            return
-        error = geo.geo('init npm', return_error=True)
-        if 'ERR' in error:
-            geo.run_in_terminal('init npm')
-            return 'Fail'
-        return 'Done'
 
 
 class AutoServerConfigTaskCheckMenuItem(PersistentCheckMenuItem):
@@ -315,20 +225,6 @@ class AutoServerConfigTaskCheckMenuItem(PersistentCheckMenuItem):
                          config_id='AUTO_SERVER_CONFIG',
                          app_state_id='auto-server-config', default_state=False)
         self.parent = parent
-        parent.register_auto_switch_task('server.config', self.auto_switch_server_config, self.is_enabled)
-
-    def auto_switch_server_config(self, cur_myg_release=None, prev_myg_release=None):
-        if not self.enabled:
-            return
-        try:
-            output = geo.geo(f'dev auto-switch {cur_myg_release} {prev_myg_release}', return_all=True)
-            if 'Error' in output:
-                print(f'Failed to switch server.config: {output}')
-                return 'Fail'
-        except Exception as err:
-            print(f'Error running auto_switch_server_config(): {err}')
-
-        return 'Done'
 
 
 class AutoGeotabDemoCleanUpTaskCheckMenuItem(PersistentCheckMenuItem):
@@ -340,21 +236,26 @@ class AutoGeotabDemoCleanUpTaskCheckMenuItem(PersistentCheckMenuItem):
                          default_state=True)
         self.parent = parent
         self.app = app
-        parent.register_auto_switch_task('GeotabDemo Data', self.auto_clean_geotab_demo_data, self.is_enabled)
 
-    def auto_clean_geotab_demo_data(self, cur_myg_release=None, prev_myg_release=None):
-        if not self.enabled:
-            return
-        try:
-            geotabdemo_data_dir = os.environ['HOME'] + '/GEOTAB/Checkmate/geotabdemo_data'
-            # Delete the geotabdemo_data directory if it exists.
-            if os.path.exists(geotabdemo_data_dir):
-                shutil.rmtree(geotabdemo_data_dir)
-        except Exception as err:
-            print(f'Error running auto_clean_geotab_demo_data(): {err}')
-            return 'Fail'
 
-        return 'Done'
+class GeotabDemoCleanUpProgressMenuItem(Gtk.MenuItem):
+    """Shows the progress of deleting old GeotabDemo data. Only visible while it's being deleted."""
+    def __init__(self, app: IndicatorApp):
+        super().__init__(label='Deleting GeotabDemo Data')
+        self.app = app
+        self.set_sensitive(False)
+        self.set_no_show_all(True)
+        self.hide()
+        geo.trash_collector.add_listener(lambda: GLib.idle_add(self.update) and None)
+
+    def update(self):
+        (deleting, files_deleted, dirs_deleted, dirs_total) = geo.trash_collector.get_progress()
+        if deleting:
+            self.set_label(f'Deleting GeotabDemo Data: {dirs_deleted}/{dirs_total} ({files_deleted} files)')
+            self.show()
+        else:
+            self.hide()
+        return False
 
 
 class AutoSwitchDbPasswordTaskCheckMenuItem(PersistentCheckMenuItem):
@@ -366,7 +267,7 @@ class AutoSwitchDbPasswordTaskCheckMenuItem(PersistentCheckMenuItem):
                          default_state=True)
         self.parent = parent
         self.app = app
-        # parent.register_auto_switch_task('GeotabDemo Data', self.auto_clean_geotab_demo_data, self.is_enabled)
+        # parent.core.auto_switch.register_task('DB Password', self.auto_switch_db_password, self.is_enabled)
 
     # def auto_switch_db_password(self):
     #     if not self.enabled:
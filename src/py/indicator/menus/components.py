@@ -1,11 +1,15 @@
+import bisect
 
 from indicator import *
 from indicator.geo_indicator import IndicatorApp
+from indicator.profiler import profiler
+
+# Lazy menus that haven't been opened yet are built this long (in ms) after they are created.
+LAZY_MENU_BUILD_DELAY = 2000
 
 
 class PersistentCheckMenuItem(Gtk.CheckMenuItem):
     enabled = True
-    monitor_update = False
     label_checked = None
     label_unchecked = None
 
@@ -18,21 +22,17 @@ class PersistentCheckMenuItem(Gtk.CheckMenuItem):
         self.app_state_id = app_state_id
         self.config_id = config_id
         self.app = app
-        self.enabled = default_state
+        self.enabled = self.get_config_state()
+        self.set_app_state(self.enabled)
+        # Set the active state before connecting the toggled signal to handle_toggle. This is needed because setting the
+        #  active state causes handle_toggle to be called.
         self.set_active(self.enabled)
+        self.toggled_handler_id = self.connect('toggled', self.handle_toggle)
         # self.set_draw_as_radio(True)
         self.show_all()
-        GLib.timeout_add(50, self.init)
-        GLib.timeout_add(3000, self.monitor)
-
-    def init(self):
-        state = self.get_config_state()
-        self.enabled = state
-        self.set_app_state(state)
-        # Set the active state before connecting the toggled signal to handle_toggle. This is needed because setting the
-        #  active state causes handle_toggle to be called.
-        self.set_active(state)
-        self.connect('toggled', self.handle_toggle)
+        # Subscribed last: if the status was already published (e.g. the item is in a lazy menu), monitor is called right
+        # away, and the item has to be fully set up by then.
+        app.status.subscribe(self.monitor, 'config_version')
 
     # To be overridden by subclasses.
     def on_state_changed(self, new_state):
@@ -63,9 +63,6 @@ class PersistentCheckMenuItem(Gtk.CheckMenuItem):
     def handle_toggle(self, src):
         new_state = self.get_active()
         print(f'{self.get_label()} toggle = ' + str(new_state))
-        if self.monitor_update:
-            self.monitor_update = False
-            return
         enabled = self.get_config_state()
         if new_state == enabled:
             return
@@ -77,16 +74,137 @@ class PersistentCheckMenuItem(Gtk.CheckMenuItem):
         self.on_state_changed(new_state)
         self.show()
 
-    def monitor(self):
+    def monitor(self, snapshot=None):
         enabled = self.get_config_state()
         if self.enabled != enabled:
-            # The active state of the check item determines if the checkmark is shown on it. For some reason, setting this
-            # will also fire the toggled signal. So use monitor_update to stop an infinite loop.
-            self.monitor_update = True
+            # The active state of the check item determines if the checkmark is shown on it. Setting it also fires the
+            # toggled signal, so handle_toggle is blocked while it's set (it would write the config back).
             self.enabled = enabled
             # self.set_config_state(enabled)
             self.app.set_state(self.app_state_id, enabled)
-            self.set_active(enabled)
+            self.handler_block(self.toggled_handler_id)
+            try:
+                self.set_active(enabled)
+            finally:
+                self.handler_unblock(self.toggled_handler_id)
             self.on_state_changed(enabled)
             self.show()
         return True
+
+
+class LazyMenu(Gtk.Menu):
+    """
+    A submenu whose items are only built when it's first shown, so that building it doesn't delay the tray icon from
+    appearing at startup. build(menu) appends the items. If the menu hasn't been opened by LAZY_MENU_BUILD_DELAY ms
+    after it was created, it's built when the main loop is idle, so that it's ready before it's needed.
+    """
+    def __init__(self, build, name='submenu'):
+        super().__init__()
+        self.build = build
+        self.name = name
+        self.built = False
+        # Otherwise show_all on the menu item would show (and build) the menu as soon as the item is shown.
+        self.set_no_show_all(True)
+        self.connect('show', lambda _: self.ensure_built())
+        GLib.timeout_add(LAZY_MENU_BUILD_DELAY, self.schedule_build)
+
+    def schedule_build(self):
+        if not self.built:
+            GLib.idle_add(self.ensure_built, priority=GLib.PRIORITY_LOW)
+        return False
+
+    def ensure_built(self):
+        # Returns False so that it can be used as a one-shot GLib callback.
+        if self.built:
+            return False
+        self.built = True
+        with profiler.phase(f'build {self.name}'):
+            self.build(self)
+            for item in self.get_children():
+                item.show_all()
+        return False
+
+
+def longest_increasing_subsequence(values):
+    """Returns the indexes (into values) of a longest strictly increasing subsequence of values."""
+    # tails[k] is the index of the smallest value that ends an increasing subsequence of length k + 1.
+    tails = []
+    tail_values = []
+    prev = [-1] * len(values)
+    for (i, value) in enumerate(values):
+        k = bisect.bisect_left(tail_values, value)
+        if k > 0:
+            prev[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    result = []
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        result.append(i)
+        i = prev[i]
+    return result[::-1]
+
+
+class MenuReconciler:
+    """
+    Keeps the keyed items of a Gtk.Menu in a given order using the fewest insert/move/remove operations. Items are
+    reused by key; create_item(key) is only called for keys that aren't in the menu yet.
+
+    The managed items start at position offset in the menu. Unmanaged items can come before them (offset) or after
+    them, but not in between.
+    """
+    def __init__(self, menu: Gtk.Menu, create_item, offset=0):
+        self.menu = menu
+        self.create_item = create_item
+        self.offset = offset
+        # Maps keys to their items.
+        self.items = {}
+        # The keys of the managed items, in menu order.
+        self.keys = []
+
+    def reconcile(self, keys):
+        """Updates the menu so that it contains exactly the items for keys, in that order."""
+        keys = list(dict.fromkeys(keys))
+        new_positions = {key: i for (i, key) in enumerate(keys)}
+        for key in [k for k in self.keys if k not in new_positions]:
+            self.remove(key)
+        # The items that are already in the right order relative to each other (the longest increasing run of their new
+        # positions) stay where they are; only the others are moved.
+        remaining = self.keys
+        stable = {remaining[i] for i in longest_increasing_subsequence([new_positions[k] for k in remaining])}
+        for key in remaining:
+            if key not in stable:
+                self.menu.remove(self.items[key])
+        # Now the menu only has the stable items, in order. Inserting the rest in order puts every item in its place.
+        for (i, key) in enumerate(keys):
+            if key in stable:
+                continue
+            item = self.items.get(key)
+            if item is None:
+                item = self.create_item(key)
+                item.show()
+                self.items[key] = item
+            self.menu.insert(item, self.offset + i)
+        self.keys = keys
+
+    def reverse(self):
+        """Reverses the order of the items (one move per item, instead of a remove and insert)."""
+        self.keys.reverse()
+        for (i, key) in enumerate(self.keys):
+            self.menu.reorder_child(self.items[key], self.offset + i)
+
+    def remove(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        self.keys = [k for k in self.keys if k != key]
+        self.menu.remove(item)
+        item.destroy()
+
+    def clear(self):
+        for key in list(self.keys):
+            self.remove(key)
@@ -6,14 +6,17 @@
 # gi.require_version('Gio', '2.0')
 # from gi.repository import Gtk, GLib, Gio, Notify, GdkPixbuf
 
-import re
+import bisect
+import time
 
 from indicator import *
 from indicator.geo_indicator import IndicatorApp
 # from common import geo
 from indicator import icons
-from indicator.menus.components import PersistentCheckMenuItem
-from .auto_switch import to_key
+from common.db_metadata import format_age, format_size
+from common.db_names import get_version_sort_key
+from indicator.menus.components import LazyMenu, MenuReconciler, PersistentCheckMenuItem
+from core.auto_switch import get_release_config_key
 
 def get_running_db_label_text(db):
     return '⛀ Running DB [%s]' % db
@@ -33,36 +36,33 @@ class RunningDbMenuItem(Gtk.MenuItem):
         self.app = app
         self.running_db = ''
         # self.auto_switch_db_based_on_myg_release = geo.get_config('AUTO_SWITCH_DB') != 'false'
-        self.db_monitor()
-        self.stop_menu = Gtk.Menu()
+        self.stop_menu = LazyMenu(self.build_stop_menu, 'running db menu')
+        self.set_submenu(self.stop_menu)
+        self.show_all()
+        app.status.subscribe(self.db_monitor, 'running_db')
+
+    def build_stop_menu(self, menu):
         item_stop_db = Gtk.MenuItem(label='Stop')
         item_ssh = Gtk.MenuItem(label='SSH')
         item_psql = Gtk.MenuItem(label='PSQL')
         # item_rm = Gtk.MenuItem(label='Remove')
-        item_copy_db = CopyDatabaseMenuItem(app=app)
-        item_init_db = InitDatabaseMenuItem(app=app)
+        item_copy_db = CopyDatabaseMenuItem(app=self.app)
+        item_init_db = InitDatabaseMenuItem(app=self.app)
         item_stop_db.connect('activate', self.stop_db)
         item_ssh.connect('activate', lambda _: geo.run_in_terminal('db ssh'))
         item_psql.connect('activate', lambda _: geo.run_in_terminal('db psql'))
         # item_rm.connect('activate', lambda _: geo.db(f'rm {self.app.db}'))
-        self.stop_menu.append(item_stop_db)
-        self.stop_menu.append(item_ssh)
-        self.stop_menu.append(item_psql)
-        self.stop_menu.append(item_copy_db)
-        self.stop_menu.append(item_init_db)
-        # self.stop_menu.append(item_rm)
-        self.set_submenu(self.stop_menu)
-        self.show_all()
-        GLib.timeout_add(2000, self.db_monitor)
+        menu.append(item_stop_db)
+        menu.append(item_ssh)
+        menu.append(item_psql)
+        menu.append(item_copy_db)
+        menu.append(item_init_db)
+        # menu.append(item_rm)
 
     def stop_db(self, source):
         self.set_db_label('Stopping DB...')
         self.set_sensitive(False)
-        def run():
-            geo.stop_db()
-            self.set_db_label(get_running_db_none_label_text())
-
-        GLib.timeout_add(10, run)
+        geo.run_async(geo.stop_db, lambda _: self.set_db_label(get_running_db_none_label_text()), key='stop_db')
 
     def set_db_label(self, text):
         # print('Running db text: ' + text)
@@ -70,10 +70,10 @@ class RunningDbMenuItem(Gtk.MenuItem):
         self.show()
         self.queue_draw()
 
-    def db_monitor(self):
+    def db_monitor(self, snapshot=None):
         # Poll for running db name, if it doesn't equal self
-        cur_running_db = geo.get_running_db_name()
-        self.app.db = cur_running_db
+        snapshot = snapshot or self.app.status.snapshot
+        cur_running_db = snapshot.running_db
         if cur_running_db == self.running_db and 'Stopping' in self.get_label():
             pass
         elif len(cur_running_db) == 0:
@@ -89,9 +89,14 @@ class RunningDbMenuItem(Gtk.MenuItem):
             label = get_running_db_label_text(cur_running_db)
             self.set_db_label(label)
             self.app.icon_manager.set_icon(icons.GREEN)
-            if self.starting_up or self.skip_next_notification:
+            # Dbs started by the auto-switch tasks are already reported in the tasks' notification.
+            auto_switch = self.app.core.auto_switch
+            started_by_auto_switch = cur_running_db == auto_switch.started_db
+            if self.starting_up or self.skip_next_notification or started_by_auto_switch:
                 self.starting_up = False
                 self.skip_next_notification = False
+                if started_by_auto_switch:
+                    auto_switch.started_db = ''
             else:
                 self.app.show_quick_notification('DB Started: ' + cur_running_db)
         self.running_db = cur_running_db
@@ -103,51 +108,64 @@ class RunningDbMenuItem(Gtk.MenuItem):
             return
         submenu = self.app.item_databases.get_submenu()
         for item in submenu.items.values():
-            if item.name == self.running_db:
-                item.item_start.set_sensitive(False)
-            else:
-                item.item_start.set_sensitive(True)
+            item.set_startable(item.name != self.running_db)
             item.show()
 
 
+# The db menu's sort modes, mapped to the config key and app state id of their check items.
+SORT_LEXICAL = 'lexical'
+SORT_MYG_VERSION = 'myg_version'
+SORT_LAST_USED = 'last_used'
+SORT_SIZE = 'size'
+SORT_MODES = {
+    SORT_LEXICAL: ('SORT_LEXICAL', 'sort_lexical'),
+    SORT_MYG_VERSION: ('SORT_MYG_VERSION', 'sort_myg_version'),
+    SORT_LAST_USED: ('SORT_LAST_USED', 'sort_last_used'),
+    SORT_SIZE: ('SORT_SIZE', 'sort_size'),
+}
+# The sort modes that use the db metadata table.
+METADATA_SORT_MODES = {SORT_LAST_USED, SORT_SIZE}
+
+
 class DbMenu(Gtk.Menu):
     db_names = set()
     prev_sort_descending = None
-    prev_sort_by_myg_version = None
+    prev_sort_mode = None
 
     def __init__(self, app: IndicatorApp):
         self.app = app
         self.item_running_db = app.item_running_db
         super().__init__()
-        self.items = dict()
-        GLib.timeout_add(2000, self.db_monitor)
-
-    def build_db_items(self):
-        dbs = geo.get_geo_db_names()
-        dbs = self.sorted(dbs)
+        # The db items come first, followed by the sort items.
+        self.db_items = MenuReconciler(self, lambda db: DbMenuItem(db, self.app))
+        self.items = self.db_items.items
+        self.sort_index = DbSortIndex(geo.db_metadata.get)
+        self.sort_items_added = False
+        app.status.subscribe(self.db_monitor, 'dbs')
+        app.status.subscribe(self.db_metadata_monitor, 'db_metadata_version')
+        # Keep the ages up to date.
+        self.connect('show', self.update_item_labels)
+
+    def build_db_items(self, dbs):
         self.db_names = set(dbs)
-        for db in dbs:
-            db_item = DbMenuItem(db, self.app)
-            self.items[db] = db_item
-            self.append(db_item)
-        # self.queue_draw()
-        self.append(SortLexicalCheckMenuItem(self.app))
-        self.append(SortMygVersionCheckMenuItem(self.app))
-        self.append(SortDirectionCheckMenuItem(self.app))
+        self.update_sort_order()
+        self.sort_index.update(dbs)
+        self.db_items.reconcile(self.sort_index.ordered())
+        if not self.sort_items_added:
+            self.append(SortLexicalCheckMenuItem(self.app))
+            self.append(SortMygVersionCheckMenuItem(self.app))
+            self.append(SortLastUsedCheckMenuItem(self.app))
+            self.append(SortSizeCheckMenuItem(self.app))
+            self.append(SortDirectionCheckMenuItem(self.app))
+            self.sort_items_added = True
         self.show_all()
 
-    def remove_items(self):
-        for item in self.get_children():
-            if not item.name:
-                continue
-            self.remove(item)
-            self.items.pop(item)
-            item.destroy()
-        # self.queue_draw()
-        self.show_all()
+    def remove_db_item(self, db):
+        self.db_items.remove(db)
+        self.sort_index.remove(db)
 
-    def db_monitor(self):
-        new_db_names = set(geo.get_geo_db_names())
+    def db_monitor(self, snapshot):
+        new_db_names = set(snapshot.dbs)
         self.app.set_state('dbs', new_db_names)
         if new_db_names != self.db_names:
             self.update_items(new_db_names)
@@ -156,6 +174,17 @@ class DbMenu(Gtk.Menu):
         self.db_names = new_db_names
         return True
 
+    def update_item_labels(self, *args):
+        for item in self.items.values():
+            item.update_label()
+
+    def db_metadata_monitor(self, snapshot):
+        self.update_item_labels()
+        # The last used and size sort keys come from the metadata, so they have to be recomputed.
+        if self.sort_index.mode in METADATA_SORT_MODES:
+            self.sort_index.rekey()
+            self.db_items.reconcile(self.sort_index.ordered())
+
     def update_items(self, new_db_names):
         removed = self.db_names - new_db_names
         if removed:
@@ -165,98 +194,154 @@ class DbMenu(Gtk.Menu):
             print(f'DbMenu.update_items: Added: {added}')
         if not removed and not added:
             return
-        if not self.items:
-            self.build_db_items()
-            return
-        for db in removed:
-            if db not in self.items: continue
-            item = self.items.pop(db)
-            item.hide()
-            item.set_sensitive(False)
-            self.remove(item)
-            item.destroy()
-        sorted_items = self.sorted(self.items)
-        # sorted_items = sorted(self.items, reverse=True, key=db_name_sorter)
-        for db in added:
-            if db in self.items: continue
-            item = DbMenuItem(db, self.app)
-            item.show()
-            i = 0
-            # Find index to insert the db item so that it is sorted in descending order.
-            while i < len(sorted_items) and self.db_compare(db, sorted_items[i]) < 0:
-            # while i < len(sorted_items) and db_name_comparer(db, sorted_items[i]) < 0:
-            # while i < len(sorted_items) and db < sorted_items[i]:
-                i += 1
-            self.insert(item, i)
-            sorted_items.insert(i, item.name)
-            self.items[db] = item
-        if not added:
-            self.show_all()
-            return
-
-        self.show_all()
-        self.queue_draw()
+        self.build_db_items(new_db_names)
+        self.item_running_db.update_db_start_items()
 
     def check_sort(self):
-        sort_by_myg_release = self.app.get_state('sort_myg_version', False)
-        sort_descending = self.app.get_state('sort_direction', True)
-        if sort_descending == self.prev_sort_descending and sort_by_myg_release == self.prev_sort_by_myg_version:
-            return
-
+        (rekeyed, flipped) = self.update_sort_order()
+        if rekeyed:
+            # Only the items that are out of place are moved.
+            self.db_items.reconcile(self.sort_index.ordered())
+        elif flipped:
+            self.db_items.reverse()
+
+    def get_sort_mode(self):
+        for mode in (SORT_SIZE, SORT_LAST_USED, SORT_MYG_VERSION):
+            if self.app.get_state(SORT_MODES[mode][1], False):
+                return mode
+        return SORT_LEXICAL
+
+    def update_sort_order(self):
+        """Applies the sort settings to the sort index. Returns (whether it was re-keyed, whether it was reversed)."""
+        sort_mode = self.get_sort_mode()
+        sort_descending = bool(self.app.get_state('sort_direction', True))
+        if sort_descending == self.prev_sort_descending and sort_mode == self.prev_sort_mode:
+            return (False, False)
         self.prev_sort_descending = sort_descending
-        self.prev_sort_by_myg_version = sort_by_myg_release
-
-        sorted_dbs = self.sorted(self.items)
-        for db in sorted_dbs:
-            self.remove(self.items[db])
-        db_order = zip(range(len(sorted_dbs)), sorted_dbs)
-        for i, db in db_order:
-            self.insert(self.items[db], i)
+        self.prev_sort_mode = sort_mode
+        rekeyed = self.sort_index.set_mode(sort_mode)
+        flipped = self.sort_index.descending != sort_descending
+        self.sort_index.descending = sort_descending
+        return (rekeyed, flipped)
+
+
+class DbSortIndex:
+    """
+    The db names in sorted order. Each name's sort key is only computed once (until the mode or the metadata changes),
+    new names are placed with bisect, and changing the sort direction just reverses the order.
+    """
+    def __init__(self, get_metadata):
+        # Returns the DbMetadata of a db (or None).
+        self.get_metadata = get_metadata
+        self.mode = SORT_LEXICAL
+        self.descending = True
+        # In ascending order.
+        self.names = []
+        self.keys = []
+        self.key_cache = {}
+
+    def get_key(self, name):
+        key = self.key_cache.get(name)
+        if key is None:
+            key = self.key_cache[name] = self.make_key(name)
+        return key
+
+    def make_key(self, name):
+        if self.mode == SORT_MYG_VERSION:
+            return get_version_sort_key(name)
+        if self.mode in METADATA_SORT_MODES:
+            metadata = self.get_metadata(name)
+            value = None
+            if metadata:
+                value = metadata.last_used if self.mode == SORT_LAST_USED else metadata.size
+            # Dbs without metadata come first (or last when descending). The name keeps the order consistent.
+            return (value if value is not None else -1, name)
+        return name
+
+    def set_mode(self, mode):
+        """Re-keys the index if the sort mode changed. Returns True if it did."""
+        if mode == self.mode:
+            return False
+        self.mode = mode
+        self.rekey()
+        return True
 
-    def sorted(self, items):
-        sort_by_myg_release = self.app.get_state('sort_myg_version', False)
-        sort_descending = self.app.get_state('sort_direction', True)
-        if sort_by_myg_release:
-            return sorted(items, reverse=sort_descending, key=db_name_sorter)
-        return sorted(items, reverse=sort_descending)
+    def rekey(self):
+        self.key_cache = {}
+        self.names.sort(key=self.get_key)
+        self.keys = [self.get_key(name) for name in self.names]
+
+    def update(self, names):
+        names = set(names)
+        current = set(self.names)
+        for name in current - names:
+            self.remove(name)
+        for name in names - current:
+            self.add(name)
+
+    def add(self, name):
+        key = self.get_key(name)
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.names.insert(i, name)
+
+    def remove(self, name):
+        key = self.get_key(name)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.names) and self.names[i] == name:
+            del self.keys[i]
+            del self.names[i]
+        self.key_cache.pop(name, None)
+
+    def ordered(self):
+        return self.names[::-1] if self.descending else list(self.names)
+
+
+class SortModeCheckMenuItem(PersistentCheckMenuItem):
+    """A check item that selects one of the sort modes. Only one of them is checked at a time."""
+    def __init__(self, app: IndicatorApp, label, mode, default_state=False):
+        (config_id, app_state_id) = SORT_MODES[mode]
+        super().__init__(app,
+                         label=label,
+                         config_id=config_id,
+                         app_state_id=app_state_id,
+                         default_state=default_state)
+        self.app = app
+        self.mode = mode
 
-    def db_compare(self, a, b):
-        sort_by_myg_release = self.app.get_state('sort_myg_version')
-        sort_descending = self.app.get_state('sort_direction')
-        sort_by_myg_release = True if sort_by_myg_release else False
-        sort_descending = True if sort_descending else False
+    def on_state_changed(self, new_state):
+        if new_state:
+            for (mode, (config_id, app_state_id)) in SORT_MODES.items():
+                if mode != self.mode:
+                    geo.set_config(config_id, self.bool_to_string(False))
+                    self.app.set_state(app_state_id, False)
+        elif not any(self.app.get_state(app_state_id, False) for (_, app_state_id) in SORT_MODES.values()):
+            # Unchecking the current mode switches to lexical (or to MyG version if lexical was unchecked).
+            fallback = SORT_MYG_VERSION if self.mode == SORT_LEXICAL else SORT_LEXICAL
+            (config_id, app_state_id) = SORT_MODES[fallback]
+            geo.set_config(config_id, self.bool_to_string(True))
+            self.app.set_state(app_state_id, True)
+        self.app.item_databases.get_submenu().check_sort()
+
+
+class SortLexicalCheckMenuItem(SortModeCheckMenuItem):
+    def __init__(self, app: IndicatorApp):
+        super().__init__(app, label='Sort: Lexical', mode=SORT_LEXICAL, default_state=True)
 
-        if sort_by_myg_release:
-            return db_name_comparer(a, b, sort_descending)
-        direction = -1 if sort_descending else 1
-        return 1 * direction if a > b else -1 * direction if a < b else 0
 
+class SortMygVersionCheckMenuItem(SortModeCheckMenuItem):
+    def __init__(self, app: IndicatorApp):
+        super().__init__(app, label='Sort: MyG Version', mode=SORT_MYG_VERSION)
 
 
-class SortLexicalCheckMenuItem(PersistentCheckMenuItem):
+class SortLastUsedCheckMenuItem(SortModeCheckMenuItem):
     def __init__(self, app: IndicatorApp):
-        super().__init__(app,
-                         label='Sort: Lexical',
-                         config_id='SORT_LEXICAL',
-                         app_state_id='sort_lexical',
-                         default_state=True)
-        self.app = app
-
-    def on_state_changed(self, new_state):
-        geo.set_config('SORT_MYG_VERSION', self.bool_to_string(False if new_state else True))
+        super().__init__(app, label='Sort: Last Used', mode=SORT_LAST_USED)
 
 
-class SortMygVersionCheckMenuItem(PersistentCheckMenuItem):
+class SortSizeCheckMenuItem(SortModeCheckMenuItem):
     def __init__(self, app: IndicatorApp):
-        super().__init__(app,
-                         label='Sort: MyG Version',
-                         config_id='SORT_MYG_VERSION',
-                         app_state_id='sort_myg_version',
-                         default_state=False)
-        self.app = app
-
-    def on_state_changed(self, new_state):
-        geo.set_config('SORT_LEXICAL', self.bool_to_string(False if new_state else True))
+        super().__init__(app, label='Sort: Size', mode=SORT_SIZE)
 
 
 class SortDirectionCheckMenuItem(PersistentCheckMenuItem):
@@ -269,48 +354,9 @@ class SortDirectionCheckMenuItem(PersistentCheckMenuItem):
                          label_unchecked='Sort Direction: Ascending')
         self.app = app
 
+    def on_state_changed(self, new_state):
+        self.app.item_databases.get_submenu().check_sort()
 
-# num_pattern = re.compile(r'^[1-9]\d+\.\d+', re.UNICODE)
-num_pattern = re.compile(r'^[1-9]\d+([.-_]\d+)?', re.UNICODE)
-# num_pattern = re.compile(r'^\d+\.\d+', re.UNICODE)
-# num_pattern = re.compile(r'^\d+(\.\d+)?', re.UNICODE)
-# suffix_pattern = re.compile(r'(?<=[\w-]+$', re.UNICODE)
-
-def db_name_sorter(a):
-    # Remove trailing 0s.
-    a = re.sub('^0+','', a)
-    match = re.search(num_pattern, a)
-    suffix = ''
-    prefix = 0
-    if match:
-        prefix = 1
-        group = match.group()
-        if '.' not in group:
-            n = int(group)
-            if n >= 60 and n < 100 or n < 10 or n >= 1900:
-                prefix = 0
-    # print((prefix, a))
-    return (prefix, a)
-
-
-def db_name_comparer(a, b, reverse=False):
-    a_comp = db_name_sorter(a)
-    b_comp = db_name_sorter(b)
-    # print(f'{a_comp}:{b_comp}')
-    result = 0
-    if a_comp[0] > b_comp[0]:
-        result = 1
-    elif a_comp[0] < b_comp[0]:
-        result = -1
-    else:
-        if a_comp[1] > b_comp[1]:
-            result = 1
-        elif a_comp[1] < b_comp[1]:
-            result = -1
-        else:
-            result = 0
-    result = result * -1 if reverse else result
-    return result
 
 class DbMenuItem(Gtk.MenuItem):
     def __init__(self, name, app: IndicatorApp):
@@ -318,57 +364,84 @@ class DbMenuItem(Gtk.MenuItem):
         self.item_running_db = app.item_running_db
         super().__init__(label=name)
         self.name = name
-        self.set_label(name)
-        self.submenu = Gtk.Menu()
+        self.removing = False
+        self.startable = True
+        self.item_start = None
+        self.update_label()
+        # There can be a lot of dbs, so their submenus are only built when they're needed.
+        self.submenu = LazyMenu(self.build_submenu, f'{name} db menu')
+        self.set_submenu(self.submenu)
+        self.show_all()
+
+    def build_submenu(self, menu):
         self.item_start = Gtk.MenuItem(label='Start')
+        self.item_start.set_sensitive(self.startable)
         self.item_remove = Gtk.MenuItem(label='Remove')
-        self.item_copy_db = CopyDatabaseMenuItem(db_name=name)
-        self.submenu.append(self.item_start)
-        self.submenu.append(self.item_remove)
-        self.submenu.append(self.item_copy_db)
+        self.item_copy_db = CopyDatabaseMenuItem(db_name=self.name)
+        menu.append(self.item_start)
+        menu.append(self.item_remove)
+        menu.append(self.item_copy_db)
         self.item_remove.connect('activate', self.remove_geo_db)
         self.item_start.connect('activate', self.start_geo_db)
-        self.set_submenu(self.submenu)
-        self.show_all()
+
+    def set_startable(self, startable):
+        self.startable = startable
+        if self.item_start:
+            self.item_start.set_sensitive(startable)
+
+    def update_label(self):
+        """Shows the db's size and age (from the db metadata table) next to its name."""
+        if self.removing:
+            return
+        label = self.name
+        metadata = geo.db_metadata.get(self.name)
+        details = []
+        if metadata and metadata.size is not None:
+            details.append(format_size(metadata.size))
+        if metadata and metadata.created:
+            details.append(format_age(time.time() - metadata.created) + ' old')
+        if details:
+            label += '   (%s)' % ', '.join(details)
+        if label != self.get_label():
+            self.set_label(label)
 
     def remove_geo_db(self, src=None):
-        if '(removing)' in self.name:
+        if self.removing:
             return
         if not self.user_confirmed_removal(self.name):
             return
+        self.removing = True
         self.set_label(self.name + ' (removing)')
+        config_cleanup_required = self.app.db_for_myg_release == self.name
+        # print(f'remove_geo_db: {self.app.db_for_myg_release} == {self.name}')
+        # print('config_cleanup_required: ' + str(config_cleanup_required))
+        release_key = get_release_config_key(self.app.myg_release)
         def run():
-            config_cleanup_required = self.app.db_for_myg_release == self.name
-            # print(f'remove_geo_db: {self.app.db_for_myg_release} == {self.name}')
-            # print('config_cleanup_required: ' + str(config_cleanup_required))
-            release_key = 'DB_FOR_RELEASE_' + to_key(self.app.myg_release)
             geo.db('rm ' + self.name)
             if config_cleanup_required:
                 print('remove_geo_db: Removing release key: ' + release_key)
                 geo.rm_config(release_key)
-                self.app.db_for_myg_release = ''
-                self.app.set_state('configured_db_for_myg_release', '')
-            self.app.item_databases.get_submenu().remove(self)
+        def on_removed(_):
+            if config_cleanup_required:
+                self.app.core.db_for_myg_release = ''
             self.set_sensitive(False)
-            return False
-        # GLib.idle_add(run)
-        GLib.timeout_add(5, lambda: run())
+            self.app.item_databases.get_submenu().remove_db_item(self.name)
+        geo.run_async(run, on_removed, key=('rm_db', self.name))
 
     def start_geo_db(self, obj):
         self.item_running_db.set_label('Starting DB...')
-        def run_after_label_update():
-            return_msg = geo.start_db(self.name)
-            if "Port error" in return_msg:
+        def on_started(return_msg):
+            if return_msg and "Port error" in return_msg:
                 geo.run_in_terminal('db start ' + self.name)
             running_db = geo.get_running_db_name()
             if self.name != running_db:
                 self.item_running_db.set_label('Failed to start DB')
+                self.item_running_db.db_monitor()
             else:
-                self.item_start.set_sensitive(False)
+                self.set_startable(False)
                 self.item_running_db.set_db_label(get_running_db_label_text(self.name))
 
-        # Add timeout to allow event loop to update label name while the db start command runs.
-        GLib.timeout_add(10, run_after_label_update)
+        geo.run_async(lambda: geo.start_db(self.name), on_started, key=('start_db', self.name))
 
     def user_confirmed_removal(self, db):
         dialog = Gtk.MessageDialog(
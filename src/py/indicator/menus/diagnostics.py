@@ -0,0 +1,98 @@
+from indicator import *
+from indicator.menus.components import LazyMenu, MenuReconciler
+from indicator.profiler import profiler
+from common.metrics import command_metrics
+
+# How often (in ms) the command stats in the menu are updated while it's open.
+REFRESH_INTERVAL = 10 * 1000
+# The number of commands shown in the menu (the ones that took the most total time).
+MAX_COMMANDS_SHOWN = 15
+
+
+def format_ms(ms):
+    if ms is None:
+        return '-'
+    return f'{ms / 1000:.1f}s' if ms >= 1000 else f'{ms:.0f}ms'
+
+
+def get_command_label(command):
+    label = f"{command['command']}  ×{command['count']}  p50 {format_ms(command['p50_ms'])}  p95 {format_ms(command['p95_ms'])}  max {format_ms(command['max_ms'])}"
+    if command['timeouts']:
+        label += f"  ({command['timeouts']} timed out)"
+    if command['source'] != 'geo':
+        label = f"[{command['source']}] {label}"
+    return label
+
+
+class DiagnosticsMenuItem(Gtk.MenuItem):
+    """Shows how often the indicator runs each command and how long they take, and can dump the metrics to JSON."""
+    def __init__(self, app):
+        super().__init__(label='📈 Diagnostics')
+        self.app = app
+        self.command_items = None
+        self.item_summary = None
+        self.refresh_timer = None
+        submenu = LazyMenu(self.build_submenu, 'Diagnostics menu')
+        # Connected after LazyMenu's own 'show' handler, so the menu is always built by the time it's refreshed.
+        submenu.connect('show', lambda _: self.start_refreshing())
+        submenu.connect('hide', lambda _: self.stop_refreshing())
+        self.set_submenu(submenu)
+
+    def build_submenu(self, menu):
+        self.item_summary = Gtk.MenuItem(label='')
+        self.item_summary.set_sensitive(False)
+        menu.append(self.item_summary)
+
+        def create_command_item(key):
+            item = Gtk.MenuItem(label='')
+            item.set_sensitive(False)
+            return item
+        self.command_items = MenuReconciler(menu, create_command_item, offset=1)
+
+        item_dump = Gtk.MenuItem(label='Dump Metrics to JSON')
+        item_dump.connect('activate', lambda _: self.dump())
+        item_reset = Gtk.MenuItem(label='Reset Metrics')
+        item_reset.connect('activate', lambda _: self.reset())
+        menu.append(Gtk.SeparatorMenuItem())
+        menu.append(item_dump)
+        menu.append(item_reset)
+        self.refresh()
+
+    def start_refreshing(self):
+        self.refresh()
+        if self.refresh_timer is None:
+            self.refresh_timer = GLib.timeout_add(REFRESH_INTERVAL, self.refresh)
+
+    def stop_refreshing(self):
+        if self.refresh_timer is not None:
+            GLib.source_remove(self.refresh_timer)
+            self.refresh_timer = None
+
+    def refresh(self):
+        summary = command_metrics.get_summary()
+        commands = summary['commands'][:MAX_COMMANDS_SHOWN]
+        self.item_summary.set_label(f"{summary['runs_per_minute']} commands/min over {summary['elapsed_seconds'] // 60} min")
+        keys = [(command['source'], command['command']) for command in commands]
+        self.command_items.reconcile(keys)
+        for (key, command) in zip(keys, commands):
+            self.command_items.items[key].set_label(get_command_label(command))
+        return True
+
+    def get_extra_metrics(self):
+        """Other timings to include in the dump: the startup profile and the auto-switch task durations."""
+        extra = {'startup_ms': [{'phase': name, 'start': round(start * 1000, 1), 'duration': round(duration * 1000, 1)}
+                                for (name, start, duration) in profiler.phases]}
+        extra['auto_switch_task_durations_s'] = {name: [round(d, 2) for d in task.durations]
+                                                 for (name, task) in self.app.core.auto_switch.tasks.items()}
+        return extra
+
+    def dump(self):
+        path = command_metrics.dump(extra=self.get_extra_metrics())
+        if path:
+            self.app.show_notification(f'Metrics saved to {path}', timeout=4000)
+        else:
+            self.app.show_notification('Unable to save the metrics')
+
+    def reset(self):
+        command_metrics.reset()
+        self.refresh()
@@ -28,12 +28,12 @@ class GatewayMenuItem(Gtk.MenuItem):
         self.app = app
         self.build_submenu(app)
         self.show_all()
-        GLib.timeout_add(4000, self.monitor)
+        app.status.subscribe(self.monitor, 'gw_running')
 
     def make_titles(self, title, include_version=False):
         window_title = f'{title} [ geo-cli ]'
         if include_version:
-            version = geo.run('dev release')
+            version = self.app.status.snapshot.myg_release
             if version:
                 window_title = f'{title} {version} [ geo-cli ]'
         return window_title
@@ -44,7 +44,7 @@ class GatewayMenuItem(Gtk.MenuItem):
         start_item = Gtk.MenuItem(label='Start')
         start_item.connect('activate', lambda _: self.start_or_restart_gateway('start'))
         stop_item = Gtk.MenuItem(label='Stop')
-        stop_item.connect('activate', lambda _: geo.run('gw stop'))
+        stop_item.connect('activate', lambda _: geo.geo_async('gw stop'))
         restart_item = Gtk.MenuItem(label='Restart')
         restart_item.connect('activate', lambda _: self.start_or_restart_gateway('restart'))
         build_item = Gtk.MenuItem(label='Build')
@@ -85,8 +85,8 @@ class GatewayMenuItem(Gtk.MenuItem):
         title = self.make_titles('Gateway', include_version=True)
         geo.run_in_terminal(f'gw {cmd}', title=title)
 
-    def monitor(self):
-        gw_running = geo.run('gw is-running', return_success_status=True)
+    def monitor(self, snapshot):
+        gw_running = snapshot.gw_running
         if gw_running != self.app.get_state('gw_running'):
             self.app.set_state('gw_running', gw_running)
         self.gw_running = gw_running
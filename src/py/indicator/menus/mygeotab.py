@@ -28,12 +28,12 @@ class MyGeotabMenuItem(Gtk.MenuItem):
         self.app = app
         self.build_submenu(app)
         self.show_all()
-        GLib.timeout_add(2000, self.monitor)
+        app.status.subscribe(self.monitor, 'myg_running', 'gw_running', 'myg_gw_running')
 
     def make_titles(self, title, include_version=False):
         window_title = f'{title} [ geo-cli ]'
         if include_version:
-            version = geo.run('dev release')
+            version = self.app.status.snapshot.myg_release
             if version:
                 window_title = f'{title} {version} [ geo-cli ]'
         return window_title
@@ -44,9 +44,9 @@ class MyGeotabMenuItem(Gtk.MenuItem):
         start_item = Gtk.MenuItem(label='Start')
         start_item.connect('activate', lambda _: self.start_or_restart_myg('start'))
         stop_item = Gtk.MenuItem(label='Stop')
-        stop_item.connect('activate', lambda _: geo.run('myg stop'))        
+        stop_item.connect('activate', lambda _: geo.geo_async('myg stop'))
         stop_myg_gw_item = Gtk.MenuItem(label='Stop MyG and GW')
-        stop_myg_gw_item.connect('activate', lambda _: geo.run('myg stop-myg-gw'))
+        stop_myg_gw_item.connect('activate', lambda _: geo.geo_async('myg stop-myg-gw'))
         restart_item = Gtk.MenuItem(label='Restart')
         restart_item.connect('activate', lambda _: self.start_or_restart_myg('restart'))
         build_item = Gtk.MenuItem(label='Build')
@@ -56,7 +56,7 @@ class MyGeotabMenuItem(Gtk.MenuItem):
         browser_item = Gtk.MenuItem(label='Open In Browser')
         browser_item.connect('activate', lambda _: webbrowser.open('https://localhost:10001', new=2))
         api_item = Gtk.MenuItem(label='Open API Runner')
-        api_item.connect('activate', lambda _: geo.run('myg api'))
+        api_item.connect('activate', lambda _: geo.geo_async('myg api'))
         clean_item = Gtk.MenuItem(label='Clean')
         clean_item.connect('activate', lambda _: geo.run_in_terminal('myg clean --interactive', stay_open_after=False))
         run_with_gateway_item = Gtk.MenuItem(label='Run with Gateway')
@@ -109,15 +109,14 @@ class MyGeotabMenuItem(Gtk.MenuItem):
         title = self.make_titles('MyGeotab', include_version=True)
         geo.run_in_terminal(f'myg {cmd}', title=title)
 
-    def monitor(self):
-        is_myg_running = geo.run('myg is-running', return_success_status=True)
-        
+    def monitor(self, snapshot):
+        is_myg_running = snapshot.myg_running
+
         if is_myg_running != self.app.get_state('myg_running'): 
             self.app.set_state('myg_running', is_myg_running)
         # print(f"MyGeotabMenuItem: is_myg_running is running: {is_myg_running}")
         
-        # Updated from GatewayMenuItem.monitor.
-        is_running_with_gw = self.app.get_state('gw_running')
+        is_running_with_gw = snapshot.gw_running or snapshot.myg_gw_running
         
         # is_running_with_gw = geo.run('gw is-running', return_success_status=True)
         # print(f"MyGeotabMenuItem: is_running_with_gw is running: {is_running_with_gw}")
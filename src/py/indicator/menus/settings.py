@@ -1,7 +1,8 @@
 import gi
 import webbrowser
 
-from indicator.menus.components import PersistentCheckMenuItem
+from indicator.menus.components import LazyMenu, PersistentCheckMenuItem
+from indicator.menus.diagnostics import DiagnosticsMenuItem
 
 gi.require_version('Gtk', '3.0')
 gi.require_version('AppIndicator3', '0.1')
@@ -17,9 +18,10 @@ class SettingsMenuItem(Gtk.MenuItem):
         super().__init__()
         self.app = app
         self.set_label('⚙️ Settings')
-        submenu = Gtk.Menu()
+        self.set_submenu(LazyMenu(self.build_submenu, 'Settings menu'))
 
-        item_show_notifications = ShowNotificationsMenuItem(app)
+    def build_submenu(self, submenu):
+        item_show_notifications = ShowNotificationsMenuItem(self.app)
 
         item_disable = Gtk.MenuItem(label='⭕ Disable')
         # item_disable = Gtk.MenuItem(label='✖️ Disable')
@@ -40,10 +42,10 @@ class SettingsMenuItem(Gtk.MenuItem):
         # submenu.append(Gtk.SeparatorMenuItem())
         submenu.append(item_readme)
         submenu.append(item_force_update)
+        submenu.append(DiagnosticsMenuItem(self.app))
         submenu.append(item_restart_ui)
         submenu.append(item_disable)
         submenu.append(item_quit)
-        self.set_submenu(submenu)
 
     def show_disable_dialog(self, widget):
         dialog = Gtk.MessageDialog(
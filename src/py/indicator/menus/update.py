@@ -23,17 +23,22 @@ class UpdateMenuItem(Gtk.MenuItem):
         self.app.menu.append(self)
 
         # Run once later so that 'Checking for updates' is initially displayed.
-        GLib.timeout_add(10000, lambda: not self.set_update_status())
-        GLib.timeout_add(update_interval, self.set_update_status)
+        GLib.timeout_add(10000, lambda: not self.check_for_update())
+        GLib.timeout_add(update_interval, self.check_for_update)
 
     def update(self, source):
         geo.update()
-        self.set_update_status()
+        self.check_for_update()
+
+    def check_for_update(self, source=None):
+        # Checking for updates requires a git fetch, so don't block the ui while it runs.
+        geo.run_async(geo.is_update_available, self.set_update_status, key='is_update_available')
+        return True
 
 
 # ↻≫♛♕𝄪∅⇛★✦☆
-    def set_update_status(self, source=None):
-        self.update_available = geo.is_update_available()
+    def set_update_status(self, update_available):
+        self.update_available = update_available
         version = geo.get_config('VERSION')
         if version:
             self.app.set_state('version', version)
@@ -0,0 +1,61 @@
+import contextlib
+import os
+import time
+
+
+def get_process_age():
+    """Returns how many seconds ago this process was started (0 if it can't be determined)."""
+    try:
+        with open('/proc/self/stat') as f:
+            # The process name (field 2) can contain spaces, so the fields are counted from the end of it.
+            fields = f.read().rpartition(')')[2].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        # starttime is field 22, in clock ticks since boot.
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupProfiler:
+    """
+    Records how long each phase of the indicator's startup takes. Times are measured from when the process started, so
+    the report also includes the time spent starting python and importing modules.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter() - get_process_age()
+        # (name, seconds since the process started, duration in seconds) tuples.
+        self.phases = []
+        self.reported = False
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, self.now() - start))
+
+    def mark(self, name):
+        """Records a point in time (e.g. when the first status was published)."""
+        self.phases.append((name, self.now(), 0))
+
+    def get_report(self):
+        lines = ['Startup profile (ms since the process started, duration in ms):']
+        for (name, start, duration) in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f'  {start * 1000:8.1f}  {duration * 1000:8.1f}  {name}')
+        return '\n'.join(lines)
+
+    def report(self):
+        """Prints the report once, if profiling is enabled (with --profile-startup)."""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print(self.get_report(), flush=True)
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the indicator's polling loop without a display.
+
+The indicator (IndicatorApp and all of its menus) runs against a stubbed PyGObject (./gi), a fake docker cli and a
+fake geo-cli.sh (./fakebin), so this runs on a plain Linux box without GTK, docker or a MyGeotab checkout. Each
+scenario runs in its own process with its own HOME, and measures:
+    - the subprocesses that the indicator starts per minute (and which commands they are),
+    - how long the main loop is busy per status poller tick, and the slowest main loop callbacks,
+    - the peak RSS of the indicator process, and the number of live widgets at the end.
+
+With --headless, only the core (core.engine.GeoCore, which geo_daemon.py runs on machines without a display) is run,
+to measure the polling without the menus.
+
+Usage:
+    python3 src/tests/indicator/bench/bench.py [--containers 5,50,200] [--duration 60] [--docker-latency 0.02]
+                                               [--geo-latency 0.1] [--headless] [--json results.json] [--verbose]
+"""
+import argparse
+import fcntl
+import gc
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKEBIN_DIR = os.path.join(BENCH_DIR, 'fakebin')
+PY_SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', '..', '..', 'py'))
+DB_CONTAINER_PREFIX = 'geo_cli_db_postgres_'
+RESULT_PREFIX = 'BENCH_RESULT '
+# The default responses of the fake geo-cli.sh.
+GEO_RESPONSES = {
+    'dev update-available': 'false',
+    'version': '0.0.0',
+}
+
+
+def count_fake_calls():
+    """Returns the number of calls that have been made to the fake docker and geo-cli (in a scenario's process)."""
+    counts = {}
+    for (name, env_name) in (('docker', 'FAKE_DOCKER_DIR'), ('geo', 'FAKE_GEO_DIR')):
+        try:
+            with open(os.path.join(os.environ[env_name], 'calls')) as f:
+                counts[name] = sum(1 for _ in f)
+        except FileNotFoundError:
+            counts[name] = 0
+    return counts
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def get_db_names(count):
+    """Returns count db names that look like the ones geo-cli creates (release numbers and some custom names)."""
+    names = []
+    for i in range(count):
+        names.append(f'{10 + i // 4}_{i % 4}' if i % 5 else f'custom_{i}')
+    return names
+
+
+class Scenario:
+    """A temporary HOME and fake docker/geo-cli state for one benchmark run."""
+    def __init__(self, containers, docker_latency=0, geo_latency=0):
+        self.containers = containers
+        self.docker_latency = docker_latency
+        self.geo_latency = geo_latency
+        self.dir = tempfile.mkdtemp(prefix=f'geo-indicator-bench-{containers}-')
+        self.home_dir = os.path.join(self.dir, 'home')
+        self.docker_dir = os.path.join(self.dir, 'docker')
+        self.geo_dir = os.path.join(self.dir, 'geo')
+        for path in (self.home_dir, self.docker_dir, self.geo_dir):
+            os.makedirs(path)
+        self.set_containers({name: 'running' if i == 0 else 'exited' for (i, name) in enumerate(get_db_names(containers))})
+        with open(os.path.join(self.geo_dir, 'responses'), 'w') as f:
+            for (prefix, output) in GEO_RESPONSES.items():
+                f.write(f'{prefix}\t{output}\n')
+
+    def set_containers(self, states):
+        """Replaces the fake docker's containers with the given db names mapped to their states."""
+        self.update_containers(lambda _: states)
+
+    def update_containers(self, update):
+        """Replaces the fake docker's containers with update(the current db names mapped to their states)."""
+        with open(os.path.join(self.docker_dir, 'containers.lock'), 'w') as lock:
+            # The fake geo-cli updates the containers too (for 'db start').
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            states = update(self.get_containers())
+            tmp_path = os.path.join(self.docker_dir, 'containers.tmp')
+            with open(tmp_path, 'w') as f:
+                for (name, state) in states.items():
+                    f.write(f'{DB_CONTAINER_PREFIX}{name} {state}\n')
+            os.replace(tmp_path, os.path.join(self.docker_dir, 'containers'))
+
+    def get_containers(self):
+        """Returns the fake docker's db names mapped to their states."""
+        states = {}
+        try:
+            with open(os.path.join(self.docker_dir, 'containers')) as f:
+                for line in f:
+                    (name, _, state) = line.strip().partition(' ')
+                    if name:
+                        states[name[len(DB_CONTAINER_PREFIX):]] = state
+        except FileNotFoundError:
+            pass
+        return states
+
+    def add_event(self, action, db):
+        """Sends a container event (e.g. create, start, die or destroy) for the db to 'docker events'."""
+        event = {'Type': 'container', 'Action': action, 'Actor': {'Attributes': {'name': DB_CONTAINER_PREFIX + db}}}
+        with open(os.path.join(self.docker_dir, 'events'), 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+    def get_env(self):
+        env = dict(os.environ)
+        env.update({
+            'HOME': self.home_dir,
+            'PATH': FAKEBIN_DIR + os.pathsep + env.get('PATH', ''),
+            'GEO_CLI_PATH': os.path.join(FAKEBIN_DIR, 'geo-cli.sh'),
+            # There's no docker daemon to talk to, so the indicator falls back to the (fake) docker cli.
+            'DOCKER_HOST': 'unix://' + os.path.join(self.dir, 'no-docker.sock'),
+            'FAKE_DOCKER_DIR': self.docker_dir,
+            'FAKE_DOCKER_LATENCY': str(self.docker_latency),
+            'FAKE_GEO_DIR': self.geo_dir,
+            'FAKE_GEO_LATENCY': str(self.geo_latency),
+            'PYTHONDONTWRITEBYTECODE': '1',
+        })
+        return env
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class ProcessCounter:
+    """Counts the processes that are started with subprocess.Popen (which subprocess.run also uses)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.original_init = subprocess.Popen.__init__
+
+    def install(self):
+        counter = self
+
+        def init(popen, args, *rest, **kwargs):
+            counter.record(args, kwargs.get('shell', False))
+            counter.original_init(popen, args, *rest, **kwargs)
+        subprocess.Popen.__init__ = init
+
+    def record(self, args, shell):
+        if isinstance(args, str):
+            words = args.split()
+        else:
+            words = [str(arg) for arg in args]
+        if words and words[0] in ('/bin/bash', 'bash') and len(words) > 1:
+            words = words[1:]
+        name = ' '.join([os.path.basename(words[0])] + words[1:2]) if words else '?'
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def import_indicator():
+    """Imports the indicator against the stubbed gi package. Returns the IndicatorApp class."""
+    sys.path.insert(0, PY_SRC_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    # The menus import geo_indicator (which imports the menus), so they have to be imported first to break the cycle.
+    # (geo_indicator.py is normally run as a script, so it's imported by the menus as a separate module.)
+    import indicator.menus
+    from indicator.geo_indicator import IndicatorApp
+    return IndicatorApp
+
+
+def import_core():
+    """Imports the headless core (without the indicator or GTK) against the stubbed gi package. Returns the GeoCore class."""
+    sys.path.insert(0, PY_SRC_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    from core.engine import GeoCore
+    return GeoCore
+
+
+def get_loop_stats(dispatches, ticks, duration):
+    """Summarizes the main loop callbacks that ran during the measurement."""
+    durations = sorted(d for (_, _, d) in dispatches)
+    busy = sum(durations)
+    by_callback = {}
+    for (name, _, d) in dispatches:
+        (count, total, longest) = by_callback.get(name, (0, 0, 0))
+        by_callback[name] = (count + 1, total + d, max(longest, d))
+    slowest = sorted(by_callback.items(), key=lambda item: item[1][1], reverse=True)[:10]
+    return {
+        'ticks': ticks,
+        'busy_ms_per_tick': round(busy * 1000 / max(1, ticks), 3),
+        'busy_percent': round(busy * 100 / duration, 3),
+        'callbacks': len(durations),
+        'callback_p50_ms': round(percentile(durations, 0.5) * 1000, 3),
+        'callback_p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'callback_max_ms': round((durations[-1] if durations else 0) * 1000, 3),
+        'slowest_callbacks': [{'callback': name, 'count': count, 'total_ms': round(total * 1000, 2), 'max_ms': round(longest * 1000, 2)}
+                              for (name, (count, total, longest)) in slowest],
+    }
+
+
+def run_scenario(args):
+    """
+    Runs the indicator (or just the core, with --headless) in this process (in a scenario's environment) and prints the
+    results as JSON.
+    """
+    counter = ProcessCounter()
+    counter.install()
+    start = time.perf_counter()
+    if args.headless:
+        GeoCore = import_core()
+    else:
+        IndicatorApp = import_indicator()
+    import_time = time.perf_counter() - start
+    from gi.repository import GLib
+
+    start = time.perf_counter()
+    if args.headless:
+        app = GeoCore(headless=True)
+        app.start()
+    else:
+        app = IndicatorApp(show_startup_notification=False)
+    startup = time.perf_counter() - start
+    first_status = []
+    app.status.subscribe(lambda _: first_status.append(time.perf_counter() - start))
+    # Let the menus finish building and the caches fill up before measuring.
+    GLib.run_for(args.warmup)
+
+    ticks_before = app.status.tick_count
+    GLib.dispatches.clear()
+    counter.reset()
+    calls_before = count_fake_calls()
+    measure_start = time.monotonic()
+    GLib.run_for(args.duration)
+    duration = time.monotonic() - measure_start
+    ticks = app.status.tick_count - ticks_before
+    calls = {name: count - calls_before[name] for (name, count) in count_fake_calls().items()}
+    gc.collect()
+    # The core must not import GTK (or the indicator, which imports it).
+    gtk = sys.modules.get('gi.repository.Gtk')
+    profiler = getattr(sys.modules.get('indicator.profiler'), 'profiler', None)
+
+    result = {
+        'containers': args.run_scenario,
+        'headless': args.headless,
+        'duration_s': round(duration, 1),
+        'import_ms': round(import_time * 1000, 1),
+        'startup_ms': round(startup * 1000, 1),
+        'first_status_ms': round(first_status[0] * 1000, 1) if first_status else None,
+        'subprocesses_per_minute': round(counter.total() * 60 / duration, 1),
+        'subprocesses': dict(sorted(counter.counts.items(), key=lambda item: item[1], reverse=True)),
+        'docker_calls_per_minute': round(calls['docker'] * 60 / duration, 1),
+        'geo_calls_per_minute': round(calls['geo'] * 60 / duration, 1),
+        'main_loop': get_loop_stats(GLib.dispatches, ticks, duration),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'gtk_imported': gtk is not None,
+        'live_widgets': len(gtk.live_widgets) if gtk else 0,
+        'startup_profile': [(name, round(start_s * 1000, 1), round(d * 1000, 1)) for (name, start_s, d) in profiler.phases] if profiler else [],
+    }
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+    # The background threads (e.g. the docker events stream) would keep the process alive.
+    os._exit(0)
+
+
+def run_in_subprocess(scenario, args):
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-scenario', str(scenario.containers),
+           '--duration', str(args.duration), '--warmup', str(args.warmup)] + (['--headless'] if args.headless else [])
+    env = scenario.get_env()
+    output = subprocess.run(cmd, env=env, text=True, capture_output=True, timeout=args.duration + args.warmup + 120)
+    if args.verbose:
+        sys.stderr.write(output.stdout + output.stderr)
+    for line in output.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f'Scenario with {scenario.containers} containers failed:\n{output.stdout[-3000:]}\n{output.stderr[-3000:]}')
+
+
+def print_results(results):
+    header = f"{'containers':>10} {'procs/min':>10} {'docker/min':>11} {'geo/min':>8} {'loop ms/tick':>13} {'p95 cb ms':>10} {'max cb ms':>10} {'busy %':>7} {'RSS MB':>7} {'widgets':>8} {'startup ms':>11}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        loop = r['main_loop']
+        print(f"{r['containers']:>10} {r['subprocesses_per_minute']:>10} {r['docker_calls_per_minute']:>11} {r['geo_calls_per_minute']:>8} {loop['busy_ms_per_tick']:>13} {loop['callback_p95_ms']:>10} "
+              f"{loop['callback_max_ms']:>10} {loop['busy_percent']:>7} {r['peak_rss_mb']:>7} {r['live_widgets']:>8} {r['startup_ms']:>11}")
+    for r in results:
+        top = ', '.join(f'{name} ×{count}' for (name, count) in list(r['subprocesses'].items())[:5])
+        print(f"\n{r['containers']} containers: subprocesses: {top or 'none'}")
+        for cb in r['main_loop']['slowest_callbacks'][:5]:
+            print(f"    {cb['total_ms']:>9.2f} ms total  {cb['max_ms']:>8.2f} ms max  ×{cb['count']:<5} {cb['callback']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the indicator\'s polling loop without a display.')
+    parser.add_argument('--containers', default='5,50,200', help='comma separated numbers of db containers to run scenarios for')
+    parser.add_argument('--duration', type=float, default=60, help='how long to measure each scenario for (seconds)')
+    parser.add_argument('--warmup', type=float, default=5, help='how long to run before measuring (seconds)')
+    parser.add_argument('--docker-latency', type=float, default=0, help='how long each fake docker call takes (seconds)')
+    parser.add_argument('--geo-latency', type=float, default=0, help='how long each fake geo command takes (seconds)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--headless', action='store_true', help='run just the core (like geo_daemon.py), without the indicator')
+    parser.add_argument('--verbose', action='store_true', help='print the output of the indicator')
+    parser.add_argument('--run-scenario', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario is not None:
+        run_scenario(args)
+        return
+
+    results = []
+    for containers in [int(n) for n in args.containers.split(',') if n.strip()]:
+        scenario = Scenario(containers, args.docker_latency, args.geo_latency)
+        try:
+            print(f"Running the {'core' if args.headless else 'indicator'} with {containers} containers for {args.duration:g}s...", file=sys.stderr, flush=True)
+            results.append(run_in_subprocess(scenario, args))
+        finally:
+            scenario.remove()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
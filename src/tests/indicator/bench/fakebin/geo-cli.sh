@@ -0,0 +1,62 @@
+#!/bin/bash
+# A fake geo-cli.sh for the indicator benchmarks. It supports 'geo-cli.sh --api <command>' and the --api-server
+# protocol (see common/api_server.py).
+#   $FAKE_GEO_DIR/responses   Lines of "<command prefix><tab><output>". The first prefix that matches the command is
+#                             used; commands that don't match anything print nothing.
+#   $FAKE_GEO_DIR/calls       Every command is appended to this file, after the time that it finished.
+#   $FAKE_GEO_LATENCY         How long (in seconds) each command takes, e.g. 0.2.
+# 'db start <db>' also updates the fake docker's containers (see fakebin/docker), so that the db is the one running.
+dir="${FAKE_GEO_DIR:?}"
+
+start_db() {
+    local docker_dir="${FAKE_DOCKER_DIR:-}" container="geo_cli_db_postgres_$1" name state stopped=''
+    [[ -f $docker_dir/containers ]] || return 0
+    (
+        flock 9
+        while read -r name state; do
+            [[ -z $name ]] && continue
+            if [[ $name == "$container" ]]; then
+                state=running
+            elif [[ $state == running ]]; then
+                state=exited
+                stopped="$name"
+            fi
+            echo "$name $state"
+        done < "$docker_dir/containers" > "$docker_dir/containers.geo"
+        mv "$docker_dir/containers.geo" "$docker_dir/containers"
+        [[ -n $stopped ]] && echo "{\"Action\": \"die\", \"Actor\": {\"Attributes\": {\"name\": \"$stopped\"}}}" >> "$docker_dir/events"
+        echo "{\"Action\": \"start\", \"Actor\": {\"Attributes\": {\"name\": \"$container\"}}}" >> "$docker_dir/events"
+    ) 9>"$docker_dir/containers.lock"
+}
+
+respond() {
+    local request="$*" prefix output
+    [[ -n $FAKE_GEO_LATENCY ]] && sleep "$FAKE_GEO_LATENCY"
+    [[ $request == "db start "* ]] && start_db "${request##* }"
+    echo "$EPOCHREALTIME geo $request" >> "$dir/calls"
+    [[ -f $dir/responses ]] || return 0
+    while IFS=$'\t' read -r prefix output; do
+        if [[ -n $prefix && $request == "$prefix"* ]]; then
+            echo "$output"
+            return 0
+        fi
+    done < "$dir/responses"
+}
+
+respond_framed() {
+    # Byte counts are needed for the header (not character counts).
+    local LC_ALL=C
+    printf '%d %d %d\n%s' 0 "${#1}" 0 "$1"
+}
+
+if [[ $1 == --api-server ]]; then
+    while IFS= read -r request; do
+        [[ -z $request ]] && continue
+        # The trailing 'x' preserves any new lines at the end of the output.
+        out="$(respond "$request"; echo -n x)"
+        respond_framed "${out%x}"
+    done
+elif [[ $1 == --api ]]; then
+    shift
+    respond "$@"
+fi
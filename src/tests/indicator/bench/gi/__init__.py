@@ -0,0 +1,9 @@
+"""
+A minimal stand-in for PyGObject, so that the indicator can run headless (without a display, GTK or libappindicator)
+in the benchmarks. Only the parts of the API that the indicator uses are implemented. Widgets keep their state in
+plain attributes, and GLib runs a single-threaded main loop that records how long each callback takes.
+"""
+
+
+def require_version(name, version):
+    pass
@@ -0,0 +1,2 @@
+# Some of the menus import Gtk from here (as PyGObject allows).
+from gi.repository import Gtk
@@ -0,0 +1,31 @@
+class IndicatorCategory:
+    SYSTEM_SERVICES = 0
+
+
+class IndicatorStatus:
+    ACTIVE = 0
+
+
+class Indicator:
+    def __init__(self, icon=''):
+        self.icon = icon
+        self.menu = None
+
+    @staticmethod
+    def new(indicator_id, icon, category):
+        return Indicator(icon)
+
+    def set_status(self, status):
+        pass
+
+    def set_title(self, title):
+        pass
+
+    def set_menu(self, menu):
+        self.menu = menu
+
+    def set_icon_full(self, icon, description):
+        self.icon = icon
+
+    def set_secondary_activate_target(self, item):
+        pass
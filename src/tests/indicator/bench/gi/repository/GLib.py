@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_HIGH = -100
+PRIORITY_DEFAULT = 0
+PRIORITY_HIGH_IDLE = 100
+PRIORITY_DEFAULT_IDLE = 200
+PRIORITY_LOW = 300
+
+_ids = itertools.count(1)
+# (due time, priority, id, interval in ms, callback, args) tuples.
+_queue = []
+_removed = set()
+_cond = threading.Condition()
+
+# (callback name, when it started, how long it took in seconds) for every callback that the main loop ran.
+dispatches = []
+record_dispatches = True
+
+
+def _add(ms, priority, fn, args):
+    with _cond:
+        source_id = next(_ids)
+        heapq.heappush(_queue, (time.monotonic() + ms / 1000, priority, source_id, ms, fn, args))
+        _cond.notify()
+    return source_id
+
+
+def timeout_add(ms, fn, *args, priority=PRIORITY_DEFAULT):
+    return _add(ms, priority, fn, args)
+
+
+def timeout_add_seconds(seconds, fn, *args, priority=PRIORITY_DEFAULT):
+    return _add(seconds * 1000, priority, fn, args)
+
+
+def idle_add(fn, *args, priority=PRIORITY_DEFAULT_IDLE):
+    # Called from the background threads, so this is what wakes the loop up to run their callbacks.
+    return _add(0, priority, fn, args)
+
+
+def source_remove(source_id):
+    _removed.add(source_id)
+    return True
+
+
+def get_callback_name(fn):
+    return getattr(fn, '__qualname__', type(fn).__name__)
+
+
+def run_for(seconds):
+    """Runs the main loop for the given number of seconds."""
+    end = time.monotonic() + seconds
+    while True:
+        with _cond:
+            now = time.monotonic()
+            if now >= end:
+                return
+            if not _queue or _queue[0][0] > now:
+                _cond.wait(min(end, _queue[0][0] if _queue else end) - now)
+                continue
+            (_, priority, source_id, ms, fn, args) = heapq.heappop(_queue)
+        if source_id in _removed:
+            _removed.discard(source_id)
+            continue
+        start = time.perf_counter()
+        result = fn(*args)
+        if record_dispatches:
+            dispatches.append((get_callback_name(fn), start, time.perf_counter() - start))
+        if result:
+            with _cond:
+                heapq.heappush(_queue, (time.monotonic() + ms / 1000, priority, source_id, ms, fn, args))
+
+
+class MainLoop:
+    def run(self):
+        pass
+
+    def quit(self):
+        pass
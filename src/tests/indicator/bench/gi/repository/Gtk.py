@@ -0,0 +1,240 @@
+import itertools
+import weakref
+
+# Every widget that has been created and not destroyed (or garbage collected), for counting widgets over time.
+live_widgets = weakref.WeakSet()
+# Signal handler ids are unique across every widget, like in GObject.
+handler_ids = itertools.count(1)
+STOCK_OK = 'gtk-ok'
+STOCK_CANCEL = 'gtk-cancel'
+
+
+class Widget:
+    # The state is kept in private attributes so that it doesn't clash with the attributes of the indicator's subclasses.
+    def __init__(self, *args, label=None, **kwargs):
+        self._label = label if label is not None else (args[0] if args and isinstance(args[0], str) else '')
+        self._handlers = {}
+        self._blocked_handlers = set()
+        self._visible = False
+        self._sensitive = True
+        self._no_show_all = False
+        self._submenu = None
+        self._parent = None
+        live_widgets.add(self)
+
+    def connect(self, signal, callback, *args):
+        handler_id = next(handler_ids)
+        self._handlers.setdefault(signal, []).append((handler_id, callback, args))
+        return handler_id
+
+    def handler_block(self, handler_id):
+        self._blocked_handlers.add(handler_id)
+
+    def handler_unblock(self, handler_id):
+        self._blocked_handlers.discard(handler_id)
+
+    def emit(self, signal, *args):
+        for (handler_id, callback, extra_args) in list(self._handlers.get(signal, [])):
+            if handler_id not in self._blocked_handlers:
+                callback(self, *args, *extra_args)
+
+    def show(self):
+        if not self._visible:
+            self._visible = True
+            self.emit('show')
+
+    def set_no_show_all(self, no_show_all):
+        self._no_show_all = no_show_all
+
+    def show_all(self):
+        if self._no_show_all:
+            return
+        self.show()
+        if self._submenu:
+            self._submenu.show_all()
+        for child in getattr(self, '_children', []):
+            child.show_all()
+
+    def hide(self):
+        if self._visible:
+            self._visible = False
+            self.emit('hide')
+
+    def set_visible(self, visible):
+        self._visible = visible
+
+    def get_visible(self):
+        return self._visible
+
+    def set_sensitive(self, sensitive):
+        self._sensitive = sensitive
+
+    def get_sensitive(self):
+        return self._sensitive
+
+    def queue_draw(self):
+        pass
+
+    def destroy(self):
+        self._handlers = {}
+        live_widgets.discard(self)
+        for child in getattr(self, '_children', []):
+            child.destroy()
+        if self._submenu:
+            self._submenu.destroy()
+
+
+class MenuItem(Widget):
+    def set_label(self, label):
+        self._label = label
+
+    def get_label(self):
+        return self._label
+
+    def set_submenu(self, submenu):
+        self._submenu = submenu
+
+    def get_submenu(self):
+        return self._submenu
+
+    def activate(self):
+        self.emit('activate')
+
+
+class SeparatorMenuItem(MenuItem):
+    pass
+
+
+class CheckMenuItem(MenuItem):
+    _active = False
+
+    def set_active(self, active):
+        changed = active != self._active
+        self._active = active
+        if changed:
+            self.emit('toggled')
+
+    def get_active(self):
+        return self._active
+
+    def set_draw_as_radio(self, draw_as_radio):
+        pass
+
+
+class Container(Widget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._children = []
+
+    def append(self, child):
+        self._children.append(child)
+        child._parent = self
+
+    def add(self, child):
+        self.append(child)
+
+    def pack_start(self, child, *args):
+        self.append(child)
+
+    def insert(self, child, position):
+        self._children.insert(position, child)
+        child._parent = self
+
+    def remove(self, child):
+        if child in self._children:
+            self._children.remove(child)
+            child._parent = None
+
+    def reorder_child(self, child, position):
+        self._children.remove(child)
+        self._children.insert(position, child)
+
+    def get_children(self):
+        return list(self._children)
+
+
+class Menu(Container):
+    pass
+
+
+class Box(Container):
+    pass
+
+
+class Grid(Container):
+    pass
+
+
+class Label(Widget):
+    def set_text(self, text):
+        self._label = text
+
+    def set_justify(self, justification):
+        pass
+
+
+class Button(Widget):
+    pass
+
+
+class Image(Widget):
+    @staticmethod
+    def new_from_icon_name(name, size):
+        return Image()
+
+
+class Orientation:
+    HORIZONTAL = 0
+    VERTICAL = 1
+
+
+class Justification:
+    CENTER = 0
+
+
+class IconSize:
+    MENU = 1
+
+
+class MessageType:
+    WARNING = 0
+
+
+class ButtonsType:
+    OK_CANCEL = 0
+
+
+class ResponseType:
+    OK = -5
+    CANCEL = -6
+
+
+class Dialog(Widget):
+    def add_buttons(self, *buttons):
+        pass
+
+    def set_default_size(self, width, height):
+        pass
+
+    def get_content_area(self):
+        return Box()
+
+    def run(self):
+        return ResponseType.OK
+
+
+class MessageDialog(Dialog):
+    def format_secondary_text(self, text):
+        pass
+
+
+def init(*args):
+    pass
+
+
+def main():
+    pass
+
+
+def main_quit(*args):
+    pass
@@ -0,0 +1,39 @@
+def init(app_name):
+    return True
+
+
+class Urgency:
+    LOW = 0
+    NORMAL = 1
+    CRITICAL = 2
+
+
+class Notification:
+    # (title, body) of every notification that was shown.
+    shown = []
+
+    def __init__(self, title='', body='', icon=None):
+        self.title = title
+        self.body = body
+
+    @staticmethod
+    def new(title, body, icon=None):
+        return Notification(title, body, icon)
+
+    def show(self):
+        Notification.shown.append((self.title, self.body))
+
+    def update(self, title, body, icon=None):
+        (self.title, self.body) = (title, body)
+
+    def close(self):
+        pass
+
+    def set_urgency(self, urgency):
+        pass
+
+    def set_timeout(self, timeout):
+        pass
+
+    def add_action(self, *args):
+        pass
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Stress tests the indicator with synthetic event streams, to catch leaks and behaviour that degrades over time.
+
+Runs the indicator headless (like bench.py) and, while it runs:
+    - switches the MyGeotab branch every few seconds (by rewriting HEAD in a generated git repo with MYG tags), which
+      goes through CheckedOutMygReleaseMenuItem and the auto-switch tasks (the DB task starts the db that is configured
+      for the release with the fake 'geo db start'),
+    - creates and removes db containers (through the fake docker's containers and 'docker events'),
+    - opens and closes IAP tunnels (by locking lock files in ~/.geo-cli/tmp/ar, like 'geo ar tunnel').
+
+It reports:
+    - how long the indicator takes to react to each kind of event (end-to-end, until the menu or the db reflects it),
+    - auto-switch runs that were dropped or duplicated (runs that were coalesced because the branch was switched again
+      while the tasks were running are expected, and counted separately),
+    - widget counts, RSS and main loop time sampled over the run, so that growth shows up as a trend.
+
+Usage:
+    python3 src/tests/indicator/bench/stress.py [--duration 300] [--containers 200] [--flip-interval 3]
+        [--churn-interval 1] [--tunnel-interval 2] [--task-latency 0.5] [--json results.json] [--check]
+
+With --check, the exit code is 1 if any runs were dropped or duplicated, the menus don't match the final state, or the
+number of widgets (other than the db and tunnel items) grows faster than --max-widget-trend per hour.
+"""
+import argparse
+import fcntl
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import bench
+
+DB_FOR_RELEASE_PREFIX = 'DB_FOR_RELEASE_'
+TUNNEL_PORT_BASE = 40000
+TUNNEL_MENU_CLASSES = ('OpenIapTunnelMenu', 'SshOverOpenTunnelMenu', 'BindOverOpenTunnelMenu')
+# How long to let the indicator settle after the last event before checking the final state (seconds).
+SETTLE_TIME = 10
+# How often the harness checks whether the indicator has reacted to the events (ms).
+OBSERVE_INTERVAL = 50
+# The default for --max-widget-trend. A leak of one widget per event is thousands per hour; one widget that is built
+# late in a short run is around a hundred.
+MAX_WIDGET_TREND = 500
+
+
+def get_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def make_release_repo(repo_dir, releases):
+    """Creates a git repo with a branch per release, each with its own MYG/<release> tag. Returns the branch names."""
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=stress', '-c', 'user.email=stress@example.com', *args], cwd=repo_dir,
+                       check=True, capture_output=True)
+    os.makedirs(repo_dir)
+    git('init', '-q', '-b', 'main')
+    git('commit', '-q', '--allow-empty', '-m', 'base')
+    branches = []
+    for release in releases:
+        branch = f'release/{release}'
+        git('checkout', '-q', '-b', branch, 'main')
+        git('commit', '-q', '--allow-empty', '-m', release)
+        git('tag', f'MYG/{release}')
+        branches.append(branch)
+    git('checkout', '-q', 'main')
+    return branches
+
+
+def write_config(home_dir, values):
+    config_dir = os.path.join(home_dir, '.geo-cli')
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, '.geo.conf'), 'w') as f:
+        for (key, value) in values.items():
+            f.write(f'{key}={value}\n')
+
+
+def find_widgets(menu, class_name):
+    """Returns the menu items (in menu and its built submenus) whose class is named class_name."""
+    found = []
+    for item in menu.get_children():
+        if type(item).__name__ == class_name:
+            found.append(item)
+        submenu = item.get_submenu() if hasattr(item, 'get_submenu') else None
+        if submenu is not None:
+            found += find_widgets(submenu, class_name)
+    return found
+
+
+def count_widgets(widget):
+    """Returns the number of widgets in widget's tree (itself, its children and its submenus)."""
+    count = 1
+    for child in widget.get_children() if hasattr(widget, 'get_children') else ():
+        count += count_widgets(child)
+    submenu = widget.get_submenu() if hasattr(widget, 'get_submenu') else None
+    if submenu is not None:
+        count += count_widgets(submenu)
+    return count
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': round(bench.percentile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(bench.percentile(latencies, 0.95) * 1000, 1),
+        'max_ms': round((latencies[-1] if latencies else 0) * 1000, 1),
+    }
+
+
+class Expectations:
+    """Events that the indicator hasn't reacted to yet, and how long it took to react to the others."""
+    def __init__(self):
+        # Maps (kind, key) to when the event happened and the check that is true once the indicator has reacted.
+        self.pending = {}
+        self.latencies = {}
+
+    def expect(self, kind, key, check):
+        # A newer event for the same key replaces the old one (e.g. a container that was removed right after it was
+        # added only has to be gone).
+        self.pending[(kind, key)] = (time.monotonic(), check)
+
+    def observe(self):
+        now = time.monotonic()
+        for ((kind, key), (start, check)) in list(self.pending.items()):
+            if check():
+                self.latencies.setdefault(kind, []).append(now - start)
+                del self.pending[(kind, key)]
+        return True
+
+
+class StressTest:
+    def __init__(self, args, scenario, branches, releases, app):
+        self.args = args
+        self.scenario = scenario
+        self.branches = branches
+        self.releases = releases
+        self.app = app
+        self.random = random.Random(args.seed)
+        self.expectations = Expectations()
+        self.git_dir = os.path.join(scenario.dir, 'repo', '.git')
+        self.tunnel_dir = os.path.join(scenario.home_dir, '.geo-cli', 'tmp', 'ar')
+        os.makedirs(self.tunnel_dir, exist_ok=True)
+        self.db_menu = app.item_databases.get_submenu()
+        self.tunnel_menu = find_widgets(app.menu, 'OpenIapTunnelMenu')[0]
+        # Every menu that has an item per open tunnel.
+        self.tunnel_menus = [menu for class_name in TUNNEL_MENU_CLASSES for menu in find_widgets(app.menu, class_name)]
+        # (wall clock time, release) of every branch switch.
+        self.flips = []
+        self.release_index = 0
+        self.churn_count = 0
+        self.churn_dbs = []
+        # Tunnel keys mapped to their locked files.
+        self.tunnels = {}
+        self.tunnel_count = 0
+        self.samples = []
+        self.window_start = time.monotonic()
+        self.running = True
+
+    def start(self, GLib):
+        GLib.timeout_add(OBSERVE_INTERVAL, self.expectations.observe)
+        GLib.timeout_add(int(self.args.sample_interval * 1000), self.sample)
+        if self.args.flip_interval > 0:
+            GLib.timeout_add(int(self.args.flip_interval * 1000), self.flip)
+        if self.args.churn_interval > 0:
+            GLib.timeout_add(int(self.args.churn_interval * 1000), self.churn)
+        if self.args.tunnel_interval > 0:
+            GLib.timeout_add(int(self.args.tunnel_interval * 1000), self.toggle_tunnel)
+
+    def stop(self):
+        self.running = False
+
+    def flip(self):
+        if not self.running:
+            return False
+        self.release_index = (self.release_index + 1) % len(self.releases)
+        release = self.releases[self.release_index]
+        tmp_path = os.path.join(self.git_dir, 'HEAD.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(f'ref: refs/heads/{self.branches[self.release_index]}\n')
+        os.replace(tmp_path, os.path.join(self.git_dir, 'HEAD'))
+        self.flips.append((time.time(), release))
+        self.expectations.expect('release', 'current', lambda: self.app.myg_release == release)
+        return True
+
+    def churn(self):
+        if not self.running:
+            return False
+        # Keep the number of extra containers around max_churn_containers, adding and removing them at random.
+        if self.churn_dbs and (len(self.churn_dbs) >= self.args.max_churn_containers or self.random.random() < 0.5):
+            db = self.churn_dbs.pop(self.random.randrange(len(self.churn_dbs)))
+
+            def remove(states):
+                states.pop(db, None)
+                return states
+            self.scenario.update_containers(remove)
+            self.scenario.add_event('destroy', db)
+            self.expectations.expect('container', db, lambda: db not in self.db_menu.items)
+        else:
+            self.churn_count += 1
+            db = f'churn_{self.churn_count}'
+            self.churn_dbs.append(db)
+
+            def add(states):
+                states[db] = 'exited'
+                return states
+            self.scenario.update_containers(add)
+            self.scenario.add_event('create', db)
+            self.expectations.expect('container', db, lambda: db in self.db_menu.items)
+        return True
+
+    def toggle_tunnel(self):
+        if not self.running:
+            return False
+        if self.tunnels and (len(self.tunnels) >= self.args.max_tunnels or self.random.random() < 0.5):
+            key = self.random.choice(list(self.tunnels))
+            # Closing the file releases the lock, like a tunnel exiting.
+            self.tunnels.pop(key).close()
+            self.expectations.expect('tunnel', key, lambda: key not in self.tunnel_menu.items.items)
+        else:
+            self.tunnel_count += 1
+            key = (f'stress-ar-{self.tunnel_count}', str(TUNNEL_PORT_BASE + self.tunnel_count))
+            f = open(os.path.join(self.tunnel_dir, f'{key[0]}__{key[1]}'), 'w')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self.tunnels[key] = f
+            self.expectations.expect('tunnel', key, lambda: key in self.tunnel_menu.items.items)
+        return True
+
+    def sample(self):
+        from gi.repository import GLib, Gtk
+        gc.collect()
+        now = time.monotonic()
+        durations = sorted(d for (_, _, d) in GLib.dispatches)
+        GLib.dispatches.clear()
+        window = now - self.window_start
+        self.window_start = now
+        self.samples.append({
+            'time_s': round(now - self.args.start_time, 1),
+            'widgets': len(Gtk.live_widgets),
+            # The widgets that aren't part of a db or tunnel item. The number of items changes as containers and tunnels
+            # come and go, so this is what's expected to stay flat.
+            'other_widgets': len(Gtk.live_widgets) - self.count_item_widgets(),
+            'db_items': len(self.db_menu.items),
+            'tunnel_items': len(self.tunnel_menu.items.items),
+            'rss_mb': get_rss_mb(),
+            'busy_percent': round(sum(durations) * 100 / max(window, 0.001), 3),
+            'callback_p95_ms': round(bench.percentile(durations, 0.95) * 1000, 3),
+            'callback_max_ms': round((durations[-1] if durations else 0) * 1000, 3),
+            'pending_events': len(self.expectations.pending),
+        })
+        return True
+
+    def count_item_widgets(self):
+        items = list(self.db_menu.items.values())
+        for menu in self.tunnel_menus:
+            items += menu.items.items.values()
+        return sum(count_widgets(item) for item in items)
+
+    def get_db_starts(self):
+        """Returns (wall clock time, db) of every 'geo db start' that the auto-switch tasks ran."""
+        starts = []
+        with open(os.path.join(self.scenario.geo_dir, 'calls')) as f:
+            for line in f:
+                (timestamp, _, command) = line.strip().partition(' geo ')
+                if command.startswith('db start'):
+                    starts.append((float(timestamp), command.split()[-1]))
+        return starts
+
+    def check_auto_switch_runs(self, db_for_release):
+        """
+        Matches the branch switches to the dbs that were started. A switch is coalesced if the next db that was started
+        is for a later switch (the tasks were already running and only run again for the latest release), and dropped
+        if no db was started after it at all. A start is duplicated if it's for the same switch as the previous one.
+        """
+        flips = self.flips
+        starts = self.get_db_starts()
+        (latencies, coalesced, dropped, duplicated) = ([], 0, 0, 0)
+        matched_flips = set()
+        for (start_time, db) in starts:
+            # The latest switch to a release with this db that happened before the start.
+            candidates = [i for (i, (flip_time, release)) in enumerate(flips) if flip_time <= start_time and db_for_release[release] == db]
+            if not candidates:
+                continue
+            i = candidates[-1]
+            if i in matched_flips:
+                duplicated += 1
+                continue
+            matched_flips.add(i)
+            latencies.append(start_time - flips[i][0])
+        for i in range(len(flips)):
+            if i in matched_flips:
+                continue
+            if any(j > i for j in matched_flips):
+                coalesced += 1
+            else:
+                dropped += 1
+        return {
+            'switches': len(flips),
+            'db_starts': len(starts),
+            'latency': summarize(latencies),
+            'coalesced': coalesced,
+            'dropped': dropped,
+            'duplicated': duplicated,
+        }
+
+    def get_final_state_errors(self):
+        errors = []
+        containers = set(self.scenario.get_containers())
+        if set(self.db_menu.items) != containers:
+            errors.append(f'the db menu has {len(self.db_menu.items)} items, but there are {len(containers)} containers')
+        tunnels = set(self.tunnels)
+        if set(self.tunnel_menu.items.items) != tunnels:
+            errors.append(f'the tunnel menu has {len(self.tunnel_menu.items.items)} items, but {len(tunnels)} tunnels are open')
+        if self.flips and self.app.myg_release != self.flips[-1][1]:
+            errors.append(f'the release is {self.app.myg_release}, but {self.flips[-1][1]} is checked out')
+        if self.expectations.pending:
+            errors.append(f'{len(self.expectations.pending)} events were never reacted to: {sorted(self.expectations.pending)[:10]}')
+        return errors
+
+
+def get_trend(samples, field):
+    """Returns how much field changed per hour (least squares fit over the samples), to spot slow growth."""
+    points = [(s['time_s'], s[field]) for s in samples]
+    if len(points) < 2:
+        return 0
+    mean_t = sum(t for (t, _) in points) / len(points)
+    mean_v = sum(v for (_, v) in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for (t, _) in points)
+    if not variance:
+        return 0
+    return round(sum((t - mean_t) * (v - mean_v) for (t, v) in points) / variance * 3600, 2)
+
+
+def run(args):
+    releases = [f'11.0.{100 + i}' for i in range(args.releases)]
+    release_dbs = [f'stress_{release.replace(".", "_")}' for release in releases]
+    db_for_release = dict(zip(releases, release_dbs))
+    scenario = bench.Scenario(args.containers, args.docker_latency, args.task_latency)
+    try:
+        scenario.update_containers(lambda states: {**states, **{db: 'exited' for db in release_dbs}})
+        branches = make_release_repo(os.path.join(scenario.dir, 'repo'), releases)
+        config = {
+            'DEV_REPO_DIR': os.path.join(scenario.dir, 'repo'),
+            'AUTO_SWITCH_DB': 'true',
+            # The other tasks would run npm, or need a MyGeotab checkout.
+            'AUTO_NPM_INSTALL': 'false',
+            'AUTO_SERVER_CONFIG': 'false',
+            'AUTO_CLEAN_GEOTAB_DEMO_DATA': 'false',
+        }
+        for (release, db) in db_for_release.items():
+            config[DB_FOR_RELEASE_PREFIX + release.replace('.', '_')] = db
+        write_config(scenario.home_dir, config)
+
+        # The indicator reads HOME (and the rest) when it's imported.
+        os.environ.update(scenario.get_env())
+        os.chdir(scenario.dir)
+        counter = bench.ProcessCounter()
+        counter.install()
+        IndicatorApp = bench.import_indicator()
+        from gi.repository import GLib
+
+        if not args.verbose:
+            sys.stdout = open(os.devnull, 'w')
+        args.start_time = time.monotonic()
+        app = IndicatorApp(show_startup_notification=False)
+        GLib.run_for(args.warmup)
+        test = StressTest(args, scenario, branches, releases, app)
+        test.start(GLib)
+        GLib.run_for(args.duration)
+        test.stop()
+        GLib.run_for(SETTLE_TIME)
+        test.sample()
+        sys.stdout = sys.__stdout__
+
+        samples = test.samples
+        return {
+            'duration_s': args.duration,
+            'containers': args.containers,
+            'reaction_latency': {kind: summarize(latencies) for (kind, latencies) in test.expectations.latencies.items()},
+            'auto_switch': test.check_auto_switch_runs(db_for_release),
+            'subprocesses': counter.total(),
+            'widgets': {'first': samples[0]['widgets'], 'last': samples[-1]['widgets'], 'max': max(s['widgets'] for s in samples),
+                        # Fitted to the widgets that don't belong to an item, so that containers and tunnels being added
+                        # during the run don't show up as growth.
+                        'per_hour': get_trend(samples, 'other_widgets')},
+            'rss_mb': {'first': samples[0]['rss_mb'], 'last': samples[-1]['rss_mb'], 'max': max(s['rss_mb'] for s in samples),
+                       'per_hour': get_trend(samples, 'rss_mb')},
+            'busy_percent_per_hour': get_trend(samples, 'busy_percent'),
+            'final_state_errors': test.get_final_state_errors(),
+            'samples': samples,
+        }
+    finally:
+        sys.stdout = sys.__stdout__
+        scenario.remove()
+
+
+def print_results(results):
+    print(f"Ran for {results['duration_s']:g}s with {results['containers']} containers, {results['subprocesses']} subprocesses started")
+    print('\nReaction latency (until the indicator shows the change):')
+    for (kind, stats) in results['reaction_latency'].items():
+        print(f"    {kind:<10} ×{stats['count']:<5} p50 {stats['p50_ms']:>8} ms   p95 {stats['p95_ms']:>8} ms   max {stats['max_ms']:>8} ms")
+    auto_switch = results['auto_switch']
+    latency = auto_switch['latency']
+    print(f"\nAuto-switch: {auto_switch['switches']} branch switches, {auto_switch['db_starts']} db starts, "
+          f"{auto_switch['coalesced']} coalesced, {auto_switch['dropped']} dropped, {auto_switch['duplicated']} duplicated")
+    print(f"    switch => db started: p50 {latency['p50_ms']} ms   p95 {latency['p95_ms']} ms   max {latency['max_ms']} ms")
+    print(f"\n{'time s':>8} {'widgets':>8} {'other':>6} {'db items':>9} {'tunnels':>8} {'RSS MB':>7} {'busy %':>7} {'p95 cb ms':>10} {'max cb ms':>10} {'pending':>8}")
+    for s in results['samples']:
+        print(f"{s['time_s']:>8} {s['widgets']:>8} {s['other_widgets']:>6} {s['db_items']:>9} {s['tunnel_items']:>8} {s['rss_mb']:>7} {s['busy_percent']:>7} "
+              f"{s['callback_p95_ms']:>10} {s['callback_max_ms']:>10} {s['pending_events']:>8}")
+    print(f"\nTrends per hour: widgets (other than items) {results['widgets']['per_hour']:+}, RSS {results['rss_mb']['per_hour']:+} MB, "
+          f"busy {results['busy_percent_per_hour']:+}%")
+    for error in results['final_state_errors']:
+        print(f'ERROR: {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress tests the indicator with synthetic event streams.')
+    parser.add_argument('--duration', type=float, default=300, help='how long to send events for (seconds)')
+    parser.add_argument('--warmup', type=float, default=5, help='how long to run before sending events (seconds)')
+    parser.add_argument('--containers', type=int, default=200, help='the number of db containers to start with')
+    parser.add_argument('--releases', type=int, default=6, help='the number of MYG releases to switch between')
+    parser.add_argument('--flip-interval', type=float, default=3, help='seconds between branch switches (0 to disable)')
+    parser.add_argument('--churn-interval', type=float, default=1, help='seconds between containers being added/removed (0 to disable)')
+    parser.add_argument('--max-churn-containers', type=int, default=20, help='the most extra containers that exist at once')
+    parser.add_argument('--tunnel-interval', type=float, default=2, help='seconds between tunnels being opened/closed (0 to disable)')
+    parser.add_argument('--max-tunnels', type=int, default=20, help='the most tunnels that are open at once')
+    parser.add_argument('--task-latency', type=float, default=0.5, help='how long each fake geo command (e.g. db start) takes (seconds)')
+    parser.add_argument('--docker-latency', type=float, default=0, help='how long each fake docker call takes (seconds)')
+    parser.add_argument('--sample-interval', type=float, default=10, help='seconds between samples of the widget counts, RSS and main loop time')
+    parser.add_argument('--seed', type=int, default=1, help='the seed for the random events')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if any runs were dropped/duplicated, the final state is wrong or widgets leak')
+    parser.add_argument('--max-widget-trend', type=float, default=MAX_WIDGET_TREND,
+                        help='with --check, the most that the widgets (other than items) can grow per hour')
+    parser.add_argument('--verbose', action='store_true', help='print the output of the indicator')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    widget_trend = results['widgets']['per_hour']
+    if widget_trend > args.max_widget_trend:
+        print(f'ERROR: the widgets (other than items) grew by {widget_trend:+} per hour, more than {args.max_widget_trend:g}')
+    failed = (results['auto_switch']['dropped'] or results['auto_switch']['duplicated'] or results['final_state_errors']
+              or widget_trend > args.max_widget_trend)
+    sys.stdout.flush()
+    # The background threads (e.g. the docker events stream) would keep the process alive.
+    os._exit(1 if args.check and failed else 0)
+
+
+if __name__ == '__main__':
+    main()
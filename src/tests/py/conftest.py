@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The tests import the indicator's python modules (src/py) directly.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PY_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', '..', 'py'))
+# The bench's stubbed gi package, so that the tests don't need GTK or a display (e.g. on a CI box).
+GI_STUB_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', 'indicator', 'bench'))
+sys.path.insert(0, PY_DIR)
+sys.path.insert(0, GI_STUB_DIR)
+# The modules keep their data under ~/.geo-cli, so keep the tests out of the real one.
+os.environ['HOME'] = tempfile.mkdtemp(prefix='geo-cli-tests-')
@@ -0,0 +1,84 @@
+import os
+import subprocess
+
+import pytest
+
+from common.api_server import ApiServer
+
+GEO_CLI_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'geo-cli.sh'))
+
+# Runs geo-cli.sh's own api server loop (and response framing) with a fake geo command, without sourcing the rest of
+# geo-cli.
+FAKE_SERVER = r'''
+eval "$(sed -n '/^geo-cli::api_server() {/,/^}/p; /^geo-cli::api_server_respond() {/,/^}/p' "$GEO_CLI_PATH")"
+geo() {
+    [[ $1 == --api ]] && shift
+    case $1 in
+        lines) printf 'line 1\nline 2 é ✓\n\n' ;;
+        err) echo 'warning: ✗' >&2; printf 'partial'; return 3 ;;
+        empty) ;;
+        args) shift; printf '%s|' "$@" ;;
+        exit) exit 7 ;;
+        sleep) sleep "$2"; echo slept ;;
+    esac
+}
+geo-cli::api_server
+'''
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    script = tmp_path / 'fake-geo-cli.sh'
+    script.write_text(FAKE_SERVER)
+    monkeypatch.setenv('GEO_CLI_PATH', GEO_CLI_PATH)
+    server = ApiServer(str(script))
+    yield server
+    server.stop()
+
+
+def test_output_is_framed_by_byte_count(server):
+    # Multi-byte characters and trailing new lines are kept.
+    assert server.run('lines') == ('line 1\nline 2 é ✓\n\n', '', 0)
+    assert server.run('err') == ('partial', 'warning: ✗\n', 3)
+    assert server.run('empty') == ('', '', 0)
+    assert server.run('args "a b" c') == ('a b|c|', '', 0)
+
+
+def test_requests_reuse_the_server(server):
+    server.run('empty')
+    pid = server.process.pid
+    for _ in range(20):
+        assert server.run('lines')[0].startswith('line 1')
+    assert server.process.pid == pid
+
+
+def test_commands_cant_exit_the_server(server):
+    assert server.run('exit') == ('', '', 7)
+    pid = server.process.pid
+    assert server.run('empty') == ('', '', 0)
+    assert server.process.pid == pid
+
+
+def test_multi_line_requests_are_rejected(server):
+    assert server.run('lines\nexit') is None
+
+
+def test_timeout_kills_the_server(server):
+    with pytest.raises(subprocess.TimeoutExpired):
+        server.run('sleep 5', timeout=0.5)
+    assert server.process is None
+    # The next request starts a new server.
+    assert server.run('sleep 0') == ('slept\n', '', 0)
+
+
+def test_sourced_env_files_are_watched(server):
+    env_dir = os.path.join(os.environ['HOME'], '.geo-cli', 'env')
+    os.makedirs(env_dir, exist_ok=True)
+    server.run('empty')
+    server.last_watched_files_check = 0
+    assert not server.watched_files_changed()
+    # A new env file is sourced by geo-cli.sh, so the server has to be restarted to pick it up.
+    with open(os.path.join(env_dir, 'vars.sh'), 'w') as f:
+        f.write('export MY_VAR=1\n')
+    server.last_watched_files_check = 0
+    assert server.watched_files_changed()
@@ -0,0 +1,196 @@
+import itertools
+import random
+
+# The menus import geo_indicator (which imports the menus), so the package has to be imported first.
+import indicator.menus
+from indicator.menus.components import MenuReconciler, longest_increasing_subsequence
+
+
+class FakeItem:
+    def __init__(self, key):
+        self.key = key
+        self.destroyed = False
+
+    def show(self):
+        pass
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class FakeMenu:
+    """Records the operations that the reconciler does on the menu."""
+    def __init__(self, children=()):
+        self.children = list(children)
+        self.operations = []
+
+    def insert(self, item, position):
+        self.operations.append('insert')
+        self.children.insert(position, item)
+
+    def remove(self, item):
+        self.operations.append('remove')
+        self.children.remove(item)
+
+    def reorder_child(self, item, position):
+        self.operations.append('reorder')
+        self.children.remove(item)
+        self.children.insert(position, item)
+
+    def get_keys(self):
+        return [getattr(item, 'key', item) for item in self.children]
+
+
+def is_increasing_subsequence(values, indexes):
+    return all(i < j and values[i] < values[j] for (i, j) in zip(indexes, indexes[1:]))
+
+
+def test_longest_increasing_subsequence():
+    assert longest_increasing_subsequence([]) == []
+    assert longest_increasing_subsequence([5]) == [0]
+    assert longest_increasing_subsequence([3, 2, 1]) in ([0], [1], [2])
+    values = [0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15]
+    indexes = longest_increasing_subsequence(values)
+    assert len(indexes) == 6
+    assert is_increasing_subsequence(values, indexes)
+
+
+def test_longest_increasing_subsequence_matches_brute_force():
+    rng = random.Random(1)
+    for _ in range(200):
+        values = rng.sample(range(20), rng.randint(0, 9))
+        longest = max((len(c) for n in range(len(values) + 1) for c in itertools.combinations(range(len(values)), n)
+                       if is_increasing_subsequence(values, c)), default=0)
+        indexes = longest_increasing_subsequence(values)
+        assert len(indexes) == longest
+        assert is_increasing_subsequence(values, indexes)
+
+
+def make_reconciler(keys, offset=0):
+    menu = FakeMenu(['header'] * offset)
+    reconciler = MenuReconciler(menu, FakeItem, offset=offset)
+    reconciler.reconcile(keys)
+    menu.operations.clear()
+    return (menu, reconciler)
+
+
+def test_reconcile_reuses_items_and_keeps_the_order():
+    (menu, reconciler) = make_reconciler(['a', 'b', 'c'], offset=1)
+    items = dict(reconciler.items)
+    reconciler.reconcile(['c', 'a', 'd', 'b'])
+    assert menu.get_keys() == ['header', 'c', 'a', 'd', 'b']
+    assert all(reconciler.items[key] is items[key] for key in 'abc')
+    # a and b stay where they are; only c is moved and d is added.
+    assert menu.operations == ['remove', 'insert', 'insert']
+
+
+def test_reconcile_removes_and_destroys_items():
+    (menu, reconciler) = make_reconciler(['a', 'b', 'c'])
+    b = reconciler.items['b']
+    reconciler.reconcile(['a', 'c', 'a'])
+    assert menu.get_keys() == ['a', 'c']
+    assert b.destroyed
+    assert menu.operations == ['remove']
+
+
+def test_reconcile_unchanged_keys_does_nothing():
+    (menu, reconciler) = make_reconciler(['a', 'b', 'c'])
+    reconciler.reconcile(['a', 'b', 'c'])
+    assert menu.operations == []
+
+
+def test_reconcile_random_orders():
+    rng = random.Random(2)
+    (menu, reconciler) = make_reconciler([], offset=2)
+    for _ in range(100):
+        keys = rng.sample(range(15), rng.randint(0, 15))
+        reconciler.reconcile(keys)
+        assert menu.get_keys() == ['header', 'header'] + keys
+
+
+def test_reverse():
+    (menu, reconciler) = make_reconciler(['a', 'b', 'c'])
+    reconciler.reverse()
+    assert menu.get_keys() == ['c', 'b', 'a']
+    assert menu.operations == ['reorder'] * 3
+    reconciler.reconcile(['c', 'b', 'a', 'd'])
+    assert menu.operations[3:] == ['insert']
+
+
+class FakeApp:
+    def __init__(self, status):
+        self.status = status
+        self.state = {}
+
+    def set_state(self, key, value):
+        self.state[key] = value
+
+    def get_state(self, key, default=None):
+        return self.state.get(key, default)
+
+
+def test_lazily_built_check_item_saves_the_first_toggle():
+    from common import geo
+    from core.status import StatusPoller
+    from indicator.menus.components import LazyMenu
+    from indicator.menus.settings import ShowNotificationsMenuItem
+
+    geo.set_config('SHOW_NOTIFICATIONS', 'false')
+    status = StatusPoller()
+    status.publish({})
+    app = FakeApp(status)
+    # Like the settings menu: the item is only built (and subscribes) after the status has been published.
+    items = []
+    menu = LazyMenu(lambda menu: items.append(ShowNotificationsMenuItem(app)))
+    menu.ensure_built()
+    item = items[0]
+    assert not item.get_active()
+    assert app.state['show-notification'] is False
+    # The user checks it.
+    item.set_active(True)
+    assert geo.get_config('SHOW_NOTIFICATIONS') == 'true'
+    assert app.state['show-notification'] is True
+    item.set_active(False)
+    assert geo.get_config('SHOW_NOTIFICATIONS') == 'false'
+
+
+def test_check_item_follows_config_changes_without_writing_them_back():
+    from common import geo
+    from core.status import StatusPoller
+    from indicator.menus.settings import ShowNotificationsMenuItem
+
+    geo.set_config('SHOW_NOTIFICATIONS', 'true')
+    status = StatusPoller()
+    status.publish({'config_version': 1})
+    app = FakeApp(status)
+    item = ShowNotificationsMenuItem(app)
+    assert item.get_active()
+    # The config is changed elsewhere (e.g. by 'geo set').
+    geo.set_config('SHOW_NOTIFICATIONS', 'false')
+    status.publish({'config_version': 2})
+    assert not item.get_active()
+    assert app.state['show-notification'] is False
+    # The next click is still saved.
+    item.set_active(True)
+    assert geo.get_config('SHOW_NOTIFICATIONS') == 'true'
+
+
+def test_diagnostics_only_refresh_while_the_menu_is_open():
+    from gi.repository import GLib
+    from indicator.menus.diagnostics import DiagnosticsMenuItem
+
+    item = DiagnosticsMenuItem(FakeApp(None))
+    submenu = item.get_submenu()
+    assert item.refresh_timer is None
+    # Opening the menu builds it and refreshes it right away.
+    submenu.show()
+    assert submenu.built
+    assert item.item_summary.get_label().endswith('min')
+    timer = item.refresh_timer
+    assert timer is not None
+    submenu.hide()
+    assert item.refresh_timer is None
+    assert timer in GLib._removed
+    submenu.show()
+    assert item.refresh_timer not in (None, timer)
+    submenu.hide()
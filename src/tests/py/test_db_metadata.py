@@ -0,0 +1,71 @@
+from common.db_metadata import DbMetadataTable, parse_volume_sizes
+
+# Captured from 'docker system df -v --format "{{json .}}"' (docker 24), trimmed to a few entries.
+SYSTEM_DF_OUTPUT = (
+    '{"BuildCache":[],"Containers":[{"Command":"\\"docker-entrypoint.s…\\"","CreatedAt":"2024-03-05 10:12:44 -0800 PST",'
+    '"ID":"1f0c9a3b2d4e","Image":"geo_cli_db_postgres_12","Labels":"","LocalVolumes":"1","Mounts":"geo_cli_db_post…",'
+    '"Names":"geo_cli_db_postgres_11_0","Networks":"bridge","Ports":"","RunningFor":"2 weeks ago","Size":"63B",'
+    '"State":"exited","Status":"Exited (0) 3 days ago"}],'
+    '"Images":[{"Containers":"1","CreatedAt":"2024-02-20 09:01:02 -0800 PST","CreatedSince":"2 weeks ago","Digest":"",'
+    '"ID":"5e7b8c9d0a1f","Repository":"geo_cli_db_postgres_12","SharedSize":"0B","Size":"412MB","Tag":"latest",'
+    '"UniqueSize":"412MB","VirtualSize":"412MB"}],'
+    '"Volumes":[{"Availability":"N/A","Driver":"local","Group":"N/A","Labels":"","Links":"1",'
+    '"Mountpoint":"/var/lib/docker/volumes/geo_cli_db_postgres_11_0/_data","Name":"geo_cli_db_postgres_11_0",'
+    '"Scope":"local","Size":"1.234GB","Status":"N/A"},'
+    '{"Availability":"N/A","Driver":"local","Group":"N/A","Labels":"","Links":"0",'
+    '"Mountpoint":"/var/lib/docker/volumes/geo_cli_db_postgres_10_0/_data","Name":"geo_cli_db_postgres_10_0",'
+    '"Scope":"local","Size":"512.5MB","Status":"N/A"},'
+    '{"Availability":"N/A","Driver":"local","Group":"N/A","Labels":"","Links":"0",'
+    '"Mountpoint":"/var/lib/docker/volumes/empty/_data","Name":"empty","Scope":"local","Size":"0B","Status":"N/A"},'
+    '{"Availability":"N/A","Driver":"local","Group":"N/A","Labels":"","Links":"1",'
+    '"Mountpoint":"/var/lib/docker/volumes/busy/_data","Name":"busy","Scope":"local","Size":"N/A","Status":"N/A"}]}\n')
+
+
+def test_parse_volume_sizes():
+    assert parse_volume_sizes(SYSTEM_DF_OUTPUT) == {
+        'geo_cli_db_postgres_11_0': 1234000000,
+        'geo_cli_db_postgres_10_0': 512500000,
+        'empty': 0,
+    }
+
+
+def test_parse_volume_sizes_without_volumes():
+    assert parse_volume_sizes('') == {}
+    assert parse_volume_sizes('{"Images":[],"Containers":[],"Volumes":null,"BuildCache":[]}') == {}
+
+
+def make_container(name):
+    return {'Id': name, 'Name': '/geo_cli_db_postgres_' + name, 'Created': '2024-01-02T03:04:05Z',
+            'State': {'Status': 'exited', 'StartedAt': '0001-01-01T00:00:00Z'},
+            'Mounts': [{'Type': 'volume', 'Name': 'geo_cli_db_postgres_' + name, 'Source': '/v/' + name}]}
+
+
+def test_added_dbs_only_reload_volume_sizes_once_per_interval(monkeypatch):
+    containers = [make_container('a')]
+    size_loads = []
+
+    def get_volume_sizes():
+        size_loads.append(len(containers))
+        return {'geo_cli_db_postgres_' + c['Id']: 100 for c in containers}
+
+    now = [1000.0]
+    monkeypatch.setattr('common.db_metadata.time.monotonic', lambda: now[0])
+    table = DbMetadataTable(lambda prev: list(containers), get_volume_sizes, min_volume_sizes_interval=30)
+    table.refresh()
+    assert size_loads == [1]
+    # Dbs added right after the sizes were loaded don't reload them straight away...
+    for name in ('b', 'c'):
+        now[0] += 1
+        containers.append(make_container(name))
+        table.invalidate()
+        table.refresh()
+    assert size_loads == [1]
+    assert table.get('c').size is None
+    # ...they're loaded together once the interval has passed.
+    now[0] += 30
+    table.refresh()
+    assert size_loads == [1, 3]
+    assert table.get('c').size == 100
+    now[0] += 1
+    table.refresh()
+    assert size_loads == [1, 3]
@@ -0,0 +1,42 @@
+import json
+
+from common.db_prefetch import ReleaseHistory
+
+
+def make_history(tmp_path, releases):
+    path = tmp_path / 'history.json'
+    path.write_text(json.dumps(releases))
+    return ReleaseHistory(str(path))
+
+
+def test_predict_next_prefers_the_most_common_next_release(tmp_path):
+    history = make_history(tmp_path, ['10.0', '11.0', '10.0', '12.0', '10.0', '11.0', '9.0', '10.0'])
+    assert history.predict_next('10.0') == ['11.0', '12.0', '9.0']
+
+
+def test_predict_next_breaks_ties_by_recency(tmp_path):
+    history = make_history(tmp_path, ['10.0', '11.0', '10.0', '12.0', '10.0'])
+    assert history.predict_next('10.0')[:2] == ['12.0', '11.0']
+
+
+def test_predict_next_falls_back_to_recent_releases(tmp_path):
+    history = make_history(tmp_path, ['8.0', '9.0', '11.0', '12.0'])
+    # 13.0 was never checked out, so the most recent releases come first.
+    assert history.predict_next('13.0') == ['12.0', '11.0', '9.0', '8.0']
+    assert history.predict_next('12.0') == ['11.0', '9.0', '8.0']
+
+
+def test_predict_next_without_history(tmp_path):
+    history = ReleaseHistory(str(tmp_path / 'missing.json'))
+    assert history.predict_next('10.0') == []
+
+
+def test_record_skips_repeats_and_is_bounded(tmp_path):
+    path = tmp_path / 'history.json'
+    history = ReleaseHistory(str(path), max_length=3)
+    for release in ('1', '1', '2', '', '3', '4'):
+        history.record(release)
+    assert history.get_releases() == ['2', '3', '4']
+    assert json.loads(path.read_text()) == ['2', '3', '4']
+    # A new instance reads the saved history.
+    assert ReleaseHistory(str(path)).predict_next('3') == ['4', '2']
@@ -0,0 +1,183 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from common.git_tags import CommitGraph, TagResolver, WalkError, read_packed_refs
+
+requires_git = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+PACKED_REFS = '''# pack-refs with: peeled fully-peeled sorted 
+1111111111111111111111111111111111111111 refs/heads/main
+2222222222222222222222222222222222222222 refs/tags/MYG/10.0.1
+^3333333333333333333333333333333333333333
+4444444444444444444444444444444444444444 refs/tags/MYG/9.0.5
+5555555555555555555555555555555555555555 refs/tags/other
+'''
+
+
+def test_read_packed_refs(tmp_path):
+    (tmp_path / 'packed-refs').write_text(PACKED_REFS)
+    (refs, fully_peeled) = read_packed_refs(str(tmp_path))
+    assert fully_peeled
+    assert refs == [
+        ('refs/heads/main', '1' * 40, None),
+        ('refs/tags/MYG/10.0.1', '2' * 40, '3' * 40),
+        ('refs/tags/MYG/9.0.5', '4' * 40, None),
+        ('refs/tags/other', '5' * 40, None),
+    ]
+
+
+def test_read_packed_refs_without_peeled_header(tmp_path):
+    (tmp_path / 'packed-refs').write_text('# pack-refs with: sorted\n' + '1' * 40 + ' refs/tags/MYG/1.0\n')
+    assert read_packed_refs(str(tmp_path)) == ([('refs/tags/MYG/1.0', '1' * 40, None)], False)
+    assert read_packed_refs(str(tmp_path / 'missing')) == ([], False)
+
+
+class Repo:
+    def __init__(self, path):
+        self.path = str(path)
+        # Each commit is a minute newer than the last, since git describe walks the newest commits first.
+        self.date = 1700000000
+        self.git('init', '-q')
+        self.git_dir = os.path.join(self.path, '.git')
+
+    def git(self, *args):
+        env = dict(os.environ, GIT_AUTHOR_DATE=f'{self.date} +0000', GIT_COMMITTER_DATE=f'{self.date} +0000')
+        return subprocess.run(['git', '-C', self.path, '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                               '-c', 'commit.gpgsign=false', '-c', 'tag.gpgsign=false', *args],
+                              check=True, capture_output=True, text=True, env=env).stdout.strip()
+
+    def commit(self, message, *parents):
+        """Creates a commit with the given parents (the current HEAD if there are none) and checks it out."""
+        self.date += 60
+        if parents:
+            tree = self.git('write-tree')
+            args = [arg for parent in parents for arg in ('-p', parent)]
+            sha = self.git('commit-tree', tree, '-m', message, *args)
+            self.git('reset', '-q', sha)
+            return sha
+        self.git('commit', '-q', '--allow-empty', '-m', message)
+        return self.git('rev-parse', 'HEAD')
+
+    def get_parents(self):
+        """Returns a dict of every commit to its parents, from git itself."""
+        parents = {}
+        for line in self.git('rev-list', '--parents', '--all').splitlines():
+            (sha, *rest) = line.split()
+            parents[sha] = rest
+        return parents
+
+
+def check_graph(repo):
+    with CommitGraph(repo.git_dir) as graph:
+        for (sha, parents) in repo.get_parents().items():
+            position = graph.find(sha)
+            assert position >= 0
+            assert graph.get_sha(position) == sha
+            assert [graph.get_sha(p) for p in graph.get_parents(position)] == parents
+        assert graph.find('0' * 40) == -1
+
+
+@requires_git
+def test_commit_graph_parents(tmp_path):
+    repo = Repo(tmp_path)
+    root = repo.commit('root')
+    branches = [repo.commit(f'branch {i}', root) for i in range(3)]
+    # An octopus merge (more than 2 parents) uses the extra edges chunk.
+    repo.commit('octopus', *branches)
+    repo.commit('merge', branches[0], branches[1])
+    repo.git('commit-graph', 'write', '--reachable')
+    check_graph(repo)
+
+
+@requires_git
+def test_split_commit_graph(tmp_path):
+    repo = Repo(tmp_path)
+    for i in range(3):
+        repo.commit(f'commit {i}')
+    repo.git('commit-graph', 'write', '--reachable', '--split')
+    repo.commit('merge', repo.commit('side', repo.git('rev-parse', 'HEAD~1')), repo.git('rev-parse', 'HEAD~1'))
+    repo.git('commit-graph', 'write', '--reachable', '--split=no-merge')
+    assert os.path.exists(os.path.join(repo.git_dir, 'objects', 'info', 'commit-graphs', 'commit-graph-chain'))
+    with CommitGraph(repo.git_dir) as graph:
+        assert len(graph.layers) == 2
+    check_graph(repo)
+
+
+@requires_git
+def test_find_tag(tmp_path):
+    repo = Repo(tmp_path)
+    repo.commit('release')
+    repo.git('tag', 'MYG/9.0.1')
+    repo.git('tag', '-a', 'MYG/10.0.1', '-m', 'annotated')
+    repo.git('tag', 'unrelated')
+    repo.git('commit-graph', 'write', '--reachable')
+    # Commits newer than the commit-graph are read from their loose objects.
+    repo.commit('after the graph')
+    repo.commit('after the graph 2')
+    resolver = TagResolver(str(tmp_path / 'cache.json'))
+    # MYG/10.0.1 is a higher version than MYG/9.0.1, even though it sorts first as a string.
+    assert resolver.find_tag(repo.git_dir, repo.git_dir) == 'MYG/10.0.1'
+    # The result is cached per commit.
+    assert (tmp_path / 'cache.json').exists()
+    assert TagResolver(str(tmp_path / 'cache.json')).find_tag(repo.git_dir, repo.git_dir) == 'MYG/10.0.1'
+
+
+@requires_git
+def test_find_tag_with_packed_refs_and_objects(tmp_path):
+    repo = Repo(tmp_path)
+    repo.commit('old release')
+    repo.git('tag', 'MYG/11.0.1')
+    repo.commit('release')
+    repo.git('tag', '-a', 'MYG/11.0.2', '-m', 'annotated')
+    repo.commit('work')
+    repo.git('pack-refs', '--all')
+    repo.git('gc', '-q')
+    repo.git('commit-graph', 'write', '--reachable')
+    assert TagResolver(str(tmp_path / 'cache.json')).find_tag(repo.git_dir, repo.git_dir) == 'MYG/11.0.2'
+
+
+@requires_git
+def test_find_tag_without_a_commit_graph(tmp_path):
+    repo = Repo(tmp_path)
+    repo.commit('release')
+    repo.git('tag', 'MYG/11.0.1')
+    repo.commit('work')
+    assert TagResolver(str(tmp_path / 'cache.json')).find_tag(repo.git_dir, repo.git_dir) == 'MYG/11.0.1'
+    # Packed commits that aren't in a commit-graph can't be read natively; the caller falls back to git describe.
+    repo.git('-c', 'gc.writeCommitGraph=false', 'gc', '-q')
+    (tmp_path / 'cache.json').unlink()
+    with pytest.raises(WalkError):
+        TagResolver(str(tmp_path / 'cache.json')).find_tag(repo.git_dir, repo.git_dir)
+
+
+def build_merged_release(repo, merge_order):
+    root = repo.commit('root')
+    release = repo.commit('release 10.0.9', root)
+    repo.git('tag', 'MYG/10.0.9')
+    release = repo.commit('release fix', release)
+    main = root
+    for i in range(10):
+        main = repo.commit(f'main {i}', main)
+    repo.git('tag', '-a', 'MYG/11.0.1', '-m', 'annotated')
+    for i in range(3):
+        main = repo.commit(f'branch {i}', main)
+    parents = {'main': main, 'release': release}
+    repo.commit('merge', *(parents[name] for name in merge_order))
+
+
+@requires_git
+@pytest.mark.parametrize('merge_order', [('main', 'release'), ('release', 'main')])
+@pytest.mark.parametrize('with_graph', [True, False])
+def test_find_tag_matches_git_describe_across_merges(tmp_path, merge_order, with_graph):
+    repo = Repo(tmp_path)
+    build_merged_release(repo, merge_order)
+    if with_graph:
+        repo.git('commit-graph', 'write', '--reachable')
+    # MYG/10.0.9 is the fewest hops away (through the merged release branch), but git describe picks MYG/11.0.1,
+    # since far fewer of the commits are unreachable from it.
+    expected = repo.git('describe', '--tags', '--abbrev=0', '--match', 'MYG*')
+    assert expected == 'MYG/11.0.1'
+    assert TagResolver(str(tmp_path / 'cache.json')).find_tag(repo.git_dir, repo.git_dir) == expected
@@ -0,0 +1,42 @@
+import pytest
+
+from common.metrics import CommandMetrics, get_command_key
+
+
+@pytest.mark.parametrize(('arg_str', 'key'), [
+    ('db start 10_0 -y', 'db start'),
+    ('db ls --running', 'db ls'),
+    ('dev auto-switch 11.0.1 11.0.2', 'dev auto-switch'),
+    ('get DB_FOR_RELEASE_11_0', 'get'),
+    ('set-config AUTO_SWITCH_DB true', 'set-config'),
+    ('version', 'version'),
+    ('  db   stop  ', 'db stop'),
+    ('docker container ls --filter name="geo_cli_db_" -a', 'docker container'),
+    ('ar tunnel --prompt', 'ar tunnel'),
+    ('init 2>&1', 'init'),
+    ('', ''),
+])
+def test_get_command_key(arg_str, key):
+    assert get_command_key(arg_str) == key
+
+
+def test_commands_are_grouped_by_key():
+    metrics = CommandMetrics()
+    metrics.record('geo', 'db start 10_0', 0.2, 0)
+    metrics.record('geo', 'db start 11_0', 0.4, 1)
+    metrics.record('geo', 'db ls', 0.1, 0, timed_out=True)
+    metrics.record_key('docker', 'GET /containers/{name}/json', 0.01, 200)
+    commands = {(c['source'], c['command']): c for c in metrics.get_summary()['commands']}
+    assert set(commands) == {('geo', 'db start'), ('geo', 'db ls'), ('docker', 'GET /containers/{name}/json')}
+    db_start = commands[('geo', 'db start')]
+    assert db_start['count'] == 2
+    assert db_start['exit_codes'] == {'0': 1, '1': 1}
+    assert db_start['max_ms'] == 400
+    assert commands[('geo', 'db ls')]['timeouts'] == 1
+
+
+def test_least_recently_run_commands_are_dropped():
+    metrics = CommandMetrics(max_commands=2)
+    for arg_str in ('a', 'b', 'a', 'c'):
+        metrics.record('geo', arg_str, 0.1)
+    assert {c['command'] for c in metrics.get_summary()['commands']} == {'a', 'c'}
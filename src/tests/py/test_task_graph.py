@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from common.task_graph import TaskGraph, order_tasks
+
+DEPENDENCIES = {
+    'npm install': [],
+    'server.config': [],
+    'GeotabDemo Data': [],
+    'DB': ['server.config', 'GeotabDemo Data'],
+}
+
+
+def test_order_tasks():
+    ordered = order_tasks(list(DEPENDENCIES), DEPENDENCIES.get)
+    assert sorted(ordered) == sorted(DEPENDENCIES)
+    assert ordered.index('DB') > ordered.index('server.config')
+    assert ordered.index('DB') > ordered.index('GeotabDemo Data')
+
+
+def test_order_tasks_keeps_the_given_order_of_independent_tasks():
+    assert order_tasks(['c', 'b', 'a'], lambda task: []) == ['c', 'b', 'a']
+    assert order_tasks(['c', 'b', 'a'], lambda task: ['a'] if task == 'c' else []) == ['b', 'a', 'c']
+
+
+def test_order_tasks_ignores_missing_and_self_dependencies():
+    assert order_tasks(['a', 'b'], lambda task: ['a', 'missing'] if task == 'b' else ['a']) == ['a', 'b']
+
+
+def test_order_tasks_rejects_cycles():
+    with pytest.raises(ValueError):
+        order_tasks(['a', 'b', 'c'], {'a': ['c'], 'b': ['a'], 'c': ['b']}.get)
+
+
+def test_run_starts_tasks_once_their_dependencies_are_done():
+    lock = threading.Lock()
+    events = []
+    running = set()
+    max_running = [0]
+
+    def run_task(task):
+        with lock:
+            events.append(('start', task))
+            running.add(task)
+            max_running[0] = max(max_running[0], len(running))
+        time.sleep(0.05)
+        with lock:
+            running.discard(task)
+            events.append(('end', task))
+        return task.upper()
+
+    done = []
+    results = TaskGraph().run(DEPENDENCIES, DEPENDENCIES.get, run_task, lambda task, result: done.append(task))
+    assert {task: result.result for (task, result) in results.items()} == {task: task.upper() for task in DEPENDENCIES}
+    assert sorted(done) == sorted(DEPENDENCIES)
+    # The independent tasks run at the same time.
+    assert max_running[0] == 3
+    db_start = events.index(('start', 'DB'))
+    assert events.index(('end', 'server.config')) < db_start
+    assert events.index(('end', 'GeotabDemo Data')) < db_start
+
+
+def test_run_records_errors_and_still_runs_dependents():
+    def run_task(task):
+        if task == 'server.config':
+            raise RuntimeError('failed')
+        return 'Done'
+
+    results = TaskGraph().run(DEPENDENCIES, DEPENDENCIES.get, run_task)
+    assert isinstance(results['server.config'].error, RuntimeError)
+    assert results['server.config'].result is None
+    assert results['DB'].result == 'Done'
+    assert all(result.duration >= 0 for result in results.values())
+
+
+def test_run_checks_for_cycles_before_running_anything():
+    ran = []
+    with pytest.raises(ValueError):
+        TaskGraph().run(['a', 'b'], {'a': ['b'], 'b': ['a']}.get, ran.append)
+    assert ran == []
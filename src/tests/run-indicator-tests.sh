@@ -0,0 +1,18 @@
+#!/bin/bash
+# Runs the indicator's python tests and a short run of its benchmark and stress harnesses. None of them need GTK, docker
+# or a display (they use the stubbed gi package and fake docker/geo commands in indicator/bench), so this can be run
+# on a plain Linux CI box with python3, pytest and git installed.
+# Usage: src/tests/run-indicator-tests.sh
+set -e
+tests_dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+echo '=== Unit tests ==='
+python3 -m pytest -q "$tests_dir/py"
+
+echo '=== Benchmark (smoke run) ==='
+python3 "$tests_dir/indicator/bench/bench.py" --containers 5 --duration 5 --warmup 1
+python3 "$tests_dir/indicator/bench/bench.py" --containers 5 --duration 5 --warmup 1 --headless
+
+echo '=== Stress test ==='
+# Fails on dropped or duplicated auto-switch runs, a wrong final state or a growing widget count.
+python3 "$tests_dir/indicator/bench/stress.py" --check --duration 30